@@ -0,0 +1,153 @@
+"""
+ChatSplitterAgent 离线压测：生成合成聊天记录，用 FakeChatModel 代替真实模型运行完整流程，
+统计分块数、字节数、总耗时、各环节的 LLM 调用数、峰值内存与各节点耗时，结果保存为 JSON。
+
+用法（在仓库根目录执行）:
+    python -m benchmarks.bench_chat_splitter --sizes 1000 10000 100000 --latency 0.05 --error-rate 0.01
+    python -m benchmarks.compare benchmarks/results/旧结果.json benchmarks/results/新结果.json
+"""
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from os import path, makedirs
+from typing import Any, Dict, List
+
+from benchmarks.fake_chat_model import FakeChatModel
+from benchmarks.synthetic_export import generate_chat_export
+from webot.agent.chat_splitter_agent import ChatSplitterAgent
+
+RESULTS_PATH = path.join(path.dirname(path.abspath(__file__)), 'results')
+
+_NODE_METHODS = {
+    "understand_query": "_understand_query_node",
+    "noise_filter": "_noise_filter_node",
+    "chunker": "_chunk_node",
+    "extract_info": "_extract_info_node",
+    "synthesize_answer": "_synthesize_answer_node",
+}
+
+
+class TimedChatSplitterAgent(ChatSplitterAgent):
+    """记录各图节点耗时的 ChatSplitterAgent，节点方法在构建图之前被包装。"""
+
+    def __init__(self, *args, **kwargs):
+        self.node_seconds: Dict[str, float] = {}
+        for node, method_name in _NODE_METHODS.items():
+            if hasattr(self, method_name):
+                setattr(self, method_name, self._timed(node, getattr(self, method_name)))
+        super().__init__(*args, **kwargs)
+
+    def _timed(self, node: str, method):
+        def wrapper(state):
+            start = time.perf_counter()
+            try:
+                return method(state)
+            finally:
+                self.node_seconds[node] = self.node_seconds.get(node, 0.0) + time.perf_counter() - start
+        return wrapper
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=path.dirname(RESULTS_PATH), check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run_case(message_count: int, args) -> Dict[str, Any]:
+    """压测一个数据规模，返回该规模的统计。"""
+    chat_data = generate_chat_export(message_count, members=args.members, is_room=not args.private, seed=args.seed)
+    export_bytes = len(json.dumps(chat_data, ensure_ascii=False).encode('utf-8'))
+    llm = FakeChatModel(model_name=args.model_name, latency=args.latency, latency_jitter=args.latency_jitter,
+                        error_rate=args.error_rate, seed=args.seed)
+    agent = TimedChatSplitterAgent(
+        llm_query_understanding=llm,
+        llm_triage=llm if args.triage else None,
+        rpm_limit=0,
+        max_concurrency=args.concurrency,
+        extraction_cache=False,
+        compact_rendering=args.compact,
+        noise_filter=args.noise_filter,
+        relevance_threshold=args.relevance_threshold,
+        triage_rpm_limit=0,
+    )
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    final_state = agent.run(chat_data, "这段时间群里的聚餐和项目安排有哪些？")
+    wall_seconds = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    calls = llm.call_stats()
+    chunk_stats = final_state.get('chunk_stats') or {}
+    return {
+        "messages": message_count,
+        "export_bytes": export_bytes,
+        "chunks": len(final_state.get('message_chunks') or []),
+        "payload_bytes": chunk_stats.get('payload_bytes'),
+        "chunk_stats": chunk_stats,
+        "noise_filter_stats": final_state.get('noise_filter_stats'),
+        "wall_seconds": round(wall_seconds, 3),
+        "llm_calls": sum(item["calls"] for item in calls.values()),
+        "llm_errors": sum(item["errors"] for item in calls.values()),
+        "llm_input_bytes": sum(item["input_bytes"] for item in calls.values()),
+        "llm_calls_by_kind": calls,
+        "fusion_levels": len(final_state.get('fusion_levels') or []),
+        "peak_memory_bytes": peak_memory,
+        "node_seconds": {node: round(seconds, 3) for node, seconds in agent.node_seconds.items()},
+        "error_message": final_state.get('error_message'),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = ArgumentParser(description="ChatSplitterAgent 离线压测")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="消息条数")
+    parser.add_argument("--latency", type=float, default=0.05, help="假模型每次调用的固定延迟（秒）")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="叠加的随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="假模型每次调用失败的概率")
+    parser.add_argument("--concurrency", type=int, default=4, help="分块提取的并发数")
+    parser.add_argument("--members", type=int, default=30, help="群聊人数")
+    parser.add_argument("--private", action="store_true", help="生成私聊记录")
+    parser.add_argument("--model-name", default="fake-chat",
+                        help="假模型的名称，使用 MODEL_CONTEXT_LIMITS 中的名称可以压测按 Token 分块")
+    parser.add_argument("--compact", action="store_true", help="开启紧凑渲染")
+    parser.add_argument("--noise-filter", action="store_true", help="开启噪声过滤")
+    parser.add_argument("--triage", action="store_true", help="开启初筛（初筛与提取使用同一个假模型）")
+    parser.add_argument("--relevance-threshold", type=float, default=None, help="相关性预筛选阈值")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", default=None, help="结果文件路径，默认保存到 benchmarks/results")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        print(f"\n===== 压测 {size} 条消息 =====")
+        result = run_case(size, args)
+        results.append(result)
+        print(f"===== {size} 条消息：{result['chunks']} 个块，{result['llm_calls']} 次调用，"
+              f"耗时 {result['wall_seconds']} 秒，峰值内存 {result['peak_memory_bytes'] / 1024 / 1024:.1f} MB =====")
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    output = args.output or path.join(RESULTS_PATH, f"chat_splitter_{datetime.now():%Y%m%d_%H%M%S}_{commit}.json")
+    makedirs(path.dirname(path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as fw:
+        fw.write(json.dumps(report, ensure_ascii=False, indent=4, default=str))
+    print(f"\n结果已保存到 {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
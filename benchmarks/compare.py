@@ -0,0 +1,48 @@
+"""
+比较两次压测的结果，按消息条数对齐，输出各指标的变化。
+
+用法:
+    python -m benchmarks.compare 基准结果.json 新结果.json
+"""
+import json
+from argparse import ArgumentParser
+
+METRICS = ["chunks", "payload_bytes", "wall_seconds", "llm_calls", "llm_input_bytes", "peak_memory_bytes"]
+
+
+def _load(file_path: str) -> dict:
+    with open(file_path, 'r', encoding='utf-8') as fr:
+        return json.load(fr)
+
+
+def _delta(before, after) -> str:
+    if not isinstance(before, (int, float)) or not isinstance(after, (int, float)):
+        return f"{before} -> {after}"
+    ratio = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+    return f"{before} -> {after} ({ratio})"
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="比较两次 ChatSplitterAgent 压测结果")
+    parser.add_argument("baseline", help="基准结果文件")
+    parser.add_argument("candidate", help="新结果文件")
+    args = parser.parse_args(argv)
+
+    baseline, candidate = _load(args.baseline), _load(args.candidate)
+    print(f"基准: {baseline.get('commit')} ({baseline.get('created_at')})")
+    print(f"对比: {candidate.get('commit')} ({candidate.get('created_at')})")
+    before_by_size = {result["messages"]: result for result in baseline.get("results", [])}
+    for after in candidate.get("results", []):
+        before = before_by_size.get(after["messages"])
+        if before is None:
+            continue
+        print(f"\n{after['messages']} 条消息:")
+        for metric in METRICS:
+            print(f"  {metric}: {_delta(before.get(metric), after.get(metric))}")
+        nodes = sorted(set(before.get("node_seconds", {})) | set(after.get("node_seconds", {})))
+        for node in nodes:
+            print(f"  node_seconds.{node}: {_delta(before['node_seconds'].get(node), after['node_seconds'].get(node))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+不访问网络的聊天模型，按提示词识别 ChatSplitterAgent 的各个环节并返回固定格式的结果，
+可以配置延迟与失败率，并统计各环节的调用次数与输入字节数。
+"""
+import json
+import random
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+# 按提示词中的特征文本识别调用所属的环节，顺序即匹配优先级
+_CALL_KINDS = [
+    ("understand", "chunk_processing_prompt"),
+    ("triage", "相关性初筛"),
+    ("fusion", "待融合的信息片段"),
+    ("extraction", "聊天记录片段"),
+]
+
+
+class FakeModelError(Exception):
+    """模拟的模型调用失败。"""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    压测用的假模型。查询理解环节不会注入失败，保证每次压测都能跑完整个流程。
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.0  # 每次调用的固定延迟（秒）
+    latency_jitter: float = 0.0  # 在固定延迟上叠加的 [0, latency_jitter) 随机延迟
+    error_rate: float = 0.0  # 每次调用失败的概率
+    triage_positive_rate: float = 0.5  # 初筛环节返回 YES 的概率
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _lock: Lock = PrivateAttr(default_factory=Lock)
+    _stats: Dict[str, Dict[str, int]] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @staticmethod
+    def _call_kind(text: str) -> str:
+        for kind, marker in _CALL_KINDS:
+            if marker in text:
+                return kind
+        return "synthesis"
+
+    @staticmethod
+    def _respond(kind: str, text: str, rng: random.Random) -> str:
+        if kind == "understand":
+            return json.dumps({
+                "intent": "总结群聊中的聚餐与项目安排",
+                "entities": {"topic": ["聚餐", "项目"]},
+                "chunk_processing_prompt": "提取与聚餐、项目进度有关的发言，保留发送人、时间与 msg_id。",
+            }, ensure_ascii=False)
+        # 取输入中间的一段作为“摘要”，长度与真实模型的输出量级接近
+        body = text[len(text) // 3:]
+        if kind == "extraction":
+            return f"片段要点：{body[:200]}"
+        if kind == "fusion":
+            return f"融合摘要：{body[:300]}"
+        return f"最终答案：{body[:500]}"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = "\n".join(str(message.content) for message in messages)
+        kind = self._call_kind(text)
+        with self._lock:
+            stats = self._stats.setdefault(kind, {"calls": 0, "errors": 0, "input_bytes": 0})
+            stats["calls"] += 1
+            stats["input_bytes"] += len(text.encode('utf-8'))
+            delay = self.latency + self._rng.random() * self.latency_jitter
+            failed = kind != "understand" and self._rng.random() < self.error_rate
+            if failed:
+                stats["errors"] += 1
+            if kind == "triage":
+                content = "YES" if self._rng.random() < self.triage_positive_rate else "NO"
+            else:
+                content = self._respond(kind, text, self._rng)
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise FakeModelError(f"模拟的 {kind} 调用失败")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def call_stats(self) -> Dict[str, Dict[str, int]]:
+        """各环节的调用次数、失败次数与输入字节数。"""
+        with self._lock:
+            return {kind: dict(stats) for kind, stats in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,125 @@
+"""
+生成与 `write_txt(file_type=None)` 结构一致的合成聊天记录，用于离线压测 ChatSplitterAgent。
+同一个 seed 生成的数据完全相同，不同提交之间的压测结果可以直接比较。
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+_SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高"
+_GIVEN_NAMES = ["伟", "芳", "娜", "敏", "静", "磊", "洋", "勇", "艳", "杰", "涛", "明", "超", "秀英", "海燕", "建国", "晓东"]
+
+_TOPICS = {
+    "聚餐": ["周五晚上去吃火锅吧", "那家烤肉店人太多了，要提前订位", "我可以晚点到，七点半左右", "AA 还是谁请客？",
+             "上次那家川菜不错，再去一次", "有人忌口吗，我来订菜"],
+    "项目": ["需求文档我已经更新到共享盘了", "接口联调推迟到下周二", "测试环境又挂了，谁在用？", "这个 bug 是上个版本引入的",
+             "评审会改到下午三点", "上线前还要补一轮回归测试"],
+    "旅行": ["五一去杭州还是苏州？", "高铁票已经抢到了", "酒店订在西湖边上，步行十分钟", "记得带身份证",
+             "天气预报说那几天有雨", "行程表我做了一份，大家看看"],
+    "游戏": ["今晚开黑吗", "新赛季的平衡性调整太离谱了", "我卡在第三关了，有攻略吗", "周末一起打排位",
+             "这个皮肤限时返场", "服务器又在维护"],
+    "日常": ["早上好", "今天好冷啊", "有人知道快递点几点关门吗", "楼下新开了一家奶茶店", "下班了下班了", "周末愉快"],
+}
+_SHORT_REPLIES = ["好的", "收到", "哈哈哈", "+1", "可以", "没问题", "我也是", "666", "？", "对对对"]
+_LINK_TITLES = ["十分钟看懂大模型推理优化", "2025 年最值得去的十个城市", "如何写出可维护的 Python 代码", "周末菜谱合集"]
+
+# 各类消息的出现权重，大致参照真实群聊中抽样的比例
+MESSAGE_KIND_WEIGHTS = {
+    "text": 55, "short": 15, "quote": 7, "sticker": 7, "image": 4, "pat": 3, "revoke": 2, "join": 1,
+    "link": 3, "red_packet": 1, "voice": 1, "video": 1,
+}
+
+
+def _names(rng: random.Random, count: int) -> List[Dict[str, str]]:
+    members = []
+    for i in range(count):
+        name = rng.choice(_SURNAMES) + rng.choice(_GIVEN_NAMES)
+        members.append({
+            "wxid": f"wxid_bench{i:04d}",
+            "sender": name,
+            "remark": f"{name}（同事）" if rng.random() < 0.3 else "",
+        })
+    return members
+
+
+def generate_chat_export(message_count: int, members: int = 30, is_room: bool = True, seed: int = 0,
+                         start_time: str = "2025-01-01 08:00:00") -> Dict[str, Any]:
+    """
+    生成合成聊天记录。
+    :param message_count: 消息条数
+    :param members: 参与聊天的人数，私聊时固定为 2
+    :param is_room: 是否为群聊，群聊消息会带有 mentioned 字段
+    :param seed: 随机种子
+    :param start_time: 第一条消息的时间
+    :return: {"meta": {...}, "data": [...]}
+    """
+    rng = random.Random(seed)
+    people = _names(rng, members if is_room else 2)
+    kinds, weights = zip(*MESSAGE_KIND_WEIGHTS.items())
+    current_time = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
+    topic = rng.choice(list(_TOPICS))
+    data: List[Dict[str, Any]] = []
+
+    for index in range(message_count):
+        # 聊天集中在白天，夜间有较长的间隔
+        current_time += timedelta(seconds=rng.randint(600, 7200) if current_time.hour >= 23 else rng.randint(3, 300))
+        if rng.random() < 0.05:
+            topic = rng.choice(list(_TOPICS))
+        person = rng.choice(people)
+        other = rng.choice(people)
+        kind = rng.choices(kinds, weights)[0]
+
+        if kind == "text":
+            content = rng.choice(_TOPICS[topic])
+            if rng.random() < 0.3:
+                content += "，" + rng.choice(_TOPICS[topic])
+        elif kind == "short":
+            content = rng.choice(_SHORT_REPLIES)
+        elif kind == "quote" and data:
+            quoted = rng.choice(data[-20:])
+            content = (f"[引用消息：{person['sender']} 回复 {quoted['sender']}]\n原始消息(部分): 「{quoted['content'][:20]}」\n"
+                       f"回复内容(完整): {rng.choice(_TOPICS[topic])}")
+        elif kind == "sticker":
+            content = "[动画表情]"
+        elif kind == "image":
+            content = "[图片]\n图片描述: 无具体描述"
+        elif kind == "pat":
+            content = f"[通知消息: 拍一拍]\n\"{person['sender']}\" 拍了拍 \"{other['sender']}\""
+        elif kind == "revoke":
+            content = f"[通知消息: 撤回]\n\"{person['sender']}\" 撤回了一条消息"
+        elif kind == "join":
+            content = f"[通知消息: 加入群聊]\n\"{person['sender']}\"邀请\"{other['sender']}\"加入了群聊"
+        elif kind == "link":
+            content = f"[网页链接: {rng.choice(_LINK_TITLES)}]\n来源: 公众号"
+        elif kind == "red_packet":
+            content = "[卡片消息: 微信红包]"
+        elif kind == "voice":
+            content = "[语音]"
+        elif kind == "video":
+            content = "[视频]"
+        else:
+            content = rng.choice(_TOPICS[topic])
+
+        item = {
+            "sender": person["sender"],
+            "remark": person["remark"],
+            "content": content,
+            "time": current_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "wxid": person["wxid"],
+            "msg_id": 7000000000000000000 + index,
+        }
+        if kind == "quote" and data:
+            item["reply_msg_id"] = quoted["msg_id"]
+        if is_room and kind in ("text", "short") and rng.random() < 0.05:
+            item["mentioned"] = [{"name": other["sender"], "wxid": other["wxid"]}]
+        data.append(item)
+
+    return {
+        "meta": {
+            "description": "聊天记录的数据结构定义",
+            "notes": f"这是一份合成的微信{'群聊' if is_room else '私聊'}聊天记录，用于压测。",
+            "field_definitions": {},
+            "context": {"memories": []},
+        },
+        "data": data,
+    }
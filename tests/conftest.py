@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class FixedChatModel(BaseChatModel):
+    """不访问网络、总是返回固定内容的聊天模型。"""
+
+    model_name: str = "fixed-chat"
+    response: str = "无相关信息"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fixed-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+
+def _chat_export(message_count: int, members: int = 5) -> dict:
+    start_time = datetime(2025, 1, 1, 8, 0, 0)
+    data = [{
+        "sender": f"用户{i % members}",
+        "remark": "",
+        "content": f"第 {i} 条消息，周末一起去聚餐吧，顺便聊聊项目进度",
+        "time": (start_time + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'),
+        "wxid": f"wxid_{i % members}",
+        "msg_id": 7000000000000000000 + i,
+    } for i in range(message_count)]
+    return {"meta": {"context": {"memories": []}}, "data": data}
+
+
+@pytest.fixture
+def chat_model():
+    return FixedChatModel()
+
+
+@pytest.fixture
+def chat_export():
+    """生成与 `write_txt(file_type=None)` 结构一致的群聊记录，参数为 (消息条数, 发送人数)。"""
+    return _chat_export
@@ -0,0 +1,28 @@
+from webot.utils.bm25 import BM25, tokenize
+
+
+def test_tokenize_splits_cjk_into_bigrams_and_keeps_words():
+    assert tokenize("周末聚餐 wxid_abc 2025-01-01") == ["wxid_abc", "2025-01-01", "周末", "末聚", "聚餐"]
+
+
+def test_tokenize_keeps_single_cjk_character():
+    assert tokenize("好") == ["好"]
+    assert tokenize("") == []
+
+
+def test_scores_rank_matching_document_first():
+    documents = ["明天周末一起去聚餐", "项目进度汇报", "周五下午开会讨论项目"]
+    scores = BM25(documents).scores("项目开会")
+    assert len(scores) == len(documents)
+    assert scores.index(max(scores)) == 2
+    assert scores[0] == 0
+
+
+def test_scores_without_match_are_zero():
+    assert BM25(["苹果", "香蕉"]).scores("火车") == [0.0, 0.0]
+
+
+def test_document_parts_score_like_joined_text():
+    parts = [["周末一起", "去聚餐"], ["项目进度", "汇报"]]
+    joined = ["\n".join(document) for document in parts]
+    assert BM25(parts).scores("聚餐 项目") == BM25(joined).scores("聚餐 项目")
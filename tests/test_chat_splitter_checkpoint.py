@@ -0,0 +1,64 @@
+from os import path
+
+import pytest
+
+from webot.agent.chat_splitter_checkpoint import ChatSplitterCheckpoint
+from webot.databases.chat_splitter_database import ChatSplitterDatabase
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    task_db = ChatSplitterDatabase(db_path=str(tmp_path))
+    task_db.create_task(conversation_id="1", triggering_message_id=None, user_query="q", input_data_json="{}",
+                        task_id="task")
+    return ChatSplitterCheckpoint("task", task_db=task_db, task_dir=str(tmp_path))
+
+
+def _reload(checkpoint):
+    reloaded = ChatSplitterCheckpoint(checkpoint.task_id, task_db=checkpoint.task_db,
+                                      task_dir=path.dirname(checkpoint.results_path))
+    return reloaded, reloaded.load()
+
+
+def test_load_round_trip(checkpoint):
+    checkpoint.save_plan({"intent": "i", "entities": {}, "chunk_processing_prompt": "p"})
+    checkpoint.record_chunk(1, "第二块", 2)
+    checkpoint.record_chunk(0, None, 2)
+
+    _, (plan, total_chunks, completed) = _reload(checkpoint)
+    assert plan["chunk_processing_prompt"] == "p"
+    assert total_chunks == 2
+    assert completed == {0: None, 1: "第二块"}
+    assert checkpoint.task_db.get_task("task")["processed_chunk_index"] == 1
+
+
+def test_load_ignores_partial_last_line(checkpoint):
+    checkpoint.record_chunk(0, "完整", 2)
+    with open(checkpoint.results_path, "a", encoding="utf-8") as fa:
+        fa.write('{"type": "chunk", "chunk_ind')
+
+    _, (_, _, completed) = _reload(checkpoint)
+    assert completed == {0: "完整"}
+
+
+def test_chunking_round_trip(checkpoint):
+    checkpoint.save_chunking("bytes", 1000, [(0, 3), (3, 5)])
+    checkpoint.record_chunk(1, "第二块", 2)
+
+    reloaded, (_, total_chunks, completed) = _reload(checkpoint)
+    assert total_chunks == 2
+    assert completed == {1: "第二块"}
+    assert reloaded.chunking["size_unit"] == "bytes"
+    assert reloaded.chunking["limit"] == 1000
+    assert reloaded.chunking["chunks"] == [[0, 3], [3, 5]]
+
+
+def test_new_chunking_invalidates_earlier_chunk_results(checkpoint):
+    checkpoint.save_chunking("bytes", 1000, [(0, 3), (3, 5)])
+    checkpoint.record_chunk(0, "旧结果", 2)
+    checkpoint.save_chunking("bytes", 500, [(0, 2), (2, 4), (4, 5)])
+    checkpoint.record_chunk(2, "新结果", 3)
+
+    _, (_, total_chunks, completed) = _reload(checkpoint)
+    assert total_chunks == 3
+    assert completed == {2: "新结果"}
@@ -0,0 +1,53 @@
+import pytest
+
+from webot.agent.chat_splitter_agent import ChatSplitterAgent
+from webot.databases.chunk_size_database import ChunkSizeDatabase
+from webot.llm.chunk_size_controller import ChunkSizeController
+
+
+@pytest.fixture
+def controller(tmp_path):
+    return ChunkSizeController("fixed-chat", database=ChunkSizeDatabase(db_path=str(tmp_path)))
+
+
+@pytest.fixture
+def agent(chat_model, controller):
+    return ChatSplitterAgent(chat_model, max_bytes_per_chunk=6000, extraction_cache=False,
+                             chunk_size_controller=controller)
+
+
+@pytest.fixture
+def state(chat_export):
+    return ChatSplitterAgent._initial_state(chat_export(400), "大家最近在讨论什么？")
+
+
+def _saved_chunking(result):
+    return {"size_unit": "bytes", "limit": result["chunk_stats"]["effective_max_bytes"],
+            "chunks": [list(chunk) for chunk in result["message_chunks"]]}
+
+
+def test_resume_reuses_recorded_limit_after_controller_shrinks(agent, controller, state):
+    first = agent._chunk_node(state)
+    assert len(first["message_chunks"]) > 1
+    controller.on_context_error("bytes", first["chunk_stats"]["effective_max_bytes"])
+
+    resumed = agent._chunk_node({**state, "chunking": _saved_chunking(first), "completed_chunks": {0: "结果"}})
+    assert resumed["message_chunks"] == first["message_chunks"]
+    assert "completed_chunks" not in resumed
+
+
+def test_resume_drops_completed_chunks_when_ranges_differ(agent, state):
+    first = agent._chunk_node(state)
+    saved = _saved_chunking(first)
+    saved["chunks"] = saved["chunks"][:-1]
+
+    resumed = agent._chunk_node({**state, "chunking": saved, "completed_chunks": {0: "结果"}})
+    assert resumed["completed_chunks"] == {}
+
+
+def test_resume_without_chunking_record_checks_chunk_count(agent, state):
+    first = agent._chunk_node(state)
+    legacy = {"chunks": None, "total_chunks": len(first["message_chunks"]) + 1}
+
+    resumed = agent._chunk_node({**state, "chunking": legacy, "completed_chunks": {0: "结果"}})
+    assert resumed["completed_chunks"] == {}
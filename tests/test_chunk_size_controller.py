@@ -0,0 +1,44 @@
+import pytest
+
+from webot.databases.chunk_size_database import ChunkSizeDatabase
+from webot.llm.chunk_size_controller import ChunkSizeController, is_context_length_error
+
+
+@pytest.fixture
+def database(tmp_path):
+    return ChunkSizeDatabase(db_path=str(tmp_path))
+
+
+def test_is_context_length_error():
+    assert is_context_length_error(Exception("This model's maximum context length is 8192 tokens"))
+    assert is_context_length_error(Exception("输入长度超出限制"))
+    assert not is_context_length_error(Exception("connection reset"))
+
+
+def test_context_error_halves_limit_and_persists(database):
+    controller = ChunkSizeController("model-a", database=database)
+    assert controller.limit("bytes", 20000) == 20000
+    assert controller.on_context_error("bytes", 20000) == 10000
+    assert controller.limit("bytes", 20000) == 10000
+    assert ChunkSizeController("model-a", database=database).limit("bytes", 20000) == 10000
+
+
+def test_context_error_respects_minimum(database):
+    controller = ChunkSizeController("model-b", database=database, min_chunk_size={"bytes": 4000})
+    assert controller.on_context_error("bytes", 5000) == 4000
+
+
+def test_fast_successes_near_limit_grow_back_to_configured(database):
+    controller = ChunkSizeController("model-c", database=database, increase_after=2, increase_ratio=0.5)
+    controller.on_context_error("tokens", 8000)
+    assert controller.on_success("tokens", 4000, 1.0, 8000) is None
+    assert controller.on_success("tokens", 4000, 1.0, 8000) == 8000
+    assert controller.limit("tokens", 8000) == 8000
+
+
+def test_slow_or_small_chunks_do_not_grow(database):
+    controller = ChunkSizeController("model-d", database=database, increase_after=1, fast_seconds=5)
+    controller.on_context_error("bytes", 20000)
+    assert controller.on_success("bytes", 1000, 1.0, 20000) is None
+    assert controller.on_success("bytes", 10000, 60.0, 20000) is None
+    assert controller.limit("bytes", 20000) == 10000
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from webot.databases.local_database import LocalDatabase, QueryResult
+
+
+class _NumbersDatabase(LocalDatabase):
+    def __init__(self, db_name: str = "numbers", *args, **kwargs):
+        super().__init__(db_name=db_name, *args, **kwargs)
+        self.execute_query("CREATE TABLE IF NOT EXISTS numbers (value INTEGER)", commit=True)
+
+
+def test_read_result_is_fetched_before_connection_is_released(tmp_path):
+    database = _NumbersDatabase(db_path=str(tmp_path))
+    for value in range(5):
+        database.execute_query("INSERT INTO numbers (value) VALUES (?)", (value,), commit=True)
+
+    result = database.execute_query("SELECT value FROM numbers ORDER BY value")
+    assert isinstance(result, QueryResult)
+    assert [column[0] for column in result.description] == ["value"]
+    # 连接已经归还，其他线程复用连接执行查询后，之前的结果不受影响
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        counts = list(executor.map(lambda _: database.execute_query("SELECT COUNT(*) FROM numbers").fetchone()[0],
+                                   range(64)))
+    assert counts == [5] * 64
+    assert result.fetchone() == (0,)
+    assert result.fetchmany(2) == [(1,), (2,)]
+    assert result.fetchall() == [(3,), (4,)]
+    assert result.fetchone() is None
+
+
+def test_write_returns_writer_cursor(tmp_path):
+    database = _NumbersDatabase(db_path=str(tmp_path))
+    cursor = database.execute_query("INSERT INTO numbers (value) VALUES (?)", (1,), commit=True)
+    assert cursor.lastrowid == 1
+    assert list(database.execute_query("SELECT value FROM numbers")) == [(1,)]
@@ -0,0 +1,99 @@
+from webot.agent.message_arena import CompactMessageArena, MessageArena, MessageFields
+
+
+def _fields(message):
+    return MessageFields(
+        sender_key=message["wxid"],
+        sender_label=f"[{message['wxid']}] {message['sender']} ()",
+        timestamp="2025-01-01 08:00:00",
+        content=message["content"],
+        msg_id=str(message["msg_id"]),
+        reply_msg_id=message.get("reply_msg_id"),
+        mention_count=0,
+    )
+
+
+MESSAGES = [
+    {"wxid": "wxid_a", "sender": "张三", "content": "明天要买A4纸", "msg_id": 1},
+    {"wxid": "wxid_b", "sender": "李四", "content": "型号A2的打印机", "msg_id": 2, "reply_msg_id": "1"},
+    {"wxid": "wxid_a", "sender": "张三", "content": "好的", "msg_id": 3},
+]
+
+
+def test_pack_is_greedy_and_keeps_oversized_item_alone():
+    assert MessageArena.pack([3, 3, 3, 10, 1], 6) == [(0, 2), (2, 3), (3, 4), (4, 5)]
+    assert MessageArena.pack([], 6) == []
+
+
+def test_pack_chunks_respects_byte_budget():
+    arena = MessageArena(MESSAGES, lambda message: message["content"])
+    chunks = arena.pack_chunks("bytes", arena.byte_sizes[0] + arena.byte_sizes[1])
+    assert chunks == [(0, 2), (2, 3)]
+    assert arena.text((0, 2)) == "明天要买A4纸\n型号A2的打印机"
+
+
+def test_truncate_limits_bytes():
+    arena = MessageArena(MESSAGES, lambda message: message["content"] * 50)
+    arena.truncate(0, 40)
+    assert arena.byte_sizes[0] <= 40
+    assert arena.lines[0].endswith("...[截断]")
+
+
+def test_search_lines_returns_chunk_lines_without_joining():
+    arena = MessageArena(MESSAGES, lambda message: message["content"])
+    assert arena.search_lines((1, 3)) == ["型号A2的打印机", "好的"]
+
+
+def test_compact_text_uses_bracketed_aliases_and_ordinals():
+    arena = CompactMessageArena(MESSAGES, _fields)
+    text = arena.text((0, 3))
+    assert "[A1] = [wxid_a] 张三 ()" in text
+    assert "[A2]: 型号A2的打印机 (#2, reply_to: #1)" in text
+    assert arena.size((0, 3), "bytes") >= len(text.encode("utf-8"))
+
+
+def test_compact_pack_chunks_counts_legend_within_budget():
+    arena = CompactMessageArena(MESSAGES, _fields)
+    budget = arena.size((0, 2), "bytes")
+    chunks = arena.pack_chunks("bytes", budget)
+    assert chunks[0] == (0, 2)
+    for chunk in chunks:
+        assert arena.size(chunk, "bytes") <= budget or chunk[1] - chunk[0] == 1
+
+
+def test_compact_expand_restores_aliases_without_touching_plain_text():
+    arena = CompactMessageArena(MESSAGES, _fields)
+    expanded = arena.expand((0, 3), "[A1] 要买A4纸，[A2] 问型号A2 (#2)")
+    assert expanded == "[wxid_a] 张三 () 要买A4纸，[wxid_b] 李四 () 问型号A2 (msg_id: 2)"
+
+
+def test_compact_expand_leaves_unknown_alias_and_ordinal():
+    arena = CompactMessageArena(MESSAGES, _fields)
+    assert arena.expand((0, 1), "[A5] #9") == "[A5] #9"
+
+
+def test_compact_expand_only_rewrites_rendered_ordinal_forms():
+    messages = [{"wxid": "wxid_a", "sender": "张三", "content": "hello", "msg_id": 8812},
+                {"wxid": "wxid_b", "sender": "李四", "content": "hi", "msg_id": 8813, "reply_msg_id": "8812"}]
+    arena = CompactMessageArena(messages, _fields)
+    expanded = arena.expand((0, 2), "[A1] 说了 hello (msg_id: #1)，群里第#2个话题；[A2] (#2, reply_to: #1)")
+    assert expanded == ("[wxid_a] 张三 () 说了 hello (msg_id: 8812)，群里第#2个话题；"
+                        "[wxid_b] 李四 () (msg_id: 8813, reply_to: 8812)")
+
+
+def test_compact_text_escapes_ordinal_marker_in_content():
+    messages = [{"wxid": "wxid_a", "sender": "张三", "content": "hello #2 topic", "msg_id": 1}]
+    arena = CompactMessageArena(messages, _fields)
+    assert "[A1]: hello ＃2 topic (#1)" in arena.text((0, 1))
+    assert arena.full_bytes == len("2025-01-01 08:00:00 - [wxid_a] 张三 (): hello #2 topic (msg_id: 1)\n".encode("utf-8"))
+
+
+def test_compact_size_covers_wide_aliases_and_ordinals():
+    messages = [{"wxid": f"wxid_{i % 120}", "sender": f"用户{i % 120}", "content": "好", "msg_id": 10 ** 8 + i,
+                 "reply_msg_id": str(10 ** 12 + i)} for i in range(1200)]
+    arena = CompactMessageArena(messages, _fields)
+    chunk = (0, len(messages))
+    assert arena.size(chunk, "bytes") >= len(arena.text(chunk).encode("utf-8"))
+    for chunk in arena.pack_chunks("bytes", 2000):
+        assert arena.size(chunk, "bytes") >= len(arena.text(chunk).encode("utf-8"))
+
@@ -0,0 +1,42 @@
+import pytest
+
+from webot.agent.noise_filter import NoiseFilter
+
+
+def _message(msg_id, content):
+    return {"msg_id": msg_id, "content": content, "sender": "张三"}
+
+
+def test_apply_drops_pats_and_collapses_runs():
+    messages = [
+        _message(1, "[通知消息: 拍一拍]\n\"张三\" 拍了拍 \"李四\""),
+        _message(2, "[动画表情]"),
+        _message(3, "[动画表情]"),
+        _message(4, "1"),
+        _message(5, "1"),
+        _message(6, "1"),
+        _message(7, "正文"),
+    ]
+    result = NoiseFilter().apply(messages)
+
+    assert [message["msg_id"] for message in result.messages] == [2, 4, 7]
+    assert result.messages[0]["collapsed_msg_ids"] == [3]
+    assert result.messages[1]["collapsed_msg_ids"] == [5, 6]
+    assert set(result.removed) == {"1", "3", "5", "6"}
+    assert result.stats["dropped"] == {"pat": 1}
+    assert result.stats["collapsed"] == {"sticker": 1, "duplicate": 2}
+    assert result.stats["input_messages"] == 7 and result.stats["output_messages"] == 3
+    # 不修改传入的消息
+    assert messages[1]["content"] == "[动画表情]"
+
+
+def test_keep_action_and_duplicates_switch():
+    messages = [_message(1, "[动画表情]"), _message(2, "[动画表情]")]
+    result = NoiseFilter(actions={"sticker": "keep"}, collapse_duplicates=False).apply(messages)
+    assert [message["msg_id"] for message in result.messages] == [1, 2]
+    assert result.removed == {}
+
+
+def test_unknown_action_is_rejected():
+    with pytest.raises(ValueError):
+        NoiseFilter(actions={"pat": "hide"})
@@ -0,0 +1,67 @@
+import pytest
+
+from webot.llm import rate_limiter
+from webot.databases.rate_limit_database import RateLimitDatabase
+from webot.llm.rate_limiter import NullRateLimiter, SharedRateLimiter, TokenBucket, estimate_tokens
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_estimate_tokens_counts_cjk_per_char():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("abcd") == 1
+
+
+def test_token_bucket_spaces_requests_by_rpm(clock):
+    bucket = TokenBucket(rpm_limit=60, burst=2)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_token_bucket_limits_tokens_per_minute(clock):
+    bucket = TokenBucket(tpm_limit=600)
+    assert bucket.acquire(600) == 0
+    assert bucket.acquire(300) == pytest.approx(30.0)
+
+
+def test_token_bucket_without_limits_never_waits(clock):
+    bucket = TokenBucket()
+    assert all(bucket.acquire(10 ** 6) == 0 for _ in range(100))
+    assert clock.slept == []
+
+
+def test_null_rate_limiter_never_waits():
+    assert NullRateLimiter().acquire(10 ** 6) == 0.0
+
+
+def test_shared_rate_limiter_without_budget_is_unlimited(tmp_path, clock):
+    limiter = SharedRateLimiter(1, database=RateLimitDatabase(db_path=str(tmp_path)))
+    assert limiter.budget == (0, 0)
+    assert all(limiter.acquire(10 ** 6) == 0 for _ in range(100))
+
+
+def test_shared_rate_limiter_enforces_configured_budget(tmp_path, clock):
+    database = RateLimitDatabase(db_path=str(tmp_path))
+    database.set_budget(1, rpm_limit=30, tpm_limit=0)
+    assert SharedRateLimiter(1, database=database).budget == (30, 0)
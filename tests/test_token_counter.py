@@ -0,0 +1,37 @@
+import pytest
+
+from webot.llm import token_counter
+from webot.llm.token_counter import EstimateTokenCounter, get_context_limit, get_token_counter
+
+
+@pytest.fixture(autouse=True)
+def counters(monkeypatch):
+    monkeypatch.setattr(token_counter, "_COUNTERS", {})
+
+
+def test_estimate_counter_uses_model_profile():
+    counter = get_token_counter("deepseek-chat")
+    assert isinstance(counter, EstimateTokenCounter)
+    assert counter.name == "estimate:deepseek-chat"
+    assert counter.count("") == 0
+    assert counter.count("你好你好你") == 4
+
+
+def test_unknown_model_uses_default_profile():
+    assert get_token_counter("some-model").name == "estimate:default"
+
+
+def test_tiktoken_load_failure_falls_back_to_estimate(monkeypatch):
+    def offline(self, encoding_name):
+        raise OSError("无法下载分词器文件")
+
+    monkeypatch.setattr(token_counter.TiktokenCounter, "__init__", offline)
+    counter = get_token_counter("gpt-4o")
+    assert isinstance(counter, EstimateTokenCounter)
+    assert get_token_counter("gpt-4o") is counter
+
+
+def test_context_limit_from_table_and_suffix():
+    assert get_context_limit("deepseek-ai/DeepSeek-V3") == 64000
+    assert get_context_limit("custom-model-256k") == 256000
+    assert get_context_limit("custom-model") is None
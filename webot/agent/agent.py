@@ -3,20 +3,17 @@ import json
 import re
 import uuid
 from typing import List, Dict, Any
-from sqlite3 import connect
 
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.sqlite import SqliteSaver
 
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, BaseMessage
 
+from webot.agent.checkpoint_store import CheckpointRetention, get_checkpointer
+from webot.agent.context_window import ContextWindowManager
 from webot.llm.llm import LLMFactory
 from webot.tool_call.tools import ALL_TOOLS
-from webot.utils.project_path import DATA_PATH, path
 from webot.prompts.system_prompts import SystemPrompts
 
-CHECKPOINT_DB_PATH = path.join(DATA_PATH, 'databases', 'webot_checkpoint.db')
-
 
 def extract_openai_json_object(text: str) -> dict | None:
     """
@@ -229,23 +226,51 @@ def post_model_hook(states: Dict[str, Any]) -> Dict[str, Any]:
 
 class WeBotAgent:
 
-    def __init__(self, model_name: str = "glm-4-flash", llm_options: dict = {}, webot_port: int = 19001, username: str = ''):
+    def __init__(self, model_name: str = "glm-4-flash", llm_options: dict = {}, webot_port: int = 19001, username: str = '',
+                 checkpoint_retention: CheckpointRetention = None, context_window: bool = True,
+                 context_options: dict = None):
+        """
+        :param checkpoint_retention: 检查点保留策略，每轮对话结束后只保留线程最新的若干个检查点
+        :param context_window: 是否按模型的上下文窗口裁剪发送给模型的消息（滚动摘要、旧工具输出存根）
+        :param context_options: 传给 ContextWindowManager 的配置，例如 context_limit、context_fill_ratio
+        """
         self.llm = LLMFactory.llm(model_name=model_name, **llm_options)
 
-        self._sqlite_con = connect(CHECKPOINT_DB_PATH, check_same_thread=False)
-        self.checkpoint = SqliteSaver(conn=self._sqlite_con)
+        # 所有实例共享一个检查点连接，大的检查点数据压缩存储
+        self.checkpoint = get_checkpointer()
+        self.checkpoint_retention = checkpoint_retention or CheckpointRetention()
         username = f"\n   - **用户名：** 当前与你对话的用户叫做：`{username}`，你可以使用`{username}`称呼用户。" if username else ''
         system_prompt = SystemPrompts.webot_system_prompt(webot_port=webot_port, username=username)
 
+        # 检查点中保留完整的对话状态，只裁剪每次发送给模型的消息
+        self.context_manager = None
+        if context_window:
+            self.context_manager = ContextWindowManager(llm_summary=self.llm, model_name=model_name,
+                                                        **(context_options or {}))
+            self.context_manager.system_prompt_tokens = self.context_manager.token_counter.count(system_prompt)
+
         self.agent = create_react_agent(
             model=self.llm,
             tools=ALL_TOOLS,
             checkpointer=self.checkpoint,
             prompt=SystemMessage(content=system_prompt),
+            pre_model_hook=self.context_manager.pre_model_hook if self.context_manager else None,
             post_model_hook=post_model_hook
         )
 
+    def has_history(self, thread_id: int | str) -> bool:
+        """
+        线程的检查点中是否已有对话状态。已有时继续对话只需要传入新的用户消息，
+        再次传入历史消息会被当作新消息追加到状态中。
+        """
+        state = self.agent.get_state({"configurable": {"thread_id": str(thread_id)}})
+        return bool(state.values.get('messages'))
+
     def chat(self, message: Dict[str, List[BaseMessage | dict]],
              thread_id: int | str = -1):  # -> List[HumanMessage|AIMessage|ToolMessage]:
-        return self.agent.stream(message, stream_mode=['updates'],
-                                 config={"configurable": {"thread_id": str(thread_id)}})
+        yield from self.agent.stream(message, stream_mode=['updates'],
+                                     config={"configurable": {"thread_id": str(thread_id)}})
+        try:
+            self.checkpoint_retention.prune_thread(thread_id)
+        except Exception as e:
+            print(f"清理会话 {thread_id} 的旧检查点失败：{e}")
@@ -1,16 +1,34 @@
 import os
 import json
+import random
 import time
-from typing import TypedDict, List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from queue import Queue
+from threading import Thread, Lock
+from typing import TypedDict, List, Dict, Any, Optional, Union, Tuple, Callable, Iterator
 
+from langchain_core.caches import BaseCache
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langgraph.graph import StateGraph, END
 from langgraph.graph.state import CompiledStateGraph
 
+from webot.agent.chat_splitter_checkpoint import ChatSplitterCheckpoint
+from webot.agent.message_arena import MessageArena, CompactMessageArena, MessageFields, ChunkRange
+from webot.agent.noise_filter import NoiseFilter
+from webot.databases.chat_splitter_database import ChatSplitterDatabase
 from webot.llm.llm import LLMFactory
+from webot.llm.endpoint_pool import EndpointPoolChatModel
+from webot.llm.chunk_size_controller import ChunkSizeController, get_chunk_size_controller, is_context_length_error
+from webot.llm.llm_cache import SQLiteLLMCache, get_llm_cache_for
+from webot.llm.rate_limiter import NullRateLimiter, TokenBucket, SharedRateLimiter, attached_rate_limiters, \
+    skip_rate_limit
+from webot.llm.token_counter import TokenCounter, get_token_counter, get_context_limit
 from webot.prompts.system_prompts import SystemPrompts
+from webot.utils.bm25 import BM25
+from webot.utils.memory_ranker import format_memory_line, rank_memories
 
 
 # --- 1. 定义状态（类外部） ---
@@ -21,22 +39,37 @@ class AgentState(TypedDict):
     intent: Optional[str]  # 推断的用户意图
     entities: Optional[Dict]  # 提取的关键实体
     chunk_processing_prompt: Optional[str]  # 动态生成的用于处理块的 Prompt
+    # --- 噪声过滤 ---
+    filtered_data: Optional[List[Dict]]  # 噪声过滤后的消息，为 None 时分块直接使用 input_dict['data']
+    removed_messages: Dict[str, Dict]  # 被丢弃或折叠的消息，键为 msg_id
+    noise_filter_stats: Optional[Dict[str, Any]]  # 噪声过滤统计：各类别丢弃/折叠条数与节省的字节数
     # --- 分块 ---
-    messages: List[Dict]  # 从 input_dict 提取的原始消息列表
-    message_chunks: List[List[Dict]]  # 分块后的消息列表
+    arena: Optional[MessageArena]  # 预渲染的消息区，每条消息只格式化一次
+    message_chunks: List[ChunkRange]  # 分块结果，每个块是 arena 中的 [start, end) 索引范围
+    chunk_stats: Optional[Dict[str, Any]]  # 分块统计：预算、实际填充率，以及与按字节分块的块数对比
     # --- 提取 ---
+    precomputed_summaries: List[str]  # 预计算的摘要 (例如按天/按周的历史摘要)，与分块提取结果一起参与合成
     extracted_data: List[str]  # 从各块提取的信息列表
+    fusion_levels: List[Dict[str, Any]]  # 递归融合每一层的输入数、分组数与耗时
+    relevance_stats: Optional[Dict[str, Any]]  # 相关性预筛选统计：查询词、各块得分与被跳过的块，用于审计召回
+    triage_stats: Optional[Dict[str, Any]]  # 初筛模型统计：两级模型各自的调用数、Token 与耗时，以及抽样审计得到的召回损失
     # --- 最终答案 ---
     final_answer: Optional[str]  # 最终给用户的答案
     # --- 错误处理 ---
     error_message: Optional[str]  # 记录处理过程中的错误
+    # --- 断点续跑 ---
+    checkpoint: Optional[ChatSplitterCheckpoint]  # 任务断点记录，为 None 时不持久化
+    completed_chunks: Dict[int, Optional[str]]  # 恢复任务时已完成的块提取结果，键为块索引
+    chunking: Optional[Dict[str, Any]]  # 恢复任务时首次执行保存的分块记录 (单位、生效上限与各块范围)，参考 `ChatSplitterCheckpoint.save_chunking`
+    # --- 进度事件 ---
+    event_sink: Optional[Callable[[Dict[str, Any]], None]]  # 进度事件回调，参考 `ChatSplitterAgent.stream`
 
 
 # --- 2. 定义Agent类 ---
 class ChatSplitterAgent:
     """
     一个使用 LangGraph 构建的 Agent，用于分析长聊天记录并回答特定问题。
-    它使用字节数来控制文本分块，以适应基于字节数计费/限制的模型。
+    提取模型的上下文窗口已知时按 Token 数分块，把每次请求填充到上下文窗口的目标比例；否则使用字节数来控制文本分块。
     """
 
     def __init__(
@@ -44,12 +77,30 @@ class ChatSplitterAgent:
             llm_query_understanding: BaseChatModel,  # 用于理解查询和规划的 LLM 实例。
             llm_extraction: BaseChatModel = None,  # 用于从块中提取信息的 LLM 实例。
             llm_synthesis: BaseChatModel = None,  # 用于合成最终答案的 LLM 实例。
+            llm_triage: BaseChatModel = None,  # 用于在提取前初筛块相关性的小模型，为 None 时不初筛。
             max_bytes_per_chunk: int = 25000,  # 基于字节数的块大小上限 (需要根据模型调整)
             max_bytes_pre_recursive_fuse_chunk: int = 25000,
             prompt_overhead_bytes: int = 500,  # 估算的 Prompt 开销字节数 (需要调整)
             byte_encoding: str = 'utf-8',  # 用于计算字节数的编码
             recursion_limit: int = 15,
             rpm_limit=10,
+            tpm_limit: int = 0,
+            max_concurrency: Union[int, Dict[str, int]] = 4,
+            rate_limiter: Union[TokenBucket, SharedRateLimiter] = None,
+            task_db: ChatSplitterDatabase = None,
+            extraction_cache: Union[bool, BaseCache] = True,
+            max_tokens_per_chunk: int = None,
+            context_fill_ratio: float = 0.6,
+            reserved_output_tokens: int = 4096,
+            token_counter: TokenCounter = None,
+            relevance_threshold: Optional[float] = None,
+            fusion_fan_in: Optional[int] = 8,
+            compact_rendering: bool = False,
+            noise_filter: Union[bool, NoiseFilter] = False,
+            triage_rpm_limit: int = 60,
+            triage_audit_ratio: float = 0.0,
+            chunk_size_controller: Union[bool, ChunkSizeController] = True,
+            max_memory_bytes: Optional[int] = 4000,
     ):
         """
         初始化 Agent.
@@ -58,12 +109,50 @@ class ChatSplitterAgent:
             llm_query_understanding: 用于理解查询和规划的 LLM 实例。建议使用高参数模型，例如：DeepSeek V3
             llm_extraction: 用于从块中提取信息的 LLM 实例。默认使用 llm_query_understanding。主要的Token消耗环节，可以使用低参数模型，但是不建议，低参数模型丢失细节比较严重。建议使用豆包1.5pro 256k
             llm_synthesis: 用于最终合成答案的 LLM 实例。默认使用 llm_query_understanding。建议使用高参数模型，例如：DeepSeek V3
+            llm_triage: 初筛模型。设置后每个块先用简短的提示让该模型判断是否相关 (YES/NO)，只有相关的块才发送给提取模型。
+                建议使用便宜、快速的模型，例如：glm-4-flash。初筛调用失败或块超出初筛模型的上下文窗口时按相关处理。
             max_bytes_per_chunk: 每个块的最大目标字节数 (不含 Prompt 开销)。单位是bytes
             max_bytes_pre_recursive_fuse_chunk: 在递归融合之前，每个块的最大目标字节数 (不含 Prompt 开销)。单位是bytes
             prompt_overhead_bytes: 为 Prompt 和其他开销预留的估计字节数。单位是bytes
             byte_encoding: 计算字节数时使用的字符串编码。
             recursion_limit: LangGraph 的递归深度限制。
-            rpm_limit: 模型每分钟处理的最大请求数。
+            rpm_limit: 模型每分钟处理的最大请求数，只在模型本身没有经过共享限流器时生效。
+            tpm_limit: 模型每分钟处理的最大 Token 数，0 表示不限制。只在模型本身没有经过共享限流器时生效。
+            max_concurrency: 分块提取时的最大并发数。可以传入字典按提取模型名配置，例如 {"glm-4-flash": 2, "default": 4}。
+            rate_limiter: 提取与融合阶段额外使用的限流器。提取与合成模型本身已经经过共享限流器时
+                （通过 `LLMFactory.llm(..., apikey_id=...)` 创建，或者是 `EndpointPoolChatModel`），默认不再叠加限流；
+                否则默认按 rpm_limit/tpm_limit 创建进程内令牌桶。传入的 `SharedRateLimiter` 已经挂在提取模型上时忽略，
+                避免同一次调用被计数两次。
+            task_db: 任务数据库，用于断点记录与 `resume`。默认在首次需要时创建。
+            extraction_cache: 分块提取阶段的响应缓存。默认为 True，按提取模型的 模型名@base_url 使用 SQLite 缓存，
+                对同一份聊天记录重复提问或恢复任务时，相同的块直接返回缓存结果；传入 BaseCache 实例则使用该缓存，False 关闭。
+                提取模型自身已经设置了 cache 时保持不变。
+            max_tokens_per_chunk: 每个块内容的最大 Token 数 (不含 Prompt)。
+            context_fill_ratio: 每次提取请求占提取模型上下文窗口的目标比例。提取模型的上下文窗口已知
+                (见 `MODEL_CONTEXT_LIMITS`) 或传入 max_tokens_per_chunk 时按 Token 分块，
+                块内容预算为 min(上下文窗口 * context_fill_ratio - reserved_output_tokens - 提取提示, max_tokens_per_chunk)；
+                否则退回按 max_bytes_per_chunk 分块。
+            reserved_output_tokens: 为提取结果预留的 Token 数。
+            token_counter: Token 计数器，默认按提取模型选择，安装了 tiktoken 时 OpenAI 系列模型使用精确计数。
+            relevance_threshold: 相关性预筛选阈值 (0~1)。提取前用查询理解得到的 entities 与 intent 对各块做 BM25 打分，
+                得分高的块优先处理；得分低于 最高分 * relevance_threshold 的块不发送给模型。
+                为 None 时不跳过任何块；所有块都没有命中查询词时也不跳过。
+            fusion_fan_in: 递归融合时每个分组最多包含的摘要数，使融合树的深度约为 log(摘要数, fusion_fan_in)。
+                同一层的各分组在 max_concurrency 个线程中并发融合，并经过 rate_limiter 限流。为 None 时只按字节数分组。
+            compact_rendering: 是否使用紧凑渲染。开启后每个块开头输出说话人对照表，消息行中用 [A1]、[A2] 等代号代替
+                [wxid] sender (remark)，msg_id 替换为块内序号 #n；提取结果中的代号与序号会还原为原始发送人与 msg_id。
+            noise_filter: 分块前的噪声过滤。传入 True 使用默认规则（丢弃拍一拍，折叠连续的入群、撤回、红包、表情包通知与重复消息），
+                传入 `NoiseFilter` 实例可以按类别配置 drop/collapse/keep，False 不过滤。
+                被过滤的消息保存在最终状态的 removed_messages 中，可以按 msg_id 找回。
+            triage_rpm_limit: 初筛模型每分钟处理的最大请求数，初筛调用使用独立的令牌桶，不占用提取阶段的额度。
+            triage_audit_ratio: 初筛判为不相关的块中，仍然发送给提取模型的抽样比例 (0~1)，用于估计初筛造成的召回损失。
+                抽样按块索引确定，恢复任务时抽到的块保持一致。
+            chunk_size_controller: 按提取模型自适应调整分块大小。默认为 True，使用 `get_chunk_size_controller` 按模型名共享的控制器：
+                块因上下文超长失败时，把该块对半拆分后重试，并把该模型的分块上限乘性减小；
+                接近上限的块连续快速成功时加性增大，最多恢复到 max_bytes_per_chunk 或 Token 预算。学习到的上限按模型持久化。
+                传入 False 关闭。
+            max_memory_bytes: 查询理解时使用的背景记忆 (meta.context.memories) 的字节预算。按与查询的 BM25 相关度和时间远近排序，
+                只放入预算内得分最高的记忆。为 None 时使用全部记忆，超过 max_bytes_pre_recursive_fuse_chunk 时截断。
         """
         # 设置 LLM 实例，如果未提供则使用默认值
         if not isinstance(llm_query_understanding, BaseChatModel):
@@ -71,25 +160,109 @@ class ChatSplitterAgent:
 
         self.llm_query_understanding = llm_query_understanding
         self.llm_extraction = llm_extraction or llm_query_understanding
+        if extraction_cache and self.llm_extraction.cache is None:
+            cache = extraction_cache if isinstance(extraction_cache, BaseCache) else get_llm_cache_for(self.llm_extraction)
+            # 复制一份模型再挂缓存，不影响与其他阶段共用的模型实例
+            self.llm_extraction = self.llm_extraction.model_copy(update={"cache": cache})
+        self.extraction_cache = self.llm_extraction.cache if isinstance(self.llm_extraction.cache, BaseCache) else None
         self.llm_synthesis = llm_synthesis or llm_query_understanding
+        self.llm_triage = llm_triage
 
         # 配置参数
         self.max_bytes_per_chunk = max_bytes_per_chunk
         self.max_bytes_pre_recursive_fuse_chunk = max_bytes_pre_recursive_fuse_chunk
+        self.max_memory_bytes = max_memory_bytes
         self.prompt_overhead_bytes = prompt_overhead_bytes
         self.byte_encoding = byte_encoding
         self.recursion_limit = recursion_limit
         self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.max_concurrency = self._resolve_concurrency(max_concurrency, self.llm_extraction)
+        self.max_tokens_per_chunk = max_tokens_per_chunk
+        self.context_fill_ratio = context_fill_ratio
+        self.reserved_output_tokens = reserved_output_tokens
+        extraction_model_name = self._model_name(self.llm_extraction)
+        self.token_counter = token_counter or get_token_counter(extraction_model_name)
+        self.context_limit = get_context_limit(extraction_model_name)
+        self.relevance_threshold = relevance_threshold
+        if fusion_fan_in is not None and fusion_fan_in < 2:
+            raise ValueError("fusion_fan_in must be at least 2.")
+        self.fusion_fan_in = fusion_fan_in
+        self.compact_rendering = compact_rendering
+        if chunk_size_controller is True:
+            chunk_size_controller = get_chunk_size_controller(extraction_model_name)
+        self.chunk_size_controller = chunk_size_controller or None
+        self.noise_filter = NoiseFilter() if noise_filter is True else (noise_filter or None)
+        if not 0 <= triage_audit_ratio <= 1:
+            raise ValueError("triage_audit_ratio must be between 0 and 1.")
+        self.triage_audit_ratio = triage_audit_ratio
+        self.triage_context_limit = get_context_limit(self._model_name(llm_triage)) if llm_triage else None
+        self.triage_rate_limiter = TokenBucket(rpm_limit=triage_rpm_limit, burst=self.max_concurrency) \
+            if llm_triage else None
+        # 提取阶段的所有工作线程共享同一个限流器。模型的每次调用已经经过以 apikey_id 为键的共享限流器时，
+        # 不再叠加进程内令牌桶，否则端点池与并发提取的吞吐会被压到 rpm_limit
+        if rate_limiter is None:
+            if all(self._carries_rate_limit(llm) for llm in (self.llm_extraction, self.llm_synthesis)):
+                rate_limiter = NullRateLimiter()
+            else:
+                rate_limiter = TokenBucket(rpm_limit=rpm_limit, tpm_limit=tpm_limit, burst=self.max_concurrency)
+        elif isinstance(rate_limiter, SharedRateLimiter) and \
+                rate_limiter in attached_rate_limiters(self.llm_extraction):
+            print(f"\n   提取模型已经经过 APIKEY {rate_limiter.apikey_id} 的共享限流器，忽略传入的 rate_limiter。")
+            rate_limiter = NullRateLimiter()
+        self.rate_limiter = rate_limiter
+        self._task_db = task_db
 
         # 构建并编译 LangGraph 应用
         self.app = self._build_graph()
 
+    # 上下文超长时单个块最多拆分的层数
+    MAX_SPLIT_DEPTH = 4
+
     # --- 辅助方法 ---
+    @property
+    def task_db(self) -> ChatSplitterDatabase:
+        if self._task_db is None:
+            self._task_db = ChatSplitterDatabase()
+        return self._task_db
+
+    @staticmethod
+    def _emit(state: AgentState, event: str, **data):
+        """向 state 中的 event_sink 发送一个进度事件，回调出错不影响主流程。"""
+        event_sink = state.get('event_sink')
+        if event_sink is None:
+            return
+        try:
+            event_sink({"event": event, **data})
+        except Exception as e:
+            print(f"\n   警告：发送进度事件 {event} 失败：{e}")
+
+    @staticmethod
+    def _model_name(llm: BaseChatModel) -> Optional[str]:
+        return getattr(llm, 'model_name', None) or getattr(llm, 'model', None)
+
+    @staticmethod
+    def _carries_rate_limit(llm: BaseChatModel) -> bool:
+        """模型的调用本身是否已经经过共享限流器。端点池的每个端点都经过各自APIKEY的共享限流器。"""
+        return isinstance(llm, EndpointPoolChatModel) or bool(attached_rate_limiters(llm))
+
+    @classmethod
+    def _resolve_concurrency(cls, max_concurrency: Union[int, Dict[str, int]], llm: BaseChatModel) -> int:
+        """根据提取模型的名称解析并发数配置。"""
+        if isinstance(max_concurrency, dict):
+            model_name = cls._model_name(llm)
+            max_concurrency = max_concurrency.get(model_name, max_concurrency.get('default', 1))
+        return max(1, int(max_concurrency or 1))
+
     def _format_single_message_for_llm(self, message: Dict) -> str:
         """
         将单条消息字典格式化为包含关键ID和简化内容的字符串表示。
         格式: timestamp - [wxid] sender (remark): simplified_content (msg_id: ..., reply_to: ..., mentions: N)
         """
+        return self._message_fields(message).render()
+
+    def _message_fields(self, message: Dict) -> MessageFields:
+        """提取单条消息用于渲染的字段，并简化内容。"""
         sender = message.get('sender', 'Unknown')
         remark = message.get('remark')
         content = message.get('content', '')
@@ -150,104 +323,224 @@ class ChatSplitterAgent:
         else:
             simplified_content = str(content)  # 确保是字符串
 
-        # --- 构建消息元数据字符串 (msg_id, reply_to, mentions count) ---
-        meta_parts = []
-        meta_parts.append(f"msg_id: {msg_id}")  # 始终包含 msg_id
-
-        if reply_msg_id:
-            meta_parts.append(f"reply_to: {reply_msg_id}")
-
         mention_count = 0
         if isinstance(mentioned, list):
             mention_count = len(mentioned)
-        if mention_count > 0:
-            meta_parts.append(f"mentions: {mention_count}")
-            # 如果你需要知道具体提到了谁的 wxid，可以取消下面的注释，但这会显著增加长度
-            # mentioned_wxids = [m.get('wxid', 'unknown') for m in mentioned if isinstance(m, dict)]
-            # if mentioned_wxids:
-            #     meta_parts.append(f"mentioned_wxids: [{','.join(mentioned_wxids)}]")
-
-        meta_str = ""
-        if meta_parts:
-            meta_str = f" ({', '.join(meta_parts)})"
-
-        # --- 组合最终字符串 ---
-        final_string = f"{timestamp} - {sender_info}: {simplified_content}{meta_str}"
-        return final_string
-
-    def _format_chunk_for_llm(self, chunk: List[Dict[str, Any]]) -> str:
-        """将消息字典列表（一个块）转换为多行文本表示。"""
-        return "\n".join([self._format_single_message_for_llm(msg) for msg in chunk])
-
-    def _chunk_by_byte_count(self, messages: List[Dict]) -> List[List[Dict]]:
-        """按字节数分割消息列表。"""
-        chunks = []
-        current_chunk = []
-        current_byte_count = 0
+            # 如果你需要知道具体提到了谁的 wxid，可以在 MessageFields 中增加字段，但这会显著增加长度
+
+        return MessageFields(
+            sender_key=wxid,
+            sender_label=sender_info,
+            timestamp=timestamp,
+            content=simplified_content,
+            msg_id=str(msg_id),
+            reply_msg_id=str(reply_msg_id) if reply_msg_id else None,
+            mention_count=mention_count,
+        )
+
+    def _build_arena(self, messages: List[Dict]) -> MessageArena:
+        """把消息渲染并度量一次，后续分块与提取都基于 arena 的索引范围。"""
+        render_start = time.monotonic()
+        if self.compact_rendering:
+            arena = CompactMessageArena(messages, self._message_fields, encoding=self.byte_encoding)
+        else:
+            arena = MessageArena(messages, self._format_single_message_for_llm, encoding=self.byte_encoding)
+        print(f"\n   渲染 {len(arena)} 条消息耗时 {time.monotonic() - render_start:.2f} 秒。")
+        return arena
+
+    def _effective_max_bytes(self) -> int:
+        """按字节数分块时每块的有效上限，已应用自适应分块上限。"""
         effective_max_bytes = self.max_bytes_per_chunk - self.prompt_overhead_bytes
         if effective_max_bytes <= 0:
             raise ValueError("max_bytes_per_chunk is too small compared to prompt_overhead_bytes.")
+        if self.chunk_size_controller is not None:
+            effective_max_bytes = self.chunk_size_controller.limit('bytes', effective_max_bytes)
+        return effective_max_bytes
 
-        print(f"\n   开始按字节数分块（每块有效最大字节数：{effective_max_bytes}）...")
+    def _chunk_by_byte_count(self, arena: MessageArena, effective_max_bytes: int = None) -> List[ChunkRange]:
+        """
+        按字节数分割消息。
+        :param effective_max_bytes: 每块的有效上限，默认为 `_effective_max_bytes`。恢复任务时传入首次执行保存的上限
+        """
+        if effective_max_bytes is None:
+            effective_max_bytes = self._effective_max_bytes()
 
-        for i, message in enumerate(messages):
-            formatted_message = self._format_single_message_for_llm(message)
-            try:
-                message_bytes = len(formatted_message.encode(self.byte_encoding)) + len(
-                    '\n'.encode(self.byte_encoding))  # 加上换行符字节
-            except Exception as e:
-                print(f"\n   警告：无法编码消息 {i}，跳过其字节计数。错误：{e}")
-                message_bytes = 10  # 给一个小的估计值，避免完全忽略
+        print(f"\n   开始按字节数分块（每块有效最大字节数：{effective_max_bytes}）...")
 
-            # 检查单条消息是否超限
+        for i, message_bytes in enumerate(arena.byte_sizes):
+            # 检查单条消息是否超限，超限则截断以适应限制
             if message_bytes > effective_max_bytes:
-                print(
-                    f"\n   警告：单条消息 {i} 超过有效最大字节限制 ({message_bytes} > {effective_max_bytes})。尝试截断...")
-                # 尝试截断消息以适应限制，如果仍然不行则跳过
-                allowed_str_len = int(
-                    effective_max_bytes / (message_bytes / len(formatted_message) + 1e-6))  # 估计允许的字符串长度
-                truncated_message_str = formatted_message[:allowed_str_len] + "...[截断]"
-                message_bytes = len(truncated_message_str.encode(self.byte_encoding))
-                if message_bytes > effective_max_bytes:
-                    print(f"\n      截断后仍然超长，跳过消息 {i}。")
-                    continue
-                else:
-                    # 使用截断后的消息，需要修改原始消息内容或创建一个新的表示
-                    # 这里简化处理，直接跳过，但实际应用中可能需要保留部分信息
-                    print(f"\n      截断成功，但为简化，仍跳过消息 {i}。")
-                    continue  # 跳过这条过长的消息（或者可以添加截断后的版本）
-
-            # 检查加入这条消息后是否会超限
-            if current_byte_count + message_bytes > effective_max_bytes and current_chunk:
-                # 当前块已满，保存当前块，开始新块
-                chunks.append(current_chunk)
-                print(f"     块 {len(chunks)} 创建，包含 {len(current_chunk)} 条消息，字节数 ~{current_byte_count}")
-                current_chunk = [message]
-                current_byte_count = message_bytes
-            else:
-                # 加入当前块
-                current_chunk.append(message)
-                current_byte_count += message_bytes
+                print(f"\n   警告：单条消息 {i} 超过有效最大字节限制 ({message_bytes} > {effective_max_bytes})，将截断。")
+                arena.truncate(i, effective_max_bytes)
 
-        # 加入最后一个块（如果非空）
-        if current_chunk:
-            chunks.append(current_chunk)
-            print(f"     块 {len(chunks)} 创建（最后），包含 {len(current_chunk)} 条消息，字节数 ~{current_byte_count}")
+        chunks = arena.pack_chunks('bytes', effective_max_bytes)
+        if not chunks and len(arena):
+            print("\n   警告：未能成功分块，可能是因为配置问题。")
 
-        if not chunks and messages:
-            print("\n   警告：未能成功分块，可能是因为所有消息都过长或配置问题。")
-
-        print(f"\n   分块完成：{len(messages)} 条消息 -> {len(chunks)} 个块（目标最大字节数：{self.max_bytes_per_chunk}）")
+        print(f"\n   分块完成：{len(arena)} 条消息 -> {len(chunks)} 个块（目标最大字节数：{self.max_bytes_per_chunk}）")
         return chunks
 
+    def _payload_stats(self, arena: MessageArena, chunks: List[ChunkRange]) -> Dict[str, Any]:
+        """统计实际发送的块内容字节数，以及相对完整渲染节省的字节数。"""
+        payload_bytes = sum(arena.size(chunk, 'bytes') for chunk in chunks)
+        return {
+            "compact_rendering": self.compact_rendering,
+            "payload_bytes": payload_bytes,
+            "full_render_bytes": arena.full_bytes,
+            "bytes_saved": arena.full_bytes - payload_bytes,
+            "bytes_saved_ratio": round(1 - payload_bytes / arena.full_bytes, 4) if arena.full_bytes else 0.0,
+        }
+
+    @staticmethod
+    def _extraction_template_text(chunk_processing_prompt: str) -> str:
+        """提取阶段的 Prompt 模板，{chunk_text} 为块内容占位符。"""
+        return f"""
+{chunk_processing_prompt}
+
+聊天记录片段:
+
+```
+{{chunk_text}}
+```
+
+提取的相关信息 (如果此片段不包含相关信息，请明确说明'无相关信息'):
+
+**若是遇到其他预料外任何无法提取的场景，你应该返回 '由于xxxx原因，该片段无法总结。'，不要返回错误状态码。**
+"""
+
+    def _chunk_token_budget(self, chunk_processing_prompt: str) -> Optional[int]:
+        """
+        计算每个块内容的 Token 预算。提取模型的上下文窗口未知且未设置 max_tokens_per_chunk 时返回 None。
+        """
+        budgets = []
+        if self.context_limit:
+            prompt_tokens = self.token_counter.count(self._extraction_template_text(chunk_processing_prompt or ""))
+            budgets.append(int(self.context_limit * self.context_fill_ratio) - self.reserved_output_tokens - prompt_tokens)
+        if self.max_tokens_per_chunk:
+            budgets.append(self.max_tokens_per_chunk)
+        if not budgets:
+            return None
+        budget = min(budgets)
+        if budget <= 0:
+            raise ValueError(f"计算出的块 Token 预算过小 ({budget})，请检查 context_fill_ratio 与 reserved_output_tokens。")
+        return budget
+
+    def _chunk_by_token_count(self, arena: MessageArena, budget: int) -> Tuple[List[ChunkRange], Dict[str, Any]]:
+        """按 Token 数分割消息，同时统计填充率以及按字节分块时的块数，用于对比。"""
+        print(f"\n   开始按 Token 数分块（计数器：{self.token_counter.name}，每块内容预算：{budget} tokens）...")
+        token_sizes = arena.count_tokens(self.token_counter.count, self.token_counter.name)
+        for i, tokens in enumerate(token_sizes):
+            if tokens > budget:
+                print(f"\n   警告：单条消息 {i} 超过块预算 ({tokens} > {budget} tokens)，将截断。")
+                # 按该消息的字节/Token 比例估算截断后的字节数
+                arena.truncate(i, int(arena.byte_sizes[i] * budget / tokens * 0.95), self.token_counter.count)
+
+        chunks = arena.pack_chunks('tokens', budget)
+        chunk_tokens = [arena.size(chunk, 'tokens') for chunk in chunks]
+        byte_chunks = len(arena.pack_chunks('bytes', max(1, self.max_bytes_per_chunk - self.prompt_overhead_bytes)))
+        stats = {
+            "strategy": "tokens",
+            "token_counter": self.token_counter.name,
+            "context_limit": self.context_limit,
+            "budget_tokens": budget,
+            "chunks": len(chunks),
+            "total_tokens": sum(chunk_tokens),
+            "avg_fill_ratio": round(sum(chunk_tokens) / (len(chunk_tokens) * budget), 4) if chunk_tokens else 0.0,
+            "byte_strategy_chunks": byte_chunks,
+        }
+        print(f"\n   分块完成：{len(arena)} 条消息 -> {len(chunks)} 个块"
+              f"（平均填充率 {stats['avg_fill_ratio']:.0%}，按字节分块为 {byte_chunks} 个块）")
+        return chunks, stats
+
+    @staticmethod
+    def _relevance_query(intent: Optional[str], entities: Any) -> str:
+        """把 entities 中的所有值与 intent 拼成 BM25 查询文本，实体出现两次以提高权重。"""
+        values = []
+
+        def collect(value):
+            if isinstance(value, dict):
+                for item in value.values():
+                    collect(item)
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    collect(item)
+            elif value is not None:
+                values.append(str(value))
+
+        collect(entities)
+        return " ".join(values * 2 + [intent or ""])
+
+    def _rank_chunks(self, arena: MessageArena, message_chunks: List[ChunkRange], intent: Optional[str],
+                     entities: Any) -> Tuple[List[int], List[int], Dict[str, Any]]:
+        """
+        按与查询的相关性对块排序。直接对 arena 中各块的消息行打分，不拼接块文本。
+        :return: (按得分降序的块索引, 被跳过的块索引, 统计信息)
+        """
+        query = self._relevance_query(intent, entities)
+        if query.strip():
+            scores = BM25(arena.search_lines(chunk) for chunk in message_chunks).scores(query)
+        else:
+            scores = [0.0] * len(message_chunks)
+        order = sorted(range(len(message_chunks)), key=lambda i: scores[i], reverse=True)
+        max_score = max(scores, default=0.0)
+
+        skipped = []
+        if self.relevance_threshold is not None and max_score > 0:
+            cutoff = max_score * self.relevance_threshold
+            skipped = sorted(i for i, score in enumerate(scores) if score < cutoff)
+
+        stats = {
+            "query": query,
+            "threshold": self.relevance_threshold,
+            "max_score": round(max_score, 4),
+            "scores": [round(score, 4) for score in scores],
+            "skipped_chunks": skipped,
+            "skipped_count": len(skipped),
+            "total_chunks": len(message_chunks),
+        }
+        return order, skipped, stats
+
+    def _triage_chunk(self, chain, inputs: Dict[str, Any], prompt_tokens: int) -> Optional[bool]:
+        """
+        用初筛模型判断块是否相关。
+        :return: True 相关，False 不相关，None 表示未能初筛 (超出初筛模型的上下文窗口或调用失败)，调用方按相关处理
+        """
+        if self.triage_context_limit and prompt_tokens > self.triage_context_limit * self.context_fill_ratio:
+            return None
+        self.triage_rate_limiter.acquire()
+        try:
+            verdict = chain.invoke(inputs).strip().upper()
+        except Exception as e:
+            print(f"     初筛调用失败，按相关处理：{e}")
+            return None
+        if verdict.startswith("NO") or verdict.startswith("否"):
+            return False
+        return True
+
+    def _should_audit(self, chunk_index: int) -> bool:
+        """初筛判为不相关的块是否抽样送去提取，按块索引确定。"""
+        return self.triage_audit_ratio > 0 and random.Random(chunk_index).random() < self.triage_audit_ratio
+
     # --- 图节点方法 ---
     def _understand_query_node(self, state: AgentState) -> Dict[str, Any]:
         """节点：理解查询与规划。"""
         print("\n", "--- 运行节点：understand_query_node ---")
+        checkpoint = state.get('checkpoint')
+        if state.get('chunk_processing_prompt'):
+            print("\n   已有查询规划（断点恢复或调用方指定），跳过查询理解。")
+            self._emit(state, "plan_ready", intent=state.get('intent'), entities=state.get('entities'), restored=True)
+            return {}
+        if checkpoint: checkpoint.set_status('PLANNING', current_step='understand_query')
+
         user_query = state['user_query']
         context_info = state['input_dict'].get('meta', {}).get('context', {}).get('memories', [])
+        if self.max_memory_bytes is not None and context_info:
+            selected = rank_memories(context_info, user_query, max_bytes=self.max_memory_bytes,
+                                     encoding=self.byte_encoding)
+            print(f"\n   背景记忆：共 {len(context_info)} 条，按相关度与时间选取 {len(selected)} 条。")
+            context_info = selected
         context_str = "\n".join(
-            [f"- {mem.get('type')}: {mem.get('content')}" for mem in context_info if mem.get('content')])
+            [format_memory_line(mem) for mem in context_info if mem.get('content')])
 
         if not context_str.strip():
             context_str = "当前聊天记录没有可用上下文"
@@ -276,11 +569,14 @@ class ChatSplitterAgent:
                     k in response for k in ["intent", "entities", "chunk_processing_prompt"]) or not response.get(
                 "chunk_processing_prompt"):
                 raise ValueError("LLM对查询理解的响应无效或未生成有效的chunk_processing_prompt。")
-            return {
+            plan = {
                 "intent": response.get("intent"),
                 "entities": response.get("entities"),
                 "chunk_processing_prompt": response.get("chunk_processing_prompt")
             }
+            if checkpoint: checkpoint.save_plan(plan)
+            self._emit(state, "plan_ready", intent=plan['intent'], entities=plan['entities'], restored=False)
+            return plan
         except Exception as e:
             error_msg = f"无法理解查询或生成处理提示：{e}"
             # 添加更详细的错误追溯信息
@@ -289,22 +585,86 @@ class ChatSplitterAgent:
             print(f"\n   understand_query_node中出错：{error_msg}\nTraceback:\n{traceback_str}")
             return {"error_message": error_msg}
 
+    def _noise_filter_node(self, state: AgentState) -> Dict[str, Any]:
+        """节点：分块前丢弃或折叠低信息量的消息。"""
+        print("\n--- 运行节点：noise_filter_node ---")
+        if state.get("error_message"): return {}
+        messages = state['input_dict'].get('data', [])
+        if self.noise_filter is None or not isinstance(messages, list) or not messages:
+            return {}
+        try:
+            encoding = self.byte_encoding
+            result = self.noise_filter.apply(
+                messages, measure=lambda message: len(self._format_single_message_for_llm(message).encode(encoding)))
+            print(f"   噪声过滤：{result.stats['input_messages']} 条 -> {result.stats['output_messages']} 条，"
+                  f"节省 {result.stats['bytes_saved']} 字节。")
+            return {"filtered_data": result.messages, "removed_messages": result.removed,
+                    "noise_filter_stats": result.stats}
+        except Exception as e:
+            error_msg = f"噪声过滤过程中失败：{e}"
+            import traceback
+            traceback_str = traceback.format_exc()
+            print(f"\n   noise_filter_node中出错：{error_msg}\nTraceback:\n{traceback_str}")
+            return {"error_message": error_msg}
+
     def _chunk_node(self, state: AgentState) -> Dict[str, Any]:
         """节点：加载消息并按字节数分块。"""
-        print(f"\n--- 运行节点：chunk_node（最大字节数：{self.max_bytes_per_chunk}）---")
+        print("\n--- 运行节点：chunk_node ---")
         if state.get("error_message"): return {}  # 如果上一步出错，则跳过
+        if state.get('checkpoint'): state['checkpoint'].set_status('CHUNKING', current_step='chunker')
         try:
-            messages = state['input_dict'].get('data', [])
+            messages = state.get('filtered_data')
+            if messages is None:
+                messages = state['input_dict'].get('data', [])
+            if not messages and state.get('precomputed_summaries'):
+                print("\n   没有需要读取的原始消息，直接使用预计算的摘要。")
+                return {"message_chunks": [], "chunk_stats": {"strategy": "precomputed", "chunks": 0}}
             if not messages:
                 return {"error_message": "输入数据中未找到消息 ('data' key is missing or empty)。"}
             if not isinstance(messages, list):
                 return {"error_message": f"输入数据的 'data' 字段必须是列表，实际类型是 {type(messages)}。"}
 
-            message_chunks = self._chunk_by_byte_count(messages)
+            arena = self._build_arena(messages)
+            budget = self._chunk_token_budget(state.get('chunk_processing_prompt'))
+            if budget is None:
+                size_unit, limit = 'bytes', self._effective_max_bytes()
+            else:
+                size_unit = 'tokens'
+                limit = self.chunk_size_controller.limit('tokens', budget) \
+                    if self.chunk_size_controller is not None else budget
+            saved = state.get('chunking')
+            if saved and saved.get('size_unit') == size_unit and saved.get('limit'):
+                # 恢复任务时沿用首次执行的分块上限，自适应上限在此期间的变化不影响块边界
+                limit = saved['limit']
+            if size_unit == 'bytes':
+                message_chunks = self._chunk_by_byte_count(arena, limit)
+                chunk_stats = {"strategy": "bytes", "max_bytes_per_chunk": self.max_bytes_per_chunk,
+                               "effective_max_bytes": limit, "chunks": len(message_chunks)}
+            else:
+                message_chunks, chunk_stats = self._chunk_by_token_count(arena, limit)
+
+            result = {}
+            ranges = [[start, end] for start, end in message_chunks]
+            if saved is not None:
+                changed = ranges != saved['chunks'] if saved.get('chunks') is not None else \
+                    len(ranges) != saved.get('total_chunks')
+                if changed:
+                    # 块边界与断点记录不一致时，已保存的块结果对应的是其他消息范围，全部重新提取
+                    print(f"\n   警告：恢复后的分块与断点记录不一致（{len(ranges)} 个块，记录为 "
+                          f"{len(saved['chunks']) if saved.get('chunks') is not None else saved.get('total_chunks')} 个块），"
+                          f"已完成的块结果作废，将重新提取全部块。")
+                    result['completed_chunks'] = {}
+            if state.get('checkpoint') and (saved is None or result):
+                state['checkpoint'].save_chunking(size_unit, limit, message_chunks)
             # 即使分块结果为空（可能所有消息都超长被跳过），也继续流程，后续节点会处理空提取结果
             # if not message_chunks and messages: # 如果有消息但没有分块，可能是问题
             #      return {"error_message": "分块结果为零块，但输入消息不为空。请检查数据或分块逻辑/阈值。"}
-            return {"messages": messages, "message_chunks": message_chunks}
+            chunk_stats.update(self._payload_stats(arena, message_chunks))
+            self._emit(state, "chunks_ready", total_chunks=len(message_chunks), chunk_stats=chunk_stats)
+            # 过滤后的消息已经渲染进 arena，释放这份副本
+            result.update({"arena": arena, "message_chunks": message_chunks, "chunk_stats": chunk_stats,
+                           "filtered_data": None})
+            return result
         except Exception as e:
             error_msg = f"消息分块过程中失败：{e}"
             import traceback
@@ -317,97 +677,228 @@ class ChatSplitterAgent:
         print("\n", "--- 运行节点：extract_info_node ---")
         if state.get("error_message"): return {}
         message_chunks = state.get('message_chunks')
+        arena = state.get('arena')
         chunk_processing_prompt = state.get('chunk_processing_prompt')
 
         if chunk_processing_prompt is None:  # 明确检查 None
             return {"error_message": "缺少用于提取的处理提示 (chunk_processing_prompt)。"}
         if message_chunks is None:  # 明确检查 None
             return {"error_message": "缺少消息块 (message_chunks)。"}
+        precomputed_summaries = list(state.get('precomputed_summaries') or [])
         if not message_chunks:
             print("\n   没有消息块需要处理，提取阶段跳过。")
-            return {"extracted_data": []}  # 返回空列表，而不是错误
+            return {"extracted_data": precomputed_summaries}  # 返回空列表，而不是错误
 
-        extracted_data = []
         parser = StrOutputParser()
         # 使用 f-string 动态构建模板，确保 chunk_processing_prompt 被正确嵌入
         try:
             prompt_template = ChatPromptTemplate.from_template(
-                f"""
-{chunk_processing_prompt}
-
-聊天记录片段:
-
-```
-{{chunk_text}}
-```
-
-提取的相关信息 (如果此片段不包含相关信息，请明确说明'无相关信息'):
-
-**若是遇到其他预料外任何无法提取的场景，你应该返回 '由于xxxx原因，该片段无法总结。'，不要返回错误状态码。**
-"""
-            )
+                self._extraction_template_text(chunk_processing_prompt))
             chain = prompt_template | self.llm_extraction | parser
         except Exception as e:
             error_msg = f"创建提取链时出错: {e}"
             print(f"\n   {error_msg}")
             return {"error_message": error_msg}
 
-        print(f"\n   使用生成的提示处理 {len(message_chunks)} 个块...")
+        checkpoint = state.get('checkpoint')
+        completed_chunks = state.get('completed_chunks') or {}
+        if checkpoint: checkpoint.set_status('EXTRACTING', current_step='extract_info')
+        if completed_chunks:
+            print(f"\n   从断点恢复：{len(completed_chunks)}/{len(message_chunks)} 个块已完成，将跳过。")
+
+        print(f"\n   使用生成的提示处理 {len(message_chunks)} 个块（并发数：{self.max_concurrency}）...")
+
+        prompt_tokens = self.token_counter.count(chunk_processing_prompt)
+        order, skipped_chunks, relevance_stats = self._rank_chunks(
+            arena, message_chunks, state.get('intent'), state.get('entities'))
+        if skipped_chunks:
+            print(f"\n   相关性预筛选：{len(skipped_chunks)}/{len(message_chunks)} 个块低于阈值，将跳过："
+                  f"{[i + 1 for i in skipped_chunks]}")
+            self._emit(state, "chunks_skipped", chunk_indexes=skipped_chunks, total_chunks=len(message_chunks))
+
+        triage_chain = None
+        triage_stats = None
+        triage_lock = Lock()
+        if self.llm_triage is not None:
+            triage_chain = ChatPromptTemplate.from_template(
+                SystemPrompts.chat_splitter_triage_prompt()) | self.llm_triage | StrOutputParser()
+            triage_inputs = {
+                "user_query": state['user_query'],
+                "intent": state.get('intent') or "",
+                "entities": json.dumps(state.get('entities') or {}, ensure_ascii=False),
+            }
+            triage_prompt_tokens = self.token_counter.count(
+                SystemPrompts.chat_splitter_triage_prompt().format(chunk_text="", **triage_inputs))
+            triage_stats = {
+                "triage_model": self._model_name(self.llm_triage),
+                "extraction_model": self._model_name(self.llm_extraction),
+                "triage": {"calls": 0, "tokens": 0, "seconds": 0.0, "positive": 0, "negative": 0, "undecided": 0},
+                "extraction": {"calls": 0, "tokens": 0, "seconds": 0.0},
+                "avoided": {"calls": 0, "tokens": 0},
+                "audit": {"ratio": self.triage_audit_ratio, "audited": 0, "missed": 0, "missed_chunks": []},
+            }
 
-        min_interval = 60.0 / self.rpm_limit if self.rpm_limit > 0 else 0
-        last_call_time = time.monotonic()
-        chunk_duration_list = []
+        def add_stats(tier: str, **values):
+            if triage_stats is None:
+                return
+            with triage_lock:
+                for key, value in values.items():
+                    triage_stats[tier][key] += value
+
+        size_unit = 'tokens' if (state.get('chunk_stats') or {}).get('strategy') == 'tokens' else 'bytes'
+        configured_size = self._chunk_token_budget(chunk_processing_prompt) if size_unit == 'tokens' else \
+            self.max_bytes_per_chunk - self.prompt_overhead_bytes
+
+        def extract_range(i: int, chunk: ChunkRange, formatted_chunk: str, depth: int = 0) -> str:
+            """提取一个索引范围，上下文超长时对半拆分后分别提取再合并。"""
+            chunk_tokens = prompt_tokens + self.token_counter.count(formatted_chunk)
+            cached = isinstance(self.extraction_cache, SQLiteLLMCache) and self.extraction_cache.contains(
+                self.llm_extraction, prompt_template.format_messages(chunk_text=formatted_chunk))
+            if cached:
+                print(f"     块 {i + 1} 命中响应缓存，跳过限流等待。")
+            else:
+                wait_time = self.rate_limiter.acquire(chunk_tokens)
+                if wait_time > 0:
+                    print(f"     块 {i + 1} 等待 {wait_time:.2f} 秒以避免速率限制...")
 
-        for i, chunk in enumerate(message_chunks):
+            # 调用提取链
+            invoke_start_time = time.monotonic()
+            try:
+                # 命中缓存时同时跳过模型上挂载的共享限流回调，回调在查询缓存之前就会占用额度并等待
+                with skip_rate_limit() if cached else nullcontext():
+                    response = chain.invoke({"chunk_text": formatted_chunk})
+                result = arena.expand(chunk, response)
+            except Exception as e:
+                start, end = chunk
+                if self.chunk_size_controller is None or not is_context_length_error(e) or end - start < 2 or \
+                        depth >= self.MAX_SPLIT_DEPTH:
+                    raise
+                self.chunk_size_controller.on_context_error(size_unit, arena.size(chunk, size_unit))
+                middle = (start + end) // 2
+                print(f"     块 {i + 1} 超出上下文窗口，拆分为 [{start}, {middle}) 与 [{middle}, {end}) 重试。")
+                parts = [extract_range(i, part, arena.text(part), depth + 1)
+                         for part in ((start, middle), (middle, end))]
+                relevant_parts = [part for part in parts if "无相关信息" not in part.strip().lower()]
+                return "\n\n".join(relevant_parts) if relevant_parts else parts[0]
+            invoke_seconds = time.monotonic() - invoke_start_time
+            print(f"     块 {i + 1} 信息提取完成，耗时 {invoke_seconds:.2f} 秒。")
+            add_stats("extraction", calls=1, tokens=0 if cached else chunk_tokens, seconds=invoke_seconds)
+            if self.chunk_size_controller is not None and not cached:
+                self.chunk_size_controller.on_success(size_unit, arena.size(chunk, size_unit), invoke_seconds,
+                                                      configured_size)
+            return result
+
+        def extract_chunk(i: int) -> Tuple[Optional[str], Optional[bool]]:
+            """:return: (提取结果, 初筛结论)，未初筛时初筛结论为 None"""
             print(f"\n   处理块 {i + 1}/{len(message_chunks)}...")
-            format_start = time.monotonic()
-            formatted_chunk = self._format_chunk_for_llm(chunk)
-            print(f"\n     格式化块 {i + 1} 耗时 {time.monotonic() - format_start:.2f} 秒。")
+            # 块文本在工作线程中按需拼接，同一时刻只保留正在处理的块
+            formatted_chunk = arena.text(message_chunks[i])
             if not formatted_chunk.strip():
                 print(f"\n   跳过空块 {i + 1}")
-                continue
-            try:
-                current_time = time.monotonic()
-                elapsed = current_time - last_call_time
-                if elapsed < min_interval:
-                    wait_time = min_interval - elapsed
-                    print(f"     等待 {wait_time:.2f} 秒以避免速率限制...")
-                    time.sleep(wait_time)
-
-                # 调用提取链
-                invoke_start_time = time.monotonic()
-                result = chain.invoke({"chunk_text": formatted_chunk})
-                print(f"     块 {i + 1} 信息提取完成，耗时 {time.monotonic() - invoke_start_time:.2f} 秒。")
-                last_call_time = time.monotonic()
-
-                # 更鲁棒地检查是否无相关信息（忽略大小写和空格）
-                if "无相关信息" not in result.strip().lower():
-                    extracted_data.append(result)
-                    print(f"     块 {i + 1} 提取到信息。")
-                else:
-                    print(f"     块 {i + 1} 无相关信息。")
-                chunk_duration = time.monotonic() - format_start
-                chunk_duration_list.append(chunk_duration)
-
-                duration_all = sum(chunk_duration_list) / len(chunk_duration_list) * len(message_chunks)
-                duration_left = duration_all - sum(chunk_duration_list)
-                print(f"     块 {i + 1} 总耗时：{chunk_duration:.2f} 秒。")
-                print(f"     预计总耗时: {duration_all:.2f} 秒，剩余 {duration_left:.2f} 秒")
-            except Exception as e:
-                error_msg = f"处理块 {i + 1} 时出错：{e}"
-                import traceback
-                traceback_str = traceback.format_exc()
-                print(f"\n     {error_msg}\nTraceback:\n{traceback_str}")
-                last_call_time = time.monotonic()
-                extracted_data.append(f"[处理块 {i + 1} 时出错：{e}]")  # 记录错误信息
+                return None, None
+
+            chunk_tokens = prompt_tokens + self.token_counter.count(formatted_chunk)
+            verdict = None
+            if triage_chain is not None:
+                tokens = triage_prompt_tokens + chunk_tokens - prompt_tokens
+                triage_start_time = time.monotonic()
+                verdict = self._triage_chunk(triage_chain, {**triage_inputs, "chunk_text": formatted_chunk}, tokens)
+                add_stats("triage", calls=int(verdict is not None), tokens=tokens if verdict is not None else 0,
+                          seconds=time.monotonic() - triage_start_time,
+                          **{{True: "positive", False: "negative", None: "undecided"}[verdict]: 1})
+                if verdict is False and not self._should_audit(i):
+                    print(f"     块 {i + 1} 初筛判为不相关，跳过提取。")
+                    add_stats("avoided", calls=1, tokens=chunk_tokens)
+                    result = "无相关信息（初筛）"
+                    if checkpoint: checkpoint.record_chunk(i, result, len(message_chunks))
+                    return result, verdict
+
+            self._emit(state, "chunk_started", chunk_index=i, total_chunks=len(message_chunks))
+            result = extract_range(i, message_chunks[i], formatted_chunk)
+            # 出错的块不记录，恢复时会重新处理
+            if checkpoint: checkpoint.record_chunk(i, result, len(message_chunks))
+            return result, verdict
+
+        def collect_result(i: int, result: Optional[str], resumed: bool = False, verdict: Optional[bool] = None):
+            relevant = result is not None and "无相关信息" not in result.strip().lower()
+            if verdict is False and triage_stats is not None and not result.startswith("无相关信息（初筛）"):
+                # 初筛判为不相关、但被抽样送去提取的块
+                with triage_lock:
+                    triage_stats["audit"]["audited"] += 1
+                    if relevant:
+                        triage_stats["audit"]["missed"] += 1
+                        triage_stats["audit"]["missed_chunks"].append(i)
+            self._emit(state, "chunk_done", chunk_index=i, total_chunks=len(message_chunks), relevant=relevant,
+                       extraction=result if relevant else None, resumed=resumed)
+            if result is None:
+                return
+            # 更鲁棒地检查是否无相关信息（忽略大小写和空格）
+            if relevant:
+                chunk_results[i] = result
+                print(f"     块 {i + 1} 提取到信息。")
+            else:
+                print(f"     块 {i + 1} 无相关信息。")
+
+        # 按块的原始顺序保存结果，保证 extracted_data 的顺序与块顺序一致
+        chunk_results: List[Optional[str]] = [None] * len(message_chunks)
+        extraction_start = time.monotonic()
+        finished = 0
+
+        for i, result in completed_chunks.items():
+            if 0 <= i < len(message_chunks):
+                collect_result(i, result, resumed=True)
+        # 按相关性得分从高到低提交，先拿到最可能有用的结果
+        skipped = set(skipped_chunks)
+        pending_chunks = [i for i in order if i not in completed_chunks and i not in skipped]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="chunk-extract") as executor:
+            futures = {executor.submit(extract_chunk, i): i for i in pending_chunks}
+            for future in as_completed(futures):
+                i = futures[future]
+                finished += 1
+                try:
+                    result, verdict = future.result()
+                    collect_result(i, result, verdict=verdict)
+                except Exception as e:
+                    error_msg = f"处理块 {i + 1} 时出错：{e}"
+                    import traceback
+                    traceback_str = traceback.format_exc()
+                    print(f"\n     {error_msg}\nTraceback:\n{traceback_str}")
+                    chunk_results[i] = f"[处理块 {i + 1} 时出错：{e}]"  # 记录错误信息
+                    self._emit(state, "chunk_done", chunk_index=i, total_chunks=len(message_chunks), relevant=False,
+                               extraction=None, error=str(e))
+                finally:
+                    elapsed = time.monotonic() - extraction_start
+                    duration_all = elapsed / finished * len(pending_chunks)
+                    print(f"     已完成 {finished}/{len(pending_chunks)} 个块，"
+                          f"预计总耗时: {duration_all:.2f} 秒，剩余 {duration_all - elapsed:.2f} 秒")
+
+        # 预计算的摘要放在最前面，覆盖范围通常早于需要读取原始消息的部分
+        extracted_data = precomputed_summaries + [result for result in chunk_results if result is not None]
+
+        if triage_stats is not None:
+            audit = triage_stats["audit"]
+            audit["missed_chunks"].sort()
+            # 审计样本中被初筛漏掉的比例，乘以初筛判为不相关的块数，估计初筛损失的相关块数
+            audit["estimated_miss_rate"] = round(audit["missed"] / audit["audited"], 4) if audit["audited"] else None
+            audit["estimated_missed_chunks"] = round(audit["estimated_miss_rate"] * triage_stats["triage"]["negative"],
+                                                     2) if audit["audited"] else None
+            for tier in ("triage", "extraction"):
+                tier_stats = triage_stats[tier]
+                tier_stats["seconds"] = round(tier_stats["seconds"], 3)
+                tier_stats["avg_latency_ms"] = round(tier_stats["seconds"] / tier_stats["calls"] * 1000, 1) \
+                    if tier_stats["calls"] else 0.0
+            print(f"\n   初筛：{triage_stats['triage']['negative']}/{len(pending_chunks)} 个块判为不相关，"
+                  f"节省 {triage_stats['avoided']['calls']} 次提取调用，约 {triage_stats['avoided']['tokens']} Token。")
 
         print(f"\n   提取完成。在 {len(extracted_data)} 个结果中可能包含有效信息（包括错误标记）。")
-        return {"extracted_data": extracted_data}
+        return {"extracted_data": extracted_data, "relevance_stats": relevance_stats, "triage_stats": triage_stats}
 
     def _synthesize_answer_node(self, state: AgentState) -> Dict[str, Any]:
         """节点：最终合成答案。"""
         print("\n", "--- 运行节点：synthesize_answer_node ---")
         if state.get("error_message"): return {}
+        if state.get('checkpoint'): state['checkpoint'].set_status('SYNTHESIZING', current_step='synthesize_answer')
         user_query = state['user_query']
         extracted_data = state.get('extracted_data')
         intent = state.get('intent', '回答用户问题')  # 使用从state获取的意图
@@ -433,6 +924,7 @@ class ChatSplitterAgent:
             print(f"\n   注意到在提取阶段存在 {len(error_markers)} 个错误。")
 
         # 如果合并后的文本超出最大字节数，则进行递归融合
+        fusion_levels: List[Dict[str, Any]] = []
         if len(combined_context.encode(self.byte_encoding)) > self.max_bytes_per_chunk:
             print(f"\n   提取数据过长 ({len(combined_context.encode(self.byte_encoding))} bytes)，启动递归融合...")
             # 定义融合指令模板
@@ -444,7 +936,9 @@ class ChatSplitterAgent:
                 combined_context = self._recursive_fuse(
                     valid_extracted_data,  # 只融合有效数据
                     self.max_bytes_pre_recursive_fuse_chunk,
-                    formatted_fusion_template  # 传递包含 user_query 的模板字符串
+                    formatted_fusion_template,  # 传递包含 user_query 的模板字符串
+                    fusion_levels=fusion_levels,
+                    on_level=lambda stats: self._emit(state, "fusion_level", **stats),
                 )
                 print(f"\n   递归融合后的最终字节数: {len(combined_context.encode(self.byte_encoding))}")
                 if len(combined_context.encode(self.byte_encoding)) > self.max_bytes_per_chunk:
@@ -480,7 +974,7 @@ class ChatSplitterAgent:
                 final_answer += "\n\n[请注意：在处理原始聊天记录的过程中，部分数据块未能成功提取信息，这可能影响答案的完整性。]"
 
             print("\n   已生成最终答案。")
-            return {"final_answer": final_answer}
+            return {"final_answer": final_answer, "fusion_levels": fusion_levels}
 
         except Exception as e:
             error_msg = f"最终答案合成过程中失败：{e}"
@@ -491,9 +985,11 @@ class ChatSplitterAgent:
             state['error_message'] = (state.get('error_message') or "") + f"; {error_msg}"
             # 尝试返回一个错误消息给用户，包含之前的错误（如果有）
             final_error_message = state.get("error_message", "发生未知错误")
-            return {"final_answer": f"抱歉，在生成最终答案时遇到问题：{final_error_message}"}
+            return {"final_answer": f"抱歉，在生成最终答案时遇到问题：{final_error_message}", "fusion_levels": fusion_levels}
 
-    def _recursive_fuse(self, chunks: List[str], max_bytes: int, fusion_directive_template: str, level: int = 0) -> str:
+    def _recursive_fuse(self, chunks: List[str], max_bytes: int, fusion_directive_template: str, level: int = 0,
+                        fusion_levels: List[Dict[str, Any]] = None,
+                        on_level: Callable[[Dict[str, Any]], None] = None) -> str:
         """
         递归融合函数，将多个摘要逐轮融合为一个摘要，确保最终文本不超过指定的最大字节数。
 
@@ -502,11 +998,16 @@ class ChatSplitterAgent:
             max_bytes: 模型允许的最大输入字节数（包括提示）。
             fusion_directive_template: 融合指令的字符串模板，应包含 {context} 占位符。
             level: 当前递归层数。
+            fusion_levels: 每层的统计会追加到此列表中。
+            on_level: 每层融合完成后以该层的统计为参数调用。
 
         返回:
             融合后的最终摘要文本。
         """
         print(f"\n   递归融合 - 层级 {level} - 输入块数: {len(chunks)}")
+        if fusion_levels is None:
+            fusion_levels = []
+        level_start = time.monotonic()
         # 增加递归深度限制
         if level > 7:  # 稍微增加深度限制
             print(f"\n   警告：递归融合层数超过限制（{level}），返回当前合并结果。")
@@ -548,7 +1049,11 @@ class ChatSplitterAgent:
             try:
                 # 调用链的 invoke，传入包含模板所需变量的字典
                 # 模板现在只需要 'context'，因为 user_query 已包含在模板字符串中
+                self.rate_limiter.acquire(self.token_counter.count(fusion_directive_template) + self.token_counter.count(all_text))
                 merged = fusion_chain.invoke({"context": all_text})
+                fusion_levels.append({"level": level, "inputs": len(chunks), "groups": 1, "errors": 0,
+                                      "seconds": round(time.monotonic() - level_start, 3)})
+                if on_level: on_level(fusion_levels[-1])
                 print(f"\n   递归融合 - 层级 {level} - 最后融合完成。")
                 return merged
             except Exception as e:
@@ -604,7 +1109,8 @@ class ChatSplitterAgent:
             # 需要考虑加入当前块的字节数和分隔符字节数（如果不是第一个块）
             bytes_if_added = current_len_bytes + chunk_bytes + (separator_bytes if current_group else 0)
 
-            if bytes_if_added > effective_max_bytes_for_group and current_group:
+            group_full = self.fusion_fan_in is not None and len(current_group) >= self.fusion_fan_in
+            if (bytes_if_added > effective_max_bytes_for_group or group_full) and current_group:
                 # 当前分组已满，保存
                 grouped_chunks.append("\n\n---\n\n".join(current_group))
                 print(
@@ -631,37 +1137,45 @@ class ChatSplitterAgent:
         elif not grouped_chunks and not chunks:  # 如果输入为空
             return ""  # 返回空字符串
 
-        fused_chunks = []
-        print(f"\n   递归融合 - 层级 {level} - 开始融合 {len(grouped_chunks)} 个分组...")
-        min_interval = 60.0 / self.rpm_limit if self.rpm_limit > 0 else 0  # 应用速率限制
-        last_call_time = time.monotonic()
+        print(f"\n   递归融合 - 层级 {level} - 开始并发融合 {len(grouped_chunks)} 个分组（并发数：{self.max_concurrency}）...")
+        prompt_only_tokens = self.token_counter.count(fusion_directive_template)
 
-        for i, group in enumerate(grouped_chunks):
+        def fuse_group(i: int, group: str) -> str:
             print(f"\n     融合分组 {i + 1}/{len(grouped_chunks)}...")
-            try:
-                current_time = time.monotonic()
-                elapsed = current_time - last_call_time
-                if elapsed < min_interval:
-                    wait_time = min_interval - elapsed
-                    print(f"\n       等待 {wait_time:.2f} 秒以避免速率限制...")
-                    time.sleep(wait_time)
-
-                # 调用融合链
-                group_summary = fusion_chain.invoke({"context": group})
-                last_call_time = time.monotonic()
-                fused_chunks.append(group_summary)
-                print(f"\n     分组 {i + 1} 融合完成。")
-            except Exception as e:
-                error_msg = f"递归融合 - 层级 {level} - 融合分组 {i + 1} 调用LLM失败: {e}"
-                import traceback
-                traceback_str = traceback.format_exc()
-                print(f"\n   错误：{error_msg}\nTraceback:\n{traceback_str}")
-                last_call_time = time.monotonic()
-                # 记录错误并继续，避免整个流程失败
-                fused_chunks.append(f"[融合分组 {i + 1} 时出错: {e}]")
+            wait_time = self.rate_limiter.acquire(prompt_only_tokens + self.token_counter.count(group))
+            if wait_time > 0:
+                print(f"\n       分组 {i + 1} 等待 {wait_time:.2f} 秒以避免速率限制...")
+            group_summary = fusion_chain.invoke({"context": group})
+            print(f"\n     分组 {i + 1} 融合完成。")
+            return group_summary
+
+        # 按分组顺序保存结果，保证下一层的输入顺序与时间顺序一致
+        fused_chunks: List[Optional[str]] = [None] * len(grouped_chunks)
+        errors = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="fuse") as executor:
+            futures = {executor.submit(fuse_group, i, group): i for i, group in enumerate(grouped_chunks)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    fused_chunks[i] = future.result()
+                except Exception as e:
+                    error_msg = f"递归融合 - 层级 {level} - 融合分组 {i + 1} 调用LLM失败: {e}"
+                    import traceback
+                    traceback_str = traceback.format_exc()
+                    print(f"\n   错误：{error_msg}\nTraceback:\n{traceback_str}")
+                    # 记录错误并继续，避免整个流程失败
+                    fused_chunks[i] = f"[融合分组 {i + 1} 时出错: {e}]"
+                    errors += 1
+
+        level_seconds = time.monotonic() - level_start
+        fusion_levels.append({"level": level, "inputs": len(chunks), "groups": len(grouped_chunks), "errors": errors,
+                              "seconds": round(level_seconds, 3)})
+        if on_level: on_level(fusion_levels[-1])
+        print(f"\n   递归融合 - 层级 {level} - {len(grouped_chunks)} 个分组融合完成，耗时 {level_seconds:.2f} 秒。")
 
         # 递归调用，处理融合后的块
-        return self._recursive_fuse(fused_chunks, max_bytes, fusion_directive_template, level + 1)
+        return self._recursive_fuse(fused_chunks, max_bytes, fusion_directive_template, level + 1, fusion_levels,
+                                    on_level)
 
     def _handle_error_node(self, state: AgentState) -> Dict[str, Any]:
         """节点：处理错误。"""
@@ -697,6 +1211,7 @@ class ChatSplitterAgent:
 
         # 添加节点
         workflow.add_node("understand_query", self._understand_query_node)
+        workflow.add_node("noise_filter", self._noise_filter_node)
         workflow.add_node("chunker", self._chunk_node)
         workflow.add_node("extract_info", self._extract_info_node)
         workflow.add_node("synthesize_answer", self._synthesize_answer_node)
@@ -710,6 +1225,11 @@ class ChatSplitterAgent:
         workflow.add_conditional_edges(
             "understand_query",
             self._should_continue,
+            {"continue": "noise_filter", "error": "handle_error"}
+        )
+        workflow.add_conditional_edges(
+            "noise_filter",
+            self._should_continue,
             {"continue": "chunker", "error": "handle_error"}
         )
         workflow.add_conditional_edges(
@@ -736,35 +1256,163 @@ class ChatSplitterAgent:
         return workflow.compile()
 
     # --- 公共执行方法 ---
-    def run(self, _chat_data: Dict[str, Any], user_query: str) -> Dict[str, Any]:
+    def run(self, _chat_data: Dict[str, Any], user_query: str, conversation_id: Optional[Union[int, str]] = None,
+            triggering_message_id: Optional[str] = None,
+            event_sink: Callable[[Dict[str, Any]], None] = None, plan: Optional[Dict[str, Any]] = None,
+            precomputed_summaries: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         执行 Agent 来处理聊天数据并回答问题。
 
         Args:
             _chat_data: 包含 'meta' 和 'data' 的聊天记录字典。'data'应为消息列表。
             user_query: 用户的问题字符串。
+            conversation_id: 关联的对话 ID。传入时会在 `chat_splitter_task` 中创建任务并逐块保存断点，
+                崩溃后可以通过 `resume(task_id)` 继续执行。
+            triggering_message_id: 触发此任务的用户消息 ID。
+            event_sink: 进度事件回调，事件格式参考 `stream`。
+            plan: 预先确定的查询规划，包含 intent、entities、chunk_processing_prompt，传入时跳过查询理解。
+                用于按固定指令批量处理聊天记录，例如 `HistorySummarizer` 生成按天摘要。
+            precomputed_summaries: 预计算的摘要文本，与分块提取的结果一起参与合成。此时 'data' 可以为空列表。
 
         Returns:
-            包含最终状态的字典，其中 'final_answer' 是给用户的答案或错误信息。
+            包含最终状态的字典，其中 'final_answer' 是给用户的答案或错误信息。持久化任务时包含 'task_id'。
         """
         if not isinstance(_chat_data, dict) or 'data' not in _chat_data:
             raise ValueError("Invalid chat_data format. Expected a dict with a 'data' key.")
         if not isinstance(user_query, str) or not user_query.strip():
             raise ValueError("user_query must be a non-empty string.")
 
-        initial_state: AgentState = {
+        initial_state = self._initial_state(_chat_data, user_query, event_sink)
+        if plan:
+            initial_state.update({key: plan.get(key) for key in ("intent", "entities", "chunk_processing_prompt")})
+        if precomputed_summaries:
+            initial_state['precomputed_summaries'] = list(precomputed_summaries)
+        if conversation_id is not None:
+            initial_state['checkpoint'] = ChatSplitterCheckpoint.create(
+                chat_data=_chat_data,
+                user_query=user_query,
+                conversation_id=conversation_id,
+                triggering_message_id=triggering_message_id,
+                task_db=self.task_db,
+            )
+        return self._execute(initial_state)
+
+    def resume(self, task_id: str, event_sink: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """
+        从断点继续执行任务，已完成的块直接复用保存的提取结果。
+        恢复时按断点记录中的分块上限重新分块；块边界仍与记录不一致时（例如修改了噪声过滤或渲染参数），
+        在提取之前丢弃已完成的块结果，全部重新提取。
+
+        Args:
+            task_id: `run` 返回的 task_id。
+            event_sink: 进度事件回调，事件格式参考 `stream`。
+
+        Returns:
+            与 `run` 相同的最终状态字典。
+        """
+        task = self.task_db.get_task(task_id)
+        if task is None:
+            raise ValueError(f"任务 {task_id} 不存在。")
+
+        checkpoint = ChatSplitterCheckpoint(task_id, task_db=self.task_db)
+        if task.get('status') == 'COMPLETED' and task.get('final_answer'):
+            print(f"\n   任务 {task_id} 已完成，直接返回保存的答案。")
+            return {"task_id": task_id, "final_answer": task['final_answer'], "error_message": None}
+
+        plan, total_chunks, completed_chunks = checkpoint.load()
+        initial_state = self._initial_state(checkpoint.load_input(task), task['user_query'], event_sink)
+        initial_state['checkpoint'] = checkpoint
+        if plan:
+            initial_state.update({key: plan.get(key) for key in ("intent", "entities", "chunk_processing_prompt")})
+            initial_state['completed_chunks'] = completed_chunks
+            # 旧版本的断点没有分块记录，只能按块数校验
+            initial_state['chunking'] = checkpoint.chunking or (
+                {"chunks": None, "total_chunks": total_chunks} if total_chunks is not None else None)
+        self.task_db.increment_retry_count(task_id)
+        print(f"\n   恢复任务 {task_id}：已完成 {len(completed_chunks)}/{total_chunks or '?'} 个块。")
+
+        return self._execute(initial_state)
+
+    def stream(self, _chat_data: Dict[str, Any] = None, user_query: str = None,
+               conversation_id: Optional[Union[int, str]] = None, triggering_message_id: Optional[str] = None,
+               task_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        在后台线程中执行 Agent，并以生成器的形式实时产出进度事件。传入 task_id 时恢复该任务，忽略其他参数。
+
+        每个事件是一个字典，'event' 字段为事件类型：
+            - plan_ready: 查询理解完成，包含 intent、entities、restored。
+            - chunks_ready: 分块完成，包含 total_chunks、chunk_stats。
+            - chunks_skipped: 相关性预筛选跳过的块，包含 chunk_indexes。
+            - chunk_started: 开始提取某个块，包含 chunk_index、total_chunks。
+            - chunk_done: 块提取完成，包含 chunk_index、relevant、extraction (相关时为提取结果)、resumed，出错时包含 error。
+            - fusion_level: 递归融合完成一层，包含 level、inputs、groups、errors、seconds。
+            - final_answer: 执行结束，包含 final_answer、error_message、task_id 以及噪声过滤、分块、预筛选、初筛与融合统计。
+            - error: 参数校验等执行前的错误，包含 message。
+
+        调用方中途停止迭代时，后台线程会继续执行完当前任务，持久化任务可以之后通过 task_id 取回结果。
+        """
+        events: Queue = Queue()
+        finished = object()
+
+        def worker():
+            try:
+                if task_id is not None:
+                    final_state = self.resume(task_id, event_sink=events.put)
+                else:
+                    final_state = self.run(_chat_data, user_query, conversation_id=conversation_id,
+                                           triggering_message_id=triggering_message_id, event_sink=events.put)
+                events.put({
+                    "event": "final_answer",
+                    "final_answer": final_state.get('final_answer'),
+                    "error_message": final_state.get('error_message'),
+                    "task_id": final_state.get('task_id'),
+                    "chunk_stats": final_state.get('chunk_stats'),
+                    "noise_filter_stats": final_state.get('noise_filter_stats'),
+                    "relevance_stats": final_state.get('relevance_stats'),
+                    "triage_stats": final_state.get('triage_stats'),
+                    "fusion_levels": final_state.get('fusion_levels'),
+                })
+            except Exception as e:
+                events.put({"event": "error", "message": str(e)})
+            finally:
+                events.put(finished)
+
+        Thread(target=worker, name="chat-splitter-stream", daemon=True).start()
+        while True:
+            event = events.get()
+            if event is finished:
+                return
+            yield event
+
+    @staticmethod
+    def _initial_state(_chat_data: Dict[str, Any], user_query: str,
+                       event_sink: Callable[[Dict[str, Any]], None] = None) -> AgentState:
+        return {
             "input_dict": _chat_data,
             "user_query": user_query,
             "intent": None,
             "entities": None,
             "chunk_processing_prompt": None,
-            "messages": [],
+            "filtered_data": None,
+            "removed_messages": {},
+            "noise_filter_stats": None,
+            "arena": None,
             "message_chunks": [],
+            "chunk_stats": None,
+            "precomputed_summaries": [],
             "extracted_data": [],
+            "fusion_levels": [],
+            "relevance_stats": None,
+            "triage_stats": None,
             "final_answer": None,
             "error_message": None,
+            "checkpoint": None,
+            "completed_chunks": {},
+            "chunking": None,
+            "event_sink": event_sink,
         }
 
+    def _execute(self, initial_state: AgentState) -> Dict[str, Any]:
         print("\n\n--- 开始Agent执行 ---")
         final_state = {}
         try:
@@ -789,10 +1437,19 @@ class ChatSplitterAgent:
         if 'error_message' not in final_state:
             final_state['error_message'] = None  # 或根据情况设置
 
+        checkpoint = initial_state.get('checkpoint')
+        if checkpoint:
+            final_state['task_id'] = checkpoint.task_id
+            if final_state.get('error_message'):
+                checkpoint.set_status('FAILED', error_message=final_state['error_message'])
+            else:
+                checkpoint.set_status('COMPLETED', current_step='synthesize_answer',
+                                      final_answer=final_state['final_answer'])
+
         return final_state
 
 # TODO:
-#   1. 增加任务表格绑定拓展断点重试
+#   1. 增加任务表格绑定拓展断点重试  -- 已通过 ChatSplitterCheckpoint 与 resume(task_id) 实现
 #   2. 使用 Celery 或 RQ创建任务队列系统 `pip install celery redis`
 #   3. 最后融合总结时，若是得出的chunk总结又超出了融合模型的最大输入。又要分块？  -- 2025/05/12 使用递归融合方案，待接入主程序
 #       CREATE TABLE IF NOT EXISTS long_tasks (
@@ -813,4 +1470,4 @@ class ChatSplitterAgent:
 #             updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 #         );
 #         -- 可以为 conversation_id 创建索引以加速查询
-#   4. 考虑把intermediate_results指向到JSONL中，优化SQLite的性能
+#   4. 考虑把intermediate_results指向到JSONL中，优化SQLite的性能  -- 已实现，见 intermediate_results_ref
@@ -0,0 +1,149 @@
+import json
+import os
+from os import path
+from threading import Lock
+from typing import Dict, Any, List, Optional, Tuple
+from uuid import uuid4
+
+from webot.databases.chat_splitter_database import ChatSplitterDatabase
+from webot.utils.project_path import DATA_PATH
+
+TASKS_PATH = path.join(DATA_PATH, 'tasks')
+
+
+class ChatSplitterCheckpoint:
+    """
+    `ChatSplitterAgent` 任务的断点记录。
+
+    - 输入数据保存为 `<task_id>_input.json`，通过 `input_data_ref` 关联到任务表。
+    - 规划结果、分块结果与每个块的提取结果逐行追加到 `<task_id>.jsonl`，通过 `intermediate_results_ref` 关联到任务表。
+      块的提取结果属于它之前最近的一条分块记录，分块变化后之前的块结果不再复用。
+    - 每写入一个块，通过 `update_task_progress` 把连续完成的最大块索引写入 `processed_chunk_index`。
+    """
+
+    def __init__(self, task_id: str, task_db: ChatSplitterDatabase = None, task_dir: str = TASKS_PATH):
+        self.task_id = task_id
+        self.task_db = task_db or ChatSplitterDatabase()
+        self.input_path = path.join(task_dir, f"{task_id}_input.json")
+        self.results_path = path.join(task_dir, f"{task_id}.jsonl")
+        self._completed_indexes = set()
+        self._lock = Lock()
+        #: 最近一次保存的分块结果，由 `load` 读取，参考 `save_chunking`
+        self.chunking: Optional[Dict[str, Any]] = None
+        os.makedirs(task_dir, exist_ok=True)
+
+    @classmethod
+    def create(cls, chat_data: Dict[str, Any], user_query: str, conversation_id: str,
+               triggering_message_id: str = None, task_db: ChatSplitterDatabase = None) -> "ChatSplitterCheckpoint":
+        """
+        创建新的任务记录，并把输入数据写入文件。
+        :param chat_data: 聊天记录字典
+        :param user_query: 用户的原始问题
+        :param conversation_id: 关联的对话 ID
+        :param triggering_message_id: 触发任务的消息 ID
+        :param task_db: 任务数据库
+        :return: ChatSplitterCheckpoint
+        """
+        task_db = task_db or ChatSplitterDatabase()
+        checkpoint = cls(task_id=uuid4().hex, task_db=task_db)
+        with open(checkpoint.input_path, 'w', encoding='utf-8') as fw:
+            json.dump(chat_data, fw, ensure_ascii=False)
+        task_db.create_task(
+            conversation_id=str(conversation_id),
+            triggering_message_id=triggering_message_id,
+            user_query=user_query,
+            input_data_ref=checkpoint.input_path,
+            task_id=checkpoint.task_id,
+        )
+        task_db.update_task_progress(checkpoint.task_id, processed_chunk_index=-1,
+                                     intermediate_results_ref=checkpoint.results_path)
+        return checkpoint
+
+    def load_input(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        读取任务的输入数据，优先使用 `input_data_ref` 指向的文件。
+        :param task: `ChatSplitterDatabase.get_task` 返回的任务字典
+        :return: 聊天记录字典
+        """
+        input_ref = task.get('input_data_ref')
+        if input_ref and path.exists(input_ref):
+            with open(input_ref, 'r', encoding='utf-8') as fr:
+                return json.load(fr)
+        if task.get('input_data_json'):
+            return json.loads(task['input_data_json'])
+        raise FileNotFoundError(f"任务 {self.task_id} 的输入数据不存在。")
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], Optional[int], Dict[int, Optional[str]]]:
+        """
+        读取已经保存的规划与块提取结果。文件末尾因崩溃写了一半的行会被忽略。
+        :return: (规划结果, 总块数, {块索引: 提取结果})
+        """
+        plan, total_chunks, completed = None, None, {}
+        if not path.exists(self.results_path):
+            return plan, total_chunks, completed
+
+        with open(self.results_path, 'r', encoding='utf-8') as fr:
+            for line in fr:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('type') == 'plan':
+                    plan = record.get('plan')
+                elif record.get('type') == 'chunking':
+                    # 重新分块后，之前按旧块索引保存的结果不再对应
+                    self.chunking = record
+                    total_chunks, completed = len(record.get('chunks') or []), {}
+                elif record.get('type') == 'chunk':
+                    completed[record['chunk_index']] = record.get('result')
+                    total_chunks = record.get('total_chunks', total_chunks)
+
+        self._completed_indexes = set(completed)
+        return plan, total_chunks, completed
+
+    def _append(self, record: Dict[str, Any]):
+        with open(self.results_path, 'a', encoding='utf-8') as fa:
+            fa.write(json.dumps(record, ensure_ascii=False) + '\n')
+            fa.flush()
+            os.fsync(fa.fileno())
+
+    def save_plan(self, plan: Dict[str, Any]):
+        """保存查询理解阶段的规划结果，恢复时复用，保证前后块使用同一个提取提示。"""
+        with self._lock:
+            self._append({"type": "plan", "plan": plan})
+
+    def save_chunking(self, size_unit: str, limit: int, chunks: List[Tuple[int, int]]):
+        """
+        保存分块使用的单位、生效的分块上限与各块的索引范围。恢复时使用相同的上限重新分块，
+        自适应分块上限在两次执行之间变化也不会改变块边界。
+        :param size_unit: bytes 或 tokens
+        :param limit: 生效的分块上限
+        :param chunks: 各块的 [start, end) 索引范围
+        """
+        record = {"type": "chunking", "size_unit": size_unit, "limit": limit,
+                  "chunks": [[start, end] for start, end in chunks]}
+        with self._lock:
+            self._append(record)
+            self._completed_indexes = set()
+            self.chunking = record
+
+    def record_chunk(self, chunk_index: int, result: Optional[str], total_chunks: int):
+        """
+        保存单个块的提取结果并更新任务进度。
+        :param chunk_index: 块索引
+        :param result: 模型返回的原始提取结果，空块为 None
+        :param total_chunks: 总块数
+        """
+        with self._lock:
+            self._append({"type": "chunk", "chunk_index": chunk_index, "total_chunks": total_chunks, "result": result})
+            self._completed_indexes.add(chunk_index)
+            processed_chunk_index = -1
+            while processed_chunk_index + 1 in self._completed_indexes:
+                processed_chunk_index += 1
+        self.task_db.update_task_progress(self.task_id, processed_chunk_index=processed_chunk_index,
+                                          total_chunks=total_chunks)
+
+    def set_status(self, status: str, current_step: str = None, final_answer: str = None, error_message: str = None):
+        """更新任务状态，状态取值参考 `chat_splitter_task` 表。"""
+        self.task_db.update_task_status(self.task_id, status, current_step=current_step, final_answer=final_answer,
+                                        error_message=error_message)
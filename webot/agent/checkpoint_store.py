@@ -0,0 +1,281 @@
+import time
+import zlib
+from datetime import datetime
+from os import path
+from sqlite3 import Connection, connect
+from threading import Event, Lock, Thread
+from typing import Any, Dict, Optional, Tuple
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from webot.utils.project_path import DATA_PATH
+
+CHECKPOINT_DB_PATH = path.join(DATA_PATH, 'databases', 'webot_checkpoint.db')
+
+# 压缩后的类型后缀，例如 msgpack+zlib
+_COMPRESSED_SUFFIX = "+zlib"
+
+
+class CompressedSerializer:
+    """
+    在 JsonPlusSerializer 外层按大小压缩：序列化结果超过 threshold 字节时用 zlib 压缩，并在类型后追加 +zlib。
+    读取时兼容未压缩的旧数据。工具返回的聊天记录等大段文本通常能压缩到原来的 1/3 以下。
+    """
+
+    def __init__(self, serde=None, threshold: int = 4096, level: int = 6):
+        """
+        :param serde: 被包装的序列化器，默认为 JsonPlusSerializer
+        :param threshold: 超过该字节数才压缩
+        :param level: zlib 压缩级别
+        """
+        self.serde = serde or JsonPlusSerializer()
+        self.threshold = threshold
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        return compress_typed(type_, data, self.threshold, self.level)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_ and type_.endswith(_COMPRESSED_SUFFIX):
+            return self.serde.loads_typed((type_[:-len(_COMPRESSED_SUFFIX)], zlib.decompress(payload)))
+        return self.serde.loads_typed(data)
+
+
+def compress_typed(type_: Optional[str], data: Optional[bytes], threshold: int = 4096,
+                   level: int = 6) -> Tuple[Optional[str], Optional[bytes]]:
+    """压缩超过 threshold 字节的序列化结果，压缩后没有变小时保持原样。"""
+    if type_ is None or not data or len(data) <= threshold or type_.endswith(_COMPRESSED_SUFFIX):
+        return type_, data
+    compressed = zlib.compress(data, level)
+    if len(compressed) >= len(data):
+        return type_, data
+    return f"{type_}{_COMPRESSED_SUFFIX}", compressed
+
+
+_SAVER: Optional[SqliteSaver] = None
+_SAVER_LOCK = Lock()
+
+
+def get_checkpointer() -> SqliteSaver:
+    """
+    获取进程内共享的 SqliteSaver，大的检查点数据压缩存储。
+    SqliteSaver 内部用锁串行化对连接的访问，可以在多个 WeBotAgent 之间共享。
+    """
+    global _SAVER
+    with _SAVER_LOCK:
+        if _SAVER is None:
+            conn = connect(CHECKPOINT_DB_PATH, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=5000")
+            _SAVER = SqliteSaver(conn=conn, serde=CompressedSerializer())
+        return _SAVER
+
+
+class CheckpointRetention:
+    """
+    LangGraph 检查点数据库的保留策略：每个线程（会话）只保留最新的 keep_last 个检查点，
+    删除会话时删除对应线程，并定期把旧的大数据压缩、VACUUM 回收空间。
+    """
+
+    def __init__(self, db_path: str = CHECKPOINT_DB_PATH, keep_last: int = 20, compress_threshold: int = 4096):
+        """
+        :param db_path: 检查点数据库路径
+        :param keep_last: 每个线程保留的检查点数量，继续对话只需要最新的检查点
+        :param compress_threshold: 压缩旧数据时的大小阈值（字节）
+        """
+        self.db_path = db_path
+        self.keep_last = keep_last
+        self.compress_threshold = compress_threshold
+
+    def _connect(self) -> Connection:
+        conn = connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _has_tables(self, conn: Connection) -> bool:
+        return conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('checkpoints', 'writes')"
+        ).fetchone()[0] == 2
+
+    def _prune(self, conn: Connection, thread_id: str = None) -> Dict[str, int]:
+        thread_filter, params = ("WHERE thread_id = ?", (thread_id,)) if thread_id is not None else ("", ())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # checkpoint_id 是按时间递增的 UUID，倒序即从新到旧
+            checkpoints = conn.execute(f"""
+            DELETE FROM checkpoints WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                    ) AS row_number
+                    FROM checkpoints {thread_filter}
+                ) WHERE row_number > ?
+            )
+            """, (*params, self.keep_last)).rowcount
+            writes = conn.execute(f"""
+            DELETE FROM writes WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id
+                AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id
+            ) {"AND thread_id = ?" if thread_id is not None else ""}
+            """, params).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"pruned_checkpoints": checkpoints, "pruned_writes": writes}
+
+    def prune_thread(self, thread_id: int | str) -> Dict[str, int]:
+        """
+        只保留线程最新的 keep_last 个检查点，每轮对话结束后调用。
+        :param thread_id: 线程ID，即会话ID
+        :return: 删除的检查点与写入记录数
+        """
+        conn = self._connect()
+        try:
+            if not self._has_tables(conn):
+                return {"pruned_checkpoints": 0, "pruned_writes": 0}
+            return self._prune(conn, str(thread_id))
+        finally:
+            conn.close()
+
+    def delete_thread(self, thread_id: int | str) -> Dict[str, int]:
+        """
+        删除线程的全部检查点，删除会话时调用。
+        :param thread_id: 线程ID，即会话ID
+        :return: 删除的检查点与写入记录数
+        """
+        conn = self._connect()
+        try:
+            if not self._has_tables(conn):
+                return {"pruned_checkpoints": 0, "pruned_writes": 0}
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                checkpoints = conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),)).rowcount
+                writes = conn.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),)).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return {"pruned_checkpoints": checkpoints, "pruned_writes": writes}
+        finally:
+            conn.close()
+
+    def _compress_existing(self, conn: Connection) -> Dict[str, int]:
+        """把 CompressedSerializer 启用之前写入的大数据压缩存储。"""
+        compressed, saved = 0, 0
+        for table, type_column, value_column in (("checkpoints", "type", "checkpoint"), ("writes", "type", "value")):
+            rows = conn.execute(f"""
+            SELECT rowid, {type_column}, {value_column} FROM {table}
+            WHERE length({value_column}) > ? AND {type_column} IS NOT NULL AND {type_column} NOT LIKE ?
+            """, (self.compress_threshold, f"%{_COMPRESSED_SUFFIX}")).fetchall()
+            for row_id, type_, data in rows:
+                new_type, new_data = compress_typed(type_, data, self.compress_threshold)
+                if new_type == type_:
+                    continue
+                conn.execute(f"UPDATE {table} SET {type_column} = ?, {value_column} = ? WHERE rowid = ?",
+                             (new_type, new_data, row_id))
+                compressed += 1
+                saved += len(data) - len(new_data)
+        return {"compressed_blobs": compressed, "compressed_bytes_saved": saved}
+
+    def _file_size(self) -> int:
+        return sum(path.getsize(file) for file in (self.db_path, f"{self.db_path}-wal") if path.exists(file))
+
+    def compact(self, vacuum: bool = True) -> Dict[str, Any]:
+        """
+        全库整理：按保留策略删除旧检查点，压缩旧的大数据，然后 VACUUM 回收磁盘空间。
+        :param vacuum: 是否执行 VACUUM。VACUUM 期间会阻塞检查点的写入，数据库较大时耗时较长
+        :return: 整理报告，包括删除的记录数与回收的字节数
+        """
+        start = time.monotonic()
+        size_before = self._file_size()
+        report: Dict[str, Any] = {"pruned_checkpoints": 0, "pruned_writes": 0, "compressed_blobs": 0,
+                                  "compressed_bytes_saved": 0}
+        if not path.exists(self.db_path):
+            return {**report, "size_before": 0, "size_after": 0, "reclaimed_bytes": 0, "seconds": 0.0}
+        conn = self._connect()
+        try:
+            if self._has_tables(conn):
+                report.update(self._prune(conn))
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    report.update(self._compress_existing(conn))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            if vacuum:
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        size_after = self._file_size()
+        report.update({
+            "size_before": size_before,
+            "size_after": size_after,
+            "reclaimed_bytes": size_before - size_after,
+            "seconds": round(time.monotonic() - start, 3),
+        })
+        print(f"检查点数据库整理完成：删除 {report['pruned_checkpoints']} 个检查点、{report['pruned_writes']} 条写入，"
+              f"压缩 {report['compressed_blobs']} 条数据，回收 {report['reclaimed_bytes'] / 1024 / 1024:.2f} MB。")
+        return report
+
+
+class CheckpointCompactionScheduler:
+    """
+    后台定时整理检查点数据库。
+    """
+
+    def __init__(self, retention: CheckpointRetention = None, interval_seconds: int = 6 * 3600):
+        """
+        :param retention: 保留策略
+        :param interval_seconds: 两次整理之间的间隔
+        """
+        self.retention = retention or CheckpointRetention()
+        self.interval_seconds = interval_seconds
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self.status: Dict[str, Any] = {"running": False, "last_run": None, "last_report": None, "last_error": None}
+
+    def run_once(self) -> Dict[str, Any]:
+        """立即整理一次，返回整理报告。"""
+        try:
+            report = self.retention.compact()
+        except Exception as e:
+            with self._lock:
+                self.status["last_error"] = str(e)
+            raise
+        with self._lock:
+            self.status["last_run"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.status["last_report"] = report
+            self.status["last_error"] = None
+        return report
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"检查点数据库整理出错：{e}")
+        with self._lock:
+            self.status["running"] = False
+
+    def start(self):
+        """启动后台线程，重复调用不会启动多个线程。"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self.status["running"] = True
+            self._thread = Thread(target=self._loop, name="checkpoint-compaction", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.status)
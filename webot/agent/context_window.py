@@ -0,0 +1,217 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
+
+from webot.databases.conversation_database import ConversationsDatabase
+from webot.llm.token_counter import TokenCounter, get_context_limit, get_token_counter
+from webot.prompts.system_prompts import SystemPrompts
+
+# 无法确定模型上下文窗口时使用的保守值
+DEFAULT_CONTEXT_LIMIT = 32000
+
+
+class ContextWindowManager:
+    """
+    AI 对话的上下文窗口管理，作为 create_react_agent 的 pre_model_hook 使用，只改变发送给模型的消息，
+    不修改检查点中的对话状态，数据库中的完整消息也照常用于前端展示。
+
+    - 工具输出存根：当前这一轮之前的、超过 tool_stub_bytes 字节的工具输出替换为简短的存根。
+    - 滚动摘要：消息超出 Token 预算时，把较早的若干轮对话并入摘要，摘要与已摘要的消息数保存在会话记录中，
+      之后的请求直接复用，只有新移出窗口的消息才需要再次摘要。
+    - 预算兜底：摘要后仍然超出预算（或摘要失败）时，从最早的一轮开始整轮丢弃，保证工具调用与工具结果成对出现。
+    """
+
+    def __init__(self, llm_summary: BaseChatModel = None, model_name: str = None,
+                 conversations_db: ConversationsDatabase = None, token_counter: TokenCounter = None,
+                 context_limit: int = None, context_fill_ratio: float = 0.6, reserved_output_tokens: int = 4096,
+                 system_prompt_tokens: int = 0, recent_ratio: float = 0.5, tool_stub_bytes: int = 2000,
+                 summary_input_chars: int = 2000):
+        """
+        :param llm_summary: 生成滚动摘要的模型，为 None 时不摘要，只按预算丢弃最早的对话
+        :param model_name: 对话模型名称，用于选择 Token 计数器与上下文窗口
+        :param conversations_db: 会话数据库，保存滚动摘要
+        :param token_counter: Token 计数器，默认按 model_name 选择
+        :param context_limit: 模型的上下文窗口（Token），默认按 model_name 查询，未知模型使用 DEFAULT_CONTEXT_LIMIT
+        :param context_fill_ratio: 上下文窗口中用于输入消息的比例
+        :param reserved_output_tokens: 为模型输出预留的 Token 数
+        :param system_prompt_tokens: 系统提示词占用的 Token 数
+        :param recent_ratio: 需要摘要时，保留原文的最近消息占预算的比例，其余较早的消息并入摘要
+        :param tool_stub_bytes: 超过该字节数的旧工具输出替换为存根
+        :param summary_input_chars: 生成摘要时每条消息最多取的字符数
+        """
+        self.llm_summary = llm_summary
+        self.conversations_db = conversations_db or ConversationsDatabase()
+        self.token_counter = token_counter or get_token_counter(model_name)
+        self.context_limit = context_limit or get_context_limit(model_name) or DEFAULT_CONTEXT_LIMIT
+        self.context_fill_ratio = context_fill_ratio
+        self.reserved_output_tokens = reserved_output_tokens
+        self.system_prompt_tokens = system_prompt_tokens
+        self.recent_ratio = recent_ratio
+        self.tool_stub_bytes = tool_stub_bytes
+        self.summary_input_chars = summary_input_chars
+
+    @property
+    def budget(self) -> int:
+        """输入消息（不含系统提示词）的 Token 预算。"""
+        budget = int(self.context_limit * self.context_fill_ratio) - self.reserved_output_tokens - self.system_prompt_tokens
+        return max(budget, 1000)
+
+    @staticmethod
+    def _text(message: BaseMessage) -> str:
+        content = message.content
+        if isinstance(content, list):
+            content = ''.join(part if isinstance(part, str) else str(part.get('text', '')) for part in content)
+        return content or ""
+
+    def count_tokens(self, message: BaseMessage) -> int:
+        # 每条消息额外计算角色与分隔符的开销，工具调用的参数也计入
+        tokens = self.token_counter.count(self._text(message)) + 4
+        tool_calls = getattr(message, 'tool_calls', None)
+        if tool_calls:
+            tokens += self.token_counter.count(str(tool_calls))
+        return tokens
+
+    @staticmethod
+    def _last_human_index(messages: List[BaseMessage]) -> int:
+        for i in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[i], HumanMessage):
+                return i
+        return 0
+
+    def _stub(self, message: ToolMessage) -> ToolMessage:
+        text = self._text(message)
+        size = len(text.encode('utf-8'))
+        head = text[:200].replace('\n', ' ')
+        stub = f"[工具 {message.name or ''} 的输出已省略，原文共 {size} 字节。开头：{head}……如需完整内容请重新调用工具]"
+        return message.model_copy(update={"content": stub})
+
+    def stub_tool_outputs(self, messages: List[BaseMessage], keep_from: int = None) -> List[BaseMessage]:
+        """
+        把 keep_from 之前超过 tool_stub_bytes 字节的工具输出替换为存根。
+        :param messages: 消息列表
+        :param keep_from: 从该下标开始的消息保持原样，默认为最后一条用户消息，即当前这一轮
+        """
+        keep_from = self._last_human_index(messages) if keep_from is None else keep_from
+        return [
+            self._stub(message) if i < keep_from and isinstance(message, ToolMessage)
+                                   and len(self._text(message).encode('utf-8')) > self.tool_stub_bytes else message
+            for i, message in enumerate(messages)
+        ]
+
+    def _summary_message(self, summary: Optional[str]) -> List[BaseMessage]:
+        if not summary:
+            return []
+        return [SystemMessage(content=f"以下是本次对话中较早内容的摘要，较早的原始消息已不在上下文中：\n{summary}")]
+
+    def _render_for_summary(self, messages: List[BaseMessage]) -> str:
+        lines = []
+        for message in messages:
+            text = self._text(message)[:self.summary_input_chars]
+            if isinstance(message, HumanMessage):
+                lines.append(f"用户: {text}")
+            elif isinstance(message, ToolMessage):
+                lines.append(f"工具 {message.name or ''}: {text}")
+            elif isinstance(message, AIMessage):
+                tool_calls = getattr(message, 'tool_calls', None)
+                if tool_calls:
+                    lines.append(f"助手调用工具: {', '.join(str(call.get('name')) for call in tool_calls)}")
+                if text:
+                    lines.append(f"助手: {text}")
+        return "\n".join(lines)
+
+    def _summarize(self, previous_summary: Optional[str], messages: List[BaseMessage]) -> Optional[str]:
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", SystemPrompts.conversation_summary_prompt()),
+            ("human", "请输出更新后的完整摘要。"),
+        ])
+        chain = prompt | self.llm_summary | StrOutputParser()
+        try:
+            summary = chain.invoke({
+                "previous_summary": previous_summary or "（暂无）",
+                "messages": self._render_for_summary(messages),
+            })
+        except Exception as e:
+            print(f"   生成对话摘要失败，按预算丢弃较早的消息：{e}")
+            return None
+        return summary.strip() or None
+
+    def _turn_starts(self, messages: List[BaseMessage], start: int) -> List[int]:
+        return [i for i in range(start, len(messages)) if isinstance(messages[i], HumanMessage)]
+
+    def _drop_oldest_turns(self, messages: List[BaseMessage], budget: int) -> List[BaseMessage]:
+        """从最早的一轮开始整轮丢弃，直到不超过预算，至少保留当前这一轮。"""
+        tokens = [self.count_tokens(message) for message in messages]
+        total = sum(tokens)
+        starts = self._turn_starts(messages, 1)
+        begin = 0
+        for start in starts:
+            if total <= budget:
+                break
+            total -= sum(tokens[begin:start])
+            begin = start
+        fitted = messages[begin:]
+        if total > budget:
+            # 当前这一轮本身超出预算时，除最后一条工具输出外全部替换为存根
+            last_tool = max((i for i, message in enumerate(fitted) if isinstance(message, ToolMessage)), default=-1)
+            fitted = [self._stub(message) if isinstance(message, ToolMessage) and i != last_tool
+                      and len(self._text(message).encode('utf-8')) > self.tool_stub_bytes else message
+                      for i, message in enumerate(fitted)]
+        return fitted
+
+    def fit(self, conversation_id, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """
+        把对话状态中的消息整理为发送给模型的消息。
+        :param conversation_id: 会话ID，用于读写滚动摘要，会话不存在时不摘要
+        :param messages: 对话状态中的全部消息
+        :return: (发送给模型的消息, 统计)
+        """
+        summary, summarized_count = self.conversations_db.get_context_summary(conversation_id)
+        can_summarize = self.llm_summary is not None and summarized_count is not None
+        if summarized_count is None or summarized_count > len(messages):
+            # 会话不存在，或者检查点被清空后重新开始
+            summary, summarized_count = None, 0
+        budget = self.budget
+
+        window = self.stub_tool_outputs(messages[summarized_count:])
+        total = sum(map(self.count_tokens, self._summary_message(summary) + window))
+        summarized_now = 0
+        if total > budget and can_summarize:
+            # 在一轮的开头切分，保留原文的最近几轮不超过预算的 recent_ratio
+            recent_budget = int(budget * self.recent_ratio)
+            last_human = self._last_human_index(messages)
+            cut = last_human
+            for start in self._turn_starts(messages, summarized_count + 1):
+                if sum(map(self.count_tokens, self.stub_tool_outputs(messages[start:]))) <= recent_budget:
+                    cut = start
+                    break
+            if cut > summarized_count:
+                new_summary = self._summarize(summary, self.stub_tool_outputs(messages[summarized_count:cut]))
+                if new_summary:
+                    summarized_now = cut - summarized_count
+                    summary, summarized_count = new_summary, cut
+                    self.conversations_db.update_context_summary(conversation_id, summary, summarized_count)
+                    print(f"   对话 {conversation_id} 较早的 {summarized_now} 条消息已并入滚动摘要。")
+                    window = self.stub_tool_outputs(messages[summarized_count:])
+
+        summary_messages = self._summary_message(summary)
+        summary_tokens = sum(map(self.count_tokens, summary_messages))
+        fitted = self._drop_oldest_turns(window, budget - summary_tokens)
+        stats = {
+            "budget": budget,
+            "state_messages": len(messages),
+            "summarized_messages": summarized_count,
+            "summarized_now": summarized_now,
+            "dropped_messages": len(window) - len(fitted),
+            "input_tokens": summary_tokens + sum(map(self.count_tokens, fitted)),
+        }
+        return summary_messages + fitted, stats
+
+    def pre_model_hook(self, state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        """create_react_agent 的 pre_model_hook，只返回 llm_input_messages，不修改对话状态。"""
+        conversation_id = config.get("configurable", {}).get("thread_id")
+        messages, _ = self.fit(conversation_id, state.get("messages") or [])
+        return {"llm_input_messages": messages}
@@ -0,0 +1,270 @@
+from datetime import datetime, date, timedelta
+from hashlib import sha1
+from threading import Thread, Event, Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from webot.agent.chat_splitter_agent import ChatSplitterAgent
+from webot.databases.global_config_database import HistorySummaryDatabase
+from webot.utils.bm25 import BM25
+
+# 生成按天摘要时使用的固定规划，代替查询理解环节
+DAY_SUMMARY_PLAN = {
+    "intent": "按天归档聊天记录的要点",
+    "entities": {},
+    "chunk_processing_prompt": (
+        "请从以下聊天记录片段中提取当天的要点，供以后回答关于这段聊天的各种问题时检索使用。"
+        "需要覆盖：讨论的话题与结论、发生或约定的事件（时间、地点、参与人）、各参与者的重要发言与观点、"
+        "提到的人名/昵称/关系、链接与文件等分享内容。"
+        "保留关键的发送人、时间和 msg_id，省略寒暄、表情与无实质内容的消息。"
+    ),
+}
+DAY_SUMMARY_QUERY = "概括这一天聊天记录的要点，按话题列出讨论内容、事件、结论与相关的人。"
+
+# 生成按周摘要时使用的固定规划，输入为该周各天的摘要
+WEEK_SUMMARY_PLAN = {
+    "intent": "按周归档聊天记录的要点",
+    "entities": {},
+    "chunk_processing_prompt": DAY_SUMMARY_PLAN["chunk_processing_prompt"],
+}
+WEEK_SUMMARY_QUERY = "根据这一周每天的摘要，概括本周聊天的主要话题、事件、结论与相关的人，并注明发生在哪天。"
+
+
+def _week_start(day: str) -> str:
+    """返回日期所在周的周一，格式 YYYY-MM-DD。"""
+    value = date.fromisoformat(day)
+    return (value - timedelta(days=value.weekday())).isoformat()
+
+
+def _fingerprint(values: List[str]) -> str:
+    return sha1("\n".join(values).encode('utf-8')).hexdigest()
+
+
+def group_messages_by_day(messages: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    按消息的 time 字段 (YYYY-MM-DD HH:MM:SS) 把 write_txt 导出的消息分组到各天。
+    :return: {day: [message, ...]}，按日期升序
+    """
+    days: Dict[str, List[Dict[str, Any]]] = {}
+    for message in messages:
+        day = str(message.get('time') or '')[:10]
+        if len(day) == 10:
+            days.setdefault(day, []).append(message)
+    return dict(sorted(days.items()))
+
+
+def day_fingerprint(messages: List[Dict[str, Any]]) -> str:
+    """一天消息的指纹，消息增加、撤回或内容变化时指纹会变化。"""
+    return _fingerprint([f"{message.get('msg_id')}:{len(str(message.get('content') or ''))}" for message in messages])
+
+
+class HistorySummarizer:
+    """
+    为聊天对象预先生成按天、按周两级摘要，存放在 `HistorySummaryDatabase` 中。
+
+    按天摘要复用 `ChatSplitterAgent` 的分块提取与合成流程，以固定的 DAY_SUMMARY_PLAN 代替查询理解；
+    按周摘要把该周各天的摘要作为预计算摘要交给同一个 Agent 合成。
+    每次构建只重新生成消息指纹发生变化的天，以及包含这些天的周。
+    回答跨度较长的问题时，先用摘要定位相关的天，只对这些天读取原始消息，见 `answer`。
+    """
+
+    def __init__(self, llm: BaseChatModel, llm_extraction: BaseChatModel = None, summary_db: HistorySummaryDatabase = None,
+                 **agent_kwargs):
+        """
+        :param llm: 用于合成摘要与回答问题的模型，同时作为 ChatSplitterAgent 的 llm_query_understanding
+        :param llm_extraction: 用于分块提取的模型，默认使用 llm
+        :param summary_db: 摘要数据库，默认与 MemoryDatabase 使用同一个数据库文件
+        :param agent_kwargs: 传给 ChatSplitterAgent 的其他参数，例如 rate_limiter、max_concurrency
+        """
+        self.agent = ChatSplitterAgent(llm_query_understanding=llm, llm_extraction=llm_extraction, **agent_kwargs)
+        self.summary_db = summary_db or HistorySummaryDatabase()
+
+    def build(self, from_user: str, to_user: str, messages: List[Dict[str, Any]], meta: Dict[str, Any] = None
+              ) -> Dict[str, Any]:
+        """
+        根据导出的消息增量更新摘要。
+        :param from_user: 当前登录账号的wxid
+        :param to_user: 聊天对象的wxid
+        :param messages: write_txt 导出的消息列表，应覆盖需要更新的完整天数
+        :param meta: write_txt 导出的 meta，会随每天的消息一起交给 Agent
+        :return: {"days": 天数, "rebuilt_days": [...], "weeks": 周数, "rebuilt_weeks": [...], "errors": [...]}
+        """
+        days = group_messages_by_day(messages)
+        stats = {"days": len(days), "rebuilt_days": [], "weeks": 0, "rebuilt_weeks": [], "errors": []}
+        if not days:
+            return stats
+
+        first_day, last_day = next(iter(days)), next(reversed(days))
+        stored = self.summary_db.get_day_fingerprints(from_user, to_user, first_day, last_day)
+        for day, day_messages in days.items():
+            fingerprint = day_fingerprint(day_messages)
+            if stored.get(day) == fingerprint:
+                continue
+            print(f"   生成 {to_user} 在 {day} 的摘要（{len(day_messages)} 条消息）...")
+            final_state = self.agent.run({"meta": meta or {}, "data": day_messages}, DAY_SUMMARY_QUERY,
+                                         plan=DAY_SUMMARY_PLAN)
+            if final_state.get('error_message'):
+                stats["errors"].append({"day": day, "error": final_state['error_message']})
+                continue
+            self.summary_db.upsert_day_summary(from_user, to_user, day, final_state['final_answer'],
+                                               len(day_messages), fingerprint)
+            stats["rebuilt_days"].append(day)
+
+        # 周摘要的指纹由组成该周的各天指纹决定，任何一天重新生成都会让所在的周失效
+        weeks: Dict[str, List[Dict[str, Any]]] = {}
+        week_range_end = (date.fromisoformat(_week_start(last_day)) + timedelta(days=6)).isoformat()
+        for summary in self.summary_db.get_day_summaries(from_user, to_user, _week_start(first_day), week_range_end):
+            weeks.setdefault(_week_start(summary['day']), []).append(summary)
+        stats["weeks"] = len(weeks)
+        stored_weeks = self.summary_db.get_week_fingerprints(from_user, to_user, _week_start(first_day), last_day)
+        for week_start, day_summaries in weeks.items():
+            fingerprint = _fingerprint([f"{summary['day']}:{summary['fingerprint']}" for summary in day_summaries])
+            if stored_weeks.get(week_start) == fingerprint:
+                continue
+            final_state = self.agent.run(
+                {"meta": meta or {}, "data": []}, WEEK_SUMMARY_QUERY, plan=WEEK_SUMMARY_PLAN,
+                precomputed_summaries=[f"[{summary['day']}]\n{summary['content']}" for summary in day_summaries])
+            if final_state.get('error_message'):
+                stats["errors"].append({"week_start": week_start, "error": final_state['error_message']})
+                continue
+            self.summary_db.upsert_week_summary(from_user, to_user, week_start, final_state['final_answer'],
+                                                sum(summary['message_count'] for summary in day_summaries),
+                                                fingerprint)
+            stats["rebuilt_weeks"].append(week_start)
+        return stats
+
+    def plan_drill_down(self, from_user: str, to_user: str, user_query: str, start_day: str, end_day: str,
+                        drill_days: int = 3) -> Tuple[List[str], List[str]]:
+        """
+        根据按天摘要与问题的 BM25 相关性，挑选需要读取原始消息的天。
+        :return: (需要读取原始消息的天, 作为预计算摘要参与合成的文本)
+        """
+        day_summaries = self.summary_db.get_day_summaries(from_user, to_user, start_day, end_day)
+        if not day_summaries:
+            return [], []
+        scores = BM25([summary['content'] or "" for summary in day_summaries]).scores(user_query)
+        ranked = sorted(range(len(day_summaries)), key=lambda i: scores[i], reverse=True)
+        drilled = sorted(day_summaries[i]['day'] for i in ranked[:drill_days] if scores[i] > 0)
+
+        # 其余的天优先使用按周摘要；周内有需要读取原始消息的天、或该周超出日期范围时，改用按天摘要
+        drilled_weeks = {_week_start(day) for day in drilled}
+        covered_weeks = [
+            week for week in self.summary_db.get_week_summaries(from_user, to_user, start_day, end_day)
+            if week['week_start'] not in drilled_weeks and
+               (date.fromisoformat(week['week_start']) + timedelta(days=6)).isoformat() <= end_day
+        ]
+        covered_week_starts = {week['week_start'] for week in covered_weeks}
+        summaries = [(week['week_start'], f"[{week['week_start']} 当周摘要]\n{week['content']}")
+                     for week in covered_weeks]
+        summaries += [(summary['day'], f"[{summary['day']} 当日摘要]\n{summary['content']}")
+                      for summary in day_summaries
+                      if summary['day'] not in drilled and _week_start(summary['day']) not in covered_week_starts]
+        summaries.sort(key=lambda item: item[0])
+        return drilled, [text for _, text in summaries]
+
+    def answer(self, from_user: str, to_user: str, user_query: str, chat_data: Dict[str, Any],
+               drill_days: int = 3, **run_kwargs) -> Dict[str, Any]:
+        """
+        先增量更新摘要，再以摘要为主、相关的天读取原始消息来回答问题。
+        :param chat_data: write_txt 导出的聊天记录 (file_type=None)，覆盖问题涉及的时间范围
+        :param drill_days: 最多读取原始消息的天数
+        :param run_kwargs: 传给 `ChatSplitterAgent.run` 的其他参数
+        :return: `ChatSplitterAgent.run` 的最终状态，额外包含 history_summary 统计
+        """
+        messages = chat_data.get('data') or []
+        build_stats = self.build(from_user, to_user, messages, chat_data.get('meta'))
+        days = group_messages_by_day(messages)
+        if not days:
+            return self.agent.run(chat_data, user_query, **run_kwargs)
+
+        drilled, summaries = self.plan_drill_down(from_user, to_user, user_query, next(iter(days)),
+                                                  next(reversed(days)), drill_days=drill_days)
+        # 没有成功生成摘要的天 (例如生成时出错) 同样读取原始消息
+        summarized = set(self.summary_db.get_day_fingerprints(from_user, to_user, next(iter(days)),
+                                                              next(reversed(days))))
+        raw_days = sorted(set(drilled) | (set(days) - summarized))
+        data = [message for day in raw_days for message in days[day]]
+        final_state = self.agent.run({"meta": chat_data.get('meta') or {}, "data": data}, user_query,
+                                     precomputed_summaries=summaries, **run_kwargs)
+        final_state['history_summary'] = {**build_stats, "raw_days": raw_days, "summaries_used": len(summaries)}
+        return final_state
+
+
+class HistorySummaryScheduler:
+    """
+    后台定时为活跃的聊天对象增量生成摘要。
+    """
+
+    def __init__(self, summarizer: HistorySummarizer, bot, interval_seconds: int = 3600, active_days: int = 7,
+                 lookback_days: int = 30, min_messages: int = 20):
+        """
+        :param summarizer: HistorySummarizer
+        :param bot: 已登录的 WeBot 实例
+        :param interval_seconds: 两轮构建之间的间隔
+        :param active_days: 最近多少天内有消息的聊天对象视为活跃
+        :param lookback_days: 每轮为活跃的聊天对象检查最近多少天的消息
+        :param min_messages: 活跃期内消息数少于该值的聊天对象不生成摘要
+        """
+        self.summarizer = summarizer
+        self.bot = bot
+        self.interval_seconds = interval_seconds
+        self.active_days = active_days
+        self.lookback_days = lookback_days
+        self.min_messages = min_messages
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self.status: Dict[str, Any] = {"running": False, "last_run": None, "current_talker": None, "talkers": {}}
+
+    def run_once(self):
+        """执行一轮构建。"""
+        from_user = self.bot.call_api('/api/userInfo').get('data', {}).get('wxid')
+        now = datetime.now()
+        since = int((now - timedelta(days=self.active_days)).timestamp())
+        start_time = (now - timedelta(days=self.lookback_days)).strftime('%Y-%m-%d 00:00:00')
+        for talker in self.bot.get_active_talkers(since, min_messages=self.min_messages):
+            if self._stop.is_set():
+                return
+            wxid = talker['wxid']
+            with self._lock:
+                self.status["current_talker"] = wxid
+            try:
+                chat_data = self.bot.export_message_file(wxid=wxid, start_time=start_time, export_type=None)
+                stats = self.summarizer.build(from_user, wxid, chat_data.get('data') or [], chat_data.get('meta'))
+            except Exception as e:
+                print(f"   生成 {wxid} 的历史摘要失败：{e}")
+                stats = {"errors": [str(e)]}
+            with self._lock:
+                self.status["talkers"][wxid] = {**stats, "updated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        with self._lock:
+            self.status["current_talker"] = None
+            self.status["last_run"] = now.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"历史摘要构建出错：{e}")
+            self._stop.wait(self.interval_seconds)
+        with self._lock:
+            self.status["running"] = False
+
+    def start(self):
+        """启动后台线程，重复调用不会启动多个线程。"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self.status["running"] = True
+            self._thread = Thread(target=self._loop, name="history-summary", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台线程，当前聊天对象处理完后退出。"""
+        self._stop.set()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.status, "talkers": dict(self.status["talkers"])}
@@ -3,6 +3,7 @@ from pathlib import Path
 from base64 import b64encode
 
 from langgraph.prebuilt import create_react_agent
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import HumanMessage, SystemMessage
 from langgraph.graph import MessagesState
 from langchain_core.output_parsers import JsonOutputParser
@@ -18,9 +19,12 @@ class ParseResult(BaseModel):
 
 class ImageRecognitionAgent:
 
-    def __init__(self, model_name: str = "glm-4v-flash", llm_options: dict = {}, webot_port: int = 19001):
-
-        self.llm = LLMFactory.llm(model_name, **llm_options)
+    def __init__(self, model_name: str = "glm-4v-flash", llm_options: dict = {}, webot_port: int = 19001,
+                 llm: BaseChatModel = None):
+        """
+        :param llm: 直接使用的模型实例，例如 `create_endpoint_pool` 创建的端点池，传入时忽略 model_name 与 llm_options
+        """
+        self.llm = llm or LLMFactory.llm(model_name, **llm_options)
 
         self.agent = create_react_agent(
             model=self.llm,
@@ -0,0 +1,296 @@
+import re
+from array import array
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# 块在 arena 中的 [start, end) 索引范围
+ChunkRange = Tuple[int, int]
+
+
+class MessageFields(NamedTuple):
+    """单条消息用于渲染的字段。"""
+
+    #: 发送人的唯一标识，通常是 wxid
+    sender_key: str
+    #: 发送人的完整描述，格式为 [wxid] sender (remark)
+    sender_label: str
+    timestamp: str
+    #: 简化后的消息内容
+    content: str
+    msg_id: str
+    reply_msg_id: Optional[str]
+    mention_count: int
+
+    def _meta(self, msg_ref: str, reply_ref: Optional[str]) -> str:
+        meta_parts = [msg_ref]
+        if reply_ref:
+            meta_parts.append(f"reply_to: {reply_ref}")
+        if self.mention_count > 0:
+            meta_parts.append(f"mentions: {self.mention_count}")
+        return f" ({', '.join(meta_parts)})"
+
+    def render(self) -> str:
+        """完整格式: timestamp - [wxid] sender (remark): content (msg_id: ..., reply_to: ..., mentions: N)"""
+        return f"{self.timestamp} - {self.sender_label}: {self.content}{self._meta(f'msg_id: {self.msg_id}', self.reply_msg_id)}"
+
+    def render_compact(self, alias: str, ordinal: str, reply_ref: Optional[str]) -> str:
+        """紧凑格式: timestamp - [A1]: content (#3, reply_to: #1, mentions: N)"""
+        return f"{self.timestamp} - {alias}: {self.content}{self._meta(ordinal, reply_ref)}"
+
+
+class MessageArena:
+    """
+    预渲染的消息区：每条消息只格式化一次，保存渲染后的字符串，以及紧凑的字节数/Token 数数组。
+    分块只需要保存 (start, end) 索引范围，块文本按需从 arena 中拼接。
+    """
+
+    #: 块内消息之间的分隔符
+    SEPARATOR = "\n"
+
+    def __init__(self, messages: Iterable[Dict], render: Callable[[Dict], str], encoding: str = 'utf-8'):
+        """
+        :param messages: 消息字典列表
+        :param render: 单条消息的渲染函数
+        :param encoding: 计算字节数使用的编码
+        """
+        self.encoding = encoding
+        self.lines: List[str] = [render(message) for message in messages]
+        separator_bytes = len(self.SEPARATOR.encode(encoding))
+        self.byte_sizes = array('I', (len(line.encode(encoding, errors='replace')) + separator_bytes
+                                      for line in self.lines))
+        self.token_sizes: Optional[array] = None
+        self.token_counter_name: Optional[str] = None
+        #: 使用完整格式渲染时的总字节数，用于统计紧凑渲染节省的字节
+        self.full_bytes = sum(self.byte_sizes)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def count_tokens(self, count: Callable[[str], int], counter_name: str = None) -> array:
+        """
+        计算每条消息的 Token 数（含分隔符），同一个计数器只计算一次。
+        :param count: Token 计数函数
+        :param counter_name: 计数器名称，用于判断是否需要重新计算
+        :return: Token 数数组
+        """
+        if self.token_sizes is None or counter_name != self.token_counter_name:
+            self.token_sizes = array('I', (count(line) + 1 for line in self.lines))
+            self.token_counter_name = counter_name
+        return self.token_sizes
+
+    def truncate(self, index: int, max_bytes: int, count: Callable[[str], int] = None) -> None:
+        """
+        截断单条过长的消息，使其字节数不超过 max_bytes，同时更新字节数与 Token 数。
+        :param index: 消息索引
+        :param max_bytes: 截断后的最大字节数（含分隔符）
+        :param count: Token 计数函数，已经计算过 Token 数时用于更新
+        """
+        suffix = "...[截断]"
+        budget = max(0, max_bytes - len((suffix + self.SEPARATOR).encode(self.encoding)))
+        line = self.lines[index].encode(self.encoding, errors='replace')[:budget].decode(self.encoding, errors='ignore')
+        self.lines[index] = line + suffix
+        self.byte_sizes[index] = len(self.lines[index].encode(self.encoding)) + len(self.SEPARATOR.encode(self.encoding))
+        if self.token_sizes is not None and count is not None:
+            self.token_sizes[index] = count(self.lines[index]) + 1
+
+    def text(self, chunk: ChunkRange) -> str:
+        """拼接一个块的文本。"""
+        start, end = chunk
+        return self.SEPARATOR.join(self.lines[start:end])
+
+    def search_lines(self, chunk: ChunkRange) -> List[str]:
+        """块内用于相关性打分的各段文本，不拼接整个块。"""
+        start, end = chunk
+        return self.lines[start:end]
+
+    def size(self, chunk: ChunkRange, unit: str = 'bytes') -> int:
+        """块的总字节数或 Token 数。"""
+        sizes = self.token_sizes if unit == 'tokens' else self.byte_sizes
+        start, end = chunk
+        return sum(sizes[start:end])
+
+    def pack_chunks(self, unit: str, budget: int) -> List[ChunkRange]:
+        """
+        按字节数或 Token 数打包分块。
+        :param unit: 'bytes' 或 'tokens'，使用 tokens 前需要先调用 `count_tokens`
+        :param budget: 每个块的预算
+        :return: 块的索引范围列表
+        """
+        return self.pack(self.token_sizes if unit == 'tokens' else self.byte_sizes, budget)
+
+    def expand(self, chunk: ChunkRange, text: str) -> str:
+        """把模型针对该块输出中的块内代号还原为原始标识，完整格式不需要还原。"""
+        return text
+
+    @staticmethod
+    def pack(sizes: array, budget: int) -> List[ChunkRange]:
+        """
+        按顺序贪心打包，返回每个块的 [start, end) 索引范围。单条超过预算的消息独占一个块。
+        :param sizes: 每条消息的大小
+        :param budget: 每个块的预算
+        :return: 块的索引范围列表
+        """
+        ranges = []
+        start, current = 0, 0
+        for i, size in enumerate(sizes):
+            if current + size > budget and i > start:
+                ranges.append((start, i))
+                start, current = i, 0
+            current += size
+        if start < len(sizes):
+            ranges.append((start, len(sizes)))
+        return ranges
+
+
+class CompactMessageArena(MessageArena):
+    """
+    紧凑渲染的消息区：每个块开头输出一份说话人对照表，把 [wxid] sender (remark) 替换为 [A1]、[A2] 等代号，
+    msg_id 替换为块内序号 #1、#2，引用同一块内的消息时 reply_to 也使用序号。
+    群聊中发送人前缀往往比消息本身还长，紧凑渲染可以明显减少每个块的字节数与块数。
+    代号与序号只在块内有效，通过 `expand` 可以把模型输出中的代号还原为原始的发送人与 msg_id。
+    """
+
+    LEGEND_HEADER = ("说话人代号对照表（消息中的 [A1]、[A2] 等为以下说话人的代号，#n 为本片段内的消息序号；"
+                     "提到说话人时请保留带方括号的代号）：\n")
+    LEGEND_FOOTER = "\n\n"
+
+    # 消息内容中的半角 # 转义为全角，#n 只会作为块内序号出现，模型可以区分序号与正文
+    _ORDINAL_MARKER = "#"
+    _ORDINAL_ESCAPE = "＃"
+
+    # 只还原渲染时输出的序号形式：(#n、reply_to: #n，以及模型自行补上前缀的 msg_id: #n
+    _ORDINAL_PATTERN = re.compile(r'(\(|reply_to: |msg_id: )#(\d+)(?![0-9])')
+    # 代号只按带方括号的形式还原，正文中的 "A4纸"、"型号A2" 等不会被误替换
+    _ALIAS_PATTERN = re.compile(r'\[A(\d+)\]')
+
+    def __init__(self, messages: Iterable[Dict], fields: Callable[[Dict], MessageFields], encoding: str = 'utf-8'):
+        """
+        :param messages: 消息字典列表
+        :param fields: 提取单条消息渲染字段的函数
+        :param encoding: 计算字节数使用的编码
+        """
+        self.encoding = encoding
+        records = [fields(message) for message in messages]
+        separator_bytes = len(self.SEPARATOR.encode(encoding))
+        self.full_bytes = sum(len(record.render().encode(encoding, errors='replace')) + separator_bytes
+                              for record in records)
+        self.records: List[MessageFields] = [
+            record._replace(content=record.content.replace(self._ORDINAL_MARKER, self._ORDINAL_ESCAPE))
+            for record in records
+        ]
+
+        self.legend_labels: Dict[str, str] = {}
+        for record in self.records:
+            self.legend_labels.setdefault(record.sender_key, record.sender_label)
+        # 估算单条消息大小时使用的占位代号与序号，按整个 arena 中可能出现的最大代号与序号取宽度，
+        # 块内的实际代号与序号不会更长
+        self._alias_placeholder = f"[A{'0' * len(str(max(len(self.legend_labels), 1)))}]"
+        self._ordinal_placeholder = self._ORDINAL_MARKER + '0' * len(str(max(len(self.records), 1)))
+
+        self.lines = [self._placeholder_line(record) for record in self.records]
+        self.byte_sizes = array('I', (len(line.encode(encoding, errors='replace')) + separator_bytes
+                                      for line in self.lines))
+        self.token_sizes = None
+        self.token_counter_name = None
+        self.legend_bytes = {key: len(self._legend_line(self._alias_placeholder, label).encode(encoding)) + separator_bytes
+                             for key, label in self.legend_labels.items()}
+        self.legend_tokens: Dict[str, int] = {}
+        self.header_bytes = len((self.LEGEND_HEADER + self.LEGEND_FOOTER).encode(encoding))
+        self.header_tokens = 0
+
+    def _placeholder_line(self, record: MessageFields) -> str:
+        # 引用块外的消息时 reply_to 保留原始 msg_id，取两者中较长的一个
+        reply_ref = max(self._ordinal_placeholder, record.reply_msg_id, key=len) if record.reply_msg_id else None
+        return record.render_compact(self._alias_placeholder, self._ordinal_placeholder, reply_ref)
+
+    @staticmethod
+    def _legend_line(alias: str, label: str) -> str:
+        return f"{alias} = {label}"
+
+    def count_tokens(self, count: Callable[[str], int], counter_name: str = None) -> array:
+        if self.token_sizes is None or counter_name != self.token_counter_name:
+            self.legend_tokens = {key: count(self._legend_line(self._alias_placeholder, label)) + 1
+                                  for key, label in self.legend_labels.items()}
+            self.header_tokens = count(self.LEGEND_HEADER + self.LEGEND_FOOTER)
+        return super().count_tokens(count, counter_name)
+
+    def truncate(self, index: int, max_bytes: int, count: Callable[[str], int] = None) -> None:
+        suffix = "...[截断]"
+        record = self.records[index]
+        overflow = self.byte_sizes[index] - max_bytes + len(suffix.encode(self.encoding))
+        content_bytes = record.content.encode(self.encoding, errors='replace')
+        content = content_bytes[:max(0, len(content_bytes) - overflow)].decode(self.encoding, errors='ignore') + suffix
+        self.records[index] = record._replace(content=content)
+        self.lines[index] = self._placeholder_line(self.records[index])
+        self.byte_sizes[index] = len(self.lines[index].encode(self.encoding)) + len(self.SEPARATOR.encode(self.encoding))
+        if self.token_sizes is not None and count is not None:
+            self.token_sizes[index] = count(self.lines[index]) + 1
+
+    def _aliases(self, chunk: ChunkRange) -> Dict[str, str]:
+        aliases = {}
+        start, end = chunk
+        for record in self.records[start:end]:
+            if record.sender_key not in aliases:
+                aliases[record.sender_key] = f"[A{len(aliases) + 1}]"
+        return aliases
+
+    def text(self, chunk: ChunkRange) -> str:
+        start, end = chunk
+        aliases = self._aliases(chunk)
+        ordinals = {record.msg_id: f"{self._ORDINAL_MARKER}{i + 1}" for i, record in enumerate(self.records[start:end])}
+        legend = self.SEPARATOR.join(self._legend_line(alias, self.legend_labels[key]) for key, alias in aliases.items())
+        lines = [
+            record.render_compact(aliases[record.sender_key], f"{self._ORDINAL_MARKER}{i + 1}",
+                                  ordinals.get(record.reply_msg_id, record.reply_msg_id) if record.reply_msg_id else None)
+            for i, record in enumerate(self.records[start:end])
+        ]
+        return self.LEGEND_HEADER + legend + self.LEGEND_FOOTER + self.SEPARATOR.join(lines)
+
+    def search_lines(self, chunk: ChunkRange) -> List[str]:
+        """对照表中的发送人描述与块内各条消息，与 `text` 的内容一致但不替换代号与序号。"""
+        return [self.legend_labels[key] for key in self._aliases(chunk)] + super().search_lines(chunk)
+
+    def size(self, chunk: ChunkRange, unit: str = 'bytes') -> int:
+        legend_sizes, header = (self.legend_tokens, self.header_tokens) if unit == 'tokens' else \
+            (self.legend_bytes, self.header_bytes)
+        return super().size(chunk, unit) + header + sum(legend_sizes[key] for key in self._aliases(chunk))
+
+    def pack_chunks(self, unit: str, budget: int) -> List[ChunkRange]:
+        """打包时把每个块的对照表开销计算在内：块内第一次出现的发送人额外占用一行对照表。"""
+        sizes, legend_sizes, header = (self.token_sizes, self.legend_tokens, self.header_tokens) if unit == 'tokens' \
+            else (self.byte_sizes, self.legend_bytes, self.header_bytes)
+        ranges = []
+        start, current, senders = 0, header, set()
+        for i, record in enumerate(self.records):
+            cost = sizes[i] + (legend_sizes[record.sender_key] if record.sender_key not in senders else 0)
+            if current + cost > budget and i > start:
+                ranges.append((start, i))
+                start, current, senders = i, header, set()
+                cost = sizes[i] + legend_sizes[record.sender_key]
+            current += cost
+            senders.add(record.sender_key)
+        if start < len(self.records):
+            ranges.append((start, len(self.records)))
+        return ranges
+
+    def expand(self, chunk: ChunkRange, text: str) -> str:
+        """
+        把模型输出中的块内序号还原为原始 msg_id，[A1] 等代号还原为发送人描述。
+        序号只在 (#n、reply_to: #n、msg_id: #n 这几种位置还原，已有 msg_id: 前缀时不再重复添加，其余位置的 #n 保持原样。
+        """
+        if not text:
+            return text
+        start, end = chunk
+        records = self.records[start:end]
+        labels = {alias: self.legend_labels[key] for key, alias in self._aliases(chunk).items()}
+
+        def expand_ordinal(match):
+            prefix, index = match.group(1), int(match.group(2))
+            if not 1 <= index <= len(records):
+                return match.group(0)
+            msg_id = records[index - 1].msg_id
+            return f"(msg_id: {msg_id}" if prefix == "(" else f"{prefix}{msg_id}"
+
+        def expand_alias(match):
+            return labels.get(match.group(0), match.group(0))
+
+        return self._ALIAS_PATTERN.sub(expand_alias, self._ORDINAL_PATTERN.sub(expand_ordinal, text))
@@ -0,0 +1,148 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_RED_PACKET_PATTERN = re.compile(r'^\[(?:卡片消息|通知消息)[:：][^\n]*红包')
+
+
+def _notice(sub_type: str) -> Callable[[str], bool]:
+    pattern = re.compile(rf'^\[通知消息\s*[:：]\s*{sub_type}\]')
+    return lambda content: pattern.match(content) is not None
+
+
+# 低信息量消息的分类规则：类别 -> 判断函数。content 为 write_txt 导出后的消息内容。
+NOISE_CLASSIFIERS: Dict[str, Callable[[str], bool]] = {
+    "pat": _notice("拍一拍"),
+    "join": _notice("加入群聊"),
+    "revoke": _notice("撤回"),
+    "red_packet": lambda content: _RED_PACKET_PATTERN.match(content) is not None,
+    "sticker": lambda content: content.strip() == "[动画表情]",
+}
+
+# 各类别的默认处理方式：drop 直接丢弃，collapse 把连续的同类消息折叠为一条，keep 保留
+DEFAULT_NOISE_ACTIONS: Dict[str, str] = {
+    "pat": "drop",
+    "join": "collapse",
+    "revoke": "collapse",
+    "red_packet": "collapse",
+    "sticker": "collapse",
+}
+
+
+@dataclass
+class NoiseFilterResult:
+    """噪声过滤的结果。"""
+
+    #: 保留下来的消息，折叠后的消息带有 collapsed_msg_ids 字段
+    messages: List[Dict[str, Any]]
+
+    #: 被丢弃或折叠掉的原始消息，键为 msg_id，可以据此找回
+    removed: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    #: 统计：各类别的丢弃/折叠条数、连续重复折叠条数、节省的字节数
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+
+class NoiseFilter:
+    """
+    聊天记录的噪声过滤：丢弃或折叠拍一拍、入群通知、红包、表情包等低信息量消息，并折叠连续重复的消息。
+    折叠时保留第一条消息，在内容后追加折叠条数，被折叠的消息保存在 `NoiseFilterResult.removed` 中。
+    """
+
+    def __init__(self, actions: Dict[str, str] = None, collapse_duplicates: bool = True,
+                 classifiers: Dict[str, Callable[[str], bool]] = None):
+        """
+        :param actions: 各类别的处理方式，会覆盖 DEFAULT_NOISE_ACTIONS 中的同名项，可选 drop、collapse、keep
+        :param collapse_duplicates: 是否折叠内容完全相同的连续消息（例如接龙的 "1"、"+1"）
+        :param classifiers: 额外的类别判断函数，会覆盖 NOISE_CLASSIFIERS 中的同名项
+        """
+        self.actions = {**DEFAULT_NOISE_ACTIONS, **(actions or {})}
+        for name, action in self.actions.items():
+            if action not in ("drop", "collapse", "keep"):
+                raise ValueError(f"未知的噪声处理方式 {name}={action}，可选 drop、collapse、keep。")
+        self.collapse_duplicates = collapse_duplicates
+        self.classifiers = {**NOISE_CLASSIFIERS, **(classifiers or {})}
+
+    def classify(self, message: Dict[str, Any]) -> Optional[str]:
+        """返回消息所属的噪声类别，不属于任何类别时返回 None。"""
+        content = message.get('content')
+        if not isinstance(content, str):
+            return None
+        for name, classifier in self.classifiers.items():
+            if self.actions.get(name, "keep") != "keep" and classifier(content):
+                return name
+        return None
+
+    @staticmethod
+    def _run_key(message: Dict[str, Any], noise_class: Optional[str], action: Optional[str],
+                 collapse_duplicates: bool) -> Optional[Tuple]:
+        if action == "collapse":
+            return "class", noise_class
+        if collapse_duplicates and isinstance(message.get('content'), str) and message['content'].strip():
+            return "duplicate", message['content'].strip()
+        return None
+
+    def apply(self, messages: List[Dict[str, Any]],
+              measure: Callable[[Dict[str, Any]], int] = None) -> NoiseFilterResult:
+        """
+        过滤消息列表，不修改传入的消息字典。
+        :param messages: write_txt 导出的消息列表
+        :param measure: 计算单条消息大小（字节）的函数，用于统计节省的字节数，默认按 content 的 UTF-8 字节数
+        :return: NoiseFilterResult
+        """
+        if measure is None:
+            measure = lambda message: len(str(message.get('content', '')).encode('utf-8'))
+
+        result = NoiseFilterResult(messages=[])
+        dropped: Dict[str, int] = {}
+        collapsed: Dict[str, int] = {}
+        bytes_saved = 0
+
+        run: List[Dict[str, Any]] = []
+        run_key = None
+
+        def flush_run():
+            nonlocal bytes_saved
+            if not run:
+                return
+            head = run[0]
+            if len(run) > 1:
+                label = "连续重复" if run_key[0] == "duplicate" else "同类消息"
+                collapsed_head = {
+                    **head,
+                    "content": f"{head.get('content')}\n[{label}已折叠，共 {len(run)} 条]",
+                    "collapsed_msg_ids": [message.get('msg_id') for message in run[1:]],
+                }
+                bucket = "duplicate" if run_key[0] == "duplicate" else run_key[1]
+                collapsed[bucket] = collapsed.get(bucket, 0) + len(run) - 1
+                bytes_saved += sum(measure(message) for message in run[1:]) + measure(head) - measure(collapsed_head)
+                for message in run[1:]:
+                    result.removed[str(message.get('msg_id'))] = message
+                head = collapsed_head
+            result.messages.append(head)
+
+        for message in messages:
+            noise_class = self.classify(message)
+            action = self.actions.get(noise_class) if noise_class else None
+            if action == "drop":
+                dropped[noise_class] = dropped.get(noise_class, 0) + 1
+                bytes_saved += measure(message)
+                result.removed[str(message.get('msg_id'))] = message
+                continue
+
+            key = self._run_key(message, noise_class, action, self.collapse_duplicates)
+            if key is not None and key == run_key:
+                run.append(message)
+                continue
+            flush_run()
+            run, run_key = [message], key
+        flush_run()
+
+        result.stats = {
+            "input_messages": len(messages),
+            "output_messages": len(result.messages),
+            "dropped": dropped,
+            "collapsed": collapsed,
+            "bytes_saved": bytes_saved,
+        }
+        return result
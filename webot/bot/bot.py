@@ -119,6 +119,26 @@ class WeBot(Bot):
             result += item.data
         return result
 
+    def get_active_talkers(self, since: int, min_messages: int = 1) -> List[Dict]:
+        """
+        获取指定时间之后有新消息的聊天对象
+
+        :param since: 起始时间戳（秒）
+        :param min_messages: 最少消息数，少于该数量的聊天对象不返回
+        :return: [{"wxid": 聊天对象, "message_count": 消息数, "last_time": 最后一条消息的时间戳}, ...]，按最后消息时间降序
+        """
+        sql = f"SELECT StrTalker, COUNT(*), MAX(CreateTime) FROM MSG WHERE CreateTime >= {int(since)} GROUP BY StrTalker"
+
+        talkers: Dict[str, Dict] = {}
+        for handle in self.get_msg_handle:
+            for wxid, message_count, last_time in self.exec_sql(handle, sql).data[1:]:
+                talker = talkers.setdefault(wxid, {"wxid": wxid, "message_count": 0, "last_time": 0})
+                talker["message_count"] += int(message_count)
+                talker["last_time"] = max(talker["last_time"], int(last_time))
+        result = [talker for talker in talkers.values() if talker["message_count"] >= min_messages]
+        result.sort(key=lambda talker: talker["last_time"], reverse=True)
+        return result
+
     def get_contact_profile(self, wxid: str) -> Response:
         """
         获取群成员基础信息，传入wxid
@@ -132,7 +152,8 @@ class WeBot(Bot):
         return Response(**response)
 
     def export_message_file(self, wxid, filename=None, include_image=False, start_time=None, end_time=None,
-                            export_type: ExportFileType = "json", endswith_txt: bool = True):
+                            export_type: ExportFileType = "json", endswith_txt: bool = True,
+                            memory_query: str = None, memory_max_bytes: int = None):
         """
         导出聊天记录到文件
         :param wxid: 导出聊天记录的群聊或好友的wxid
@@ -142,6 +163,8 @@ class WeBot(Bot):
         :param end_time: 结束时间
         :param export_type: 文件格式，目前支持json、yaml和docx
         :param endswith_txt: 在导出json和yaml时，是否在文件名用.txt后缀，因为大部分大预言模型不支持直接上传这两种文件
+        :param memory_query: 本次导出要回答的问题，传入时附带的记忆按相关度排序
+        :param memory_max_bytes: 附带记忆的字节预算，为 None 时附带全部记忆
         :return: 生成文件的绝对路径
         """
         if export_type == ExportFileTypeList.DOCX:
@@ -154,7 +177,8 @@ class WeBot(Bot):
         return write_txt(
             self.get_msg_handle, self.get_micro_msg_handle,
             wxid=wxid, filename=filename, start_time=start_time, end_time=end_time,
-            port=self.remote_port, endswith_txt=endswith_txt, file_type=export_type
+            port=self.remote_port, endswith_txt=endswith_txt, file_type=export_type,
+            memory_query=memory_query, memory_max_bytes=memory_max_bytes
         )
 
     def get_contact_by_keyword(self, keywords: str, fuzzy: bool = False) -> dict[str, str | dict]:
@@ -1,19 +1,27 @@
-from os import remove
-from typing import Callable
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional, Tuple
 from time import sleep
 
 from webot.agent.image_recognition_agent import ImageRecognitionAgent
 from webot.databases.image_recognition_database import ImageRecognitionDatabase
 from webot.databases.global_config_database import LLMConfigDatabase
+from webot.llm.endpoint_pool import create_endpoint_pool
 from webot.bot.write_doc import get_all_message, decode_img, DATA_PATH, path
 from webot.bot.message import MessageType, TextMessageFromDB
 from webot.tool_call.tools import get_msg_handle
 
 
 class ImageRecognition:
-    def __init__(self, model_id, port=19001):
+    def __init__(self, model_id, port=19001, model_ids: list = None):
+        """
+        :param model_id: 识别使用的模型ID
+        :param port: 微信服务端口
+        :param model_ids: 多个模型ID时组成端点池，按权重轮询并在失败时换端点重试，此时忽略 model_id
+        """
         self._model_id = model_id
+        self._model_ids = model_ids
         self.port = port
+        self._endpoint_pool = None
 
         self._image_recognition_db = ImageRecognitionDatabase()
         self._llm_config_db = LLMConfigDatabase()
@@ -24,13 +32,21 @@ class ImageRecognition:
     @property
     def _get_llm_config(self):
         llm_config = self._llm_config_db.get_model_by_id(self._model_id)
-        _, _, model_name, base_url, apikey, _, _ = llm_config
-        return model_name, base_url, apikey
+        _, _, model_name, base_url, apikey, _, apikey_id = llm_config
+        return model_name, base_url, apikey, apikey_id
 
     @property
     def _image_recognition_agent(self):
-        model_name, base_url, apikey = self._get_llm_config
-        return ImageRecognitionAgent(model_name=model_name, llm_options={"base_url": base_url, "apikey": apikey}, webot_port=self.port)
+        if self._model_ids:
+            # 端点池在多次识别之间复用，保留各端点的健康状态
+            if self._endpoint_pool is None:
+                self._endpoint_pool = create_endpoint_pool(self._model_ids, llm_config_db=self._llm_config_db)
+            return ImageRecognitionAgent(llm=self._endpoint_pool, webot_port=self.port)
+        # 传入 apikey_id，识别请求与其他组件共享同一个APIKEY的限流预算
+        model_name, base_url, apikey, apikey_id = self._get_llm_config
+        return ImageRecognitionAgent(model_name=model_name,
+                                     llm_options={"base_url": base_url, "apikey": apikey, "apikey_id": apikey_id},
+                                     webot_port=self.port)
 
     def _get_image_messages(self, start_time, end_time, wxid):
         msg_db_handle = get_msg_handle(self.port)
@@ -44,99 +60,130 @@ class ImageRecognition:
         )
         return all_image_messages
 
-    def run(
-            self, wxid, start_time, end_time, 
-            on_success: Callable=None, on_error: Callable=None, on_start: Callable=None, on_finally: Callable=None, 
-            duration=1, only_failed = False
-    ):
-        all_image_messages = self._get_image_messages(start_time=start_time, end_time=end_time, wxid=wxid)
-        print(f"一共获取到 {len(all_image_messages)} 张图片消息")
-        status = 'pending'
-        for index, image_message_data in enumerate(all_image_messages):
-            print(f"正在处理第 {index + 1} 张图片消息")
-
-            if on_start is not None and isinstance(on_start, Callable):
-                on_start(image_message_data)
-
-            image_message = TextMessageFromDB(*image_message_data)
-            image_path = decode_img(
-                message=image_message,
-                save_dir=path.join(DATA_PATH, 'images'),
-                port=self.port,
-            )
-            _, recognition_result, _ = self._image_recognition_db.get_recognition_result(message_id=image_message.MsgSvrID)
-            result = ""
-            try:
-                if not image_path:
-                    print(f"第{index + 1} / {len(all_image_messages)}张图片解码失败")
-                    if not recognition_result:
-                        self._image_recognition_db.add_recognition_result(
-                            message_id=image_message.MsgSvrID,
-                            recognition_result="无具体描述",
-                            message_time=image_message.CreateTime
-                        )
-                    status = '识别失败, 从微信中下载图片失败。'
-                    yield {"total_message": len(all_image_messages), "current_message_index": index + 1, "status": status, "message_id": image_message.MsgSvrID, "recognition_result": None}
-                    continue
-                
-                if only_failed and (recognition_result not in [None, '无具体描述']):
-                    print(f"第{index + 1} / {len(all_image_messages)}张图片已识别，跳过")
-                    status = '已有识别结果, 跳过'
-                    yield {"total_message": len(all_image_messages), "current_message_index": index + 1, "status": status, "message_id": image_message.MsgSvrID, "recognition_result": recognition_result}
-                    continue
-
-                [result], [message_id] = self._image_recognition_agent.invoke({
-                    "path": image_path,
-                    "message_id": image_message.MsgSvrID,
-                })
+    def _recognize(self, agent: ImageRecognitionAgent, index: int, total: int, image_message_data,
+                   only_failed: bool) -> Tuple[dict, Optional[str], Optional[Exception]]:
+        """
+        识别单张图片并写入结果，在工作线程中执行。
+        :return: (进度事件, 识别结果, 异常)，识别失败时识别结果为 None
+        """
+        image_message = TextMessageFromDB(*image_message_data)
+        image_path = decode_img(
+            message=image_message,
+            save_dir=path.join(DATA_PATH, 'images'),
+            port=self.port,
+        )
+        _, recognition_result, _ = self._image_recognition_db.get_recognition_result(message_id=image_message.MsgSvrID)
+        event = {"total_message": total, "current_message_index": index + 1, "message_id": image_message.MsgSvrID}
+        try:
+            if not image_path:
+                print(f"第{index + 1} / {total}张图片解码失败")
                 if not recognition_result:
                     self._image_recognition_db.add_recognition_result(
-                        message_id=message_id,
-                        recognition_result=result,
-                        message_time=image_message.CreateTime
+                        message_id=image_message.MsgSvrID,
+                        recognition_result="无具体描述",
+                        message_time=image_message.CreateTime,
+                        wait=False
                     )
-                else:
-                    self._image_recognition_db.update_recognition_result(
-                        message_id=message_id,
-                        recognition_result=result
-                    )
-                print(f"处理成功！")
-                status = "处理成功！" if result != '无具体描述' else '由于模型API自身原因识别失败'
+                return {**event, "status": '识别失败, 从微信中下载图片失败。', "recognition_result": None}, None, None
 
-                if on_success is not None and isinstance(on_success, Callable):
-                    on_success(
-                        total_message=len(all_image_messages),
-                        current_message_index=index + 1,
-                        result=result
-                    )
+            if only_failed and (recognition_result not in [None, '无具体描述']):
+                print(f"第{index + 1} / {total}张图片已识别，跳过")
+                return {**event, "status": '已有识别结果, 跳过', "recognition_result": recognition_result}, None, None
 
-            except Exception as e:
-                print(f"第{index + 1}张图片识别失败: {e}")
-                status = "识别失败！"
+            [result], [message_id] = agent.invoke({
+                "path": image_path,
+                "message_id": image_message.MsgSvrID,
+            })
+            if not recognition_result:
+                self._image_recognition_db.add_recognition_result(
+                    message_id=message_id,
+                    recognition_result=result,
+                    message_time=image_message.CreateTime,
+                    wait=False
+                )
+            else:
+                self._image_recognition_db.update_recognition_result(
+                    message_id=message_id,
+                    recognition_result=result,
+                    wait=False
+                )
+            print(f"第{index + 1} / {total}张图片处理成功！")
+            status = "处理成功！" if result != '无具体描述' else '由于模型API自身原因识别失败'
+            return {**event, "status": status, "recognition_result": result}, result, None
+
+        except Exception as e:
+            print(f"第{index + 1}张图片识别失败: {e}")
+            # 识别结果按消息唯一，不用失败占位覆盖已有的结果
+            if not recognition_result:
                 self._image_recognition_db.add_recognition_result(
                     message_id=image_message.MsgSvrID,
                     recognition_result="无具体描述",
-                    message_time=image_message.CreateTime
+                    message_time=image_message.CreateTime,
+                    wait=False
                 )
-                if on_error is not None and isinstance(on_error, Callable):
-                    on_error(e)
+            return {**event, "status": "识别失败！", "recognition_result": ""}, None, e
 
-            finally:
+    def run(
+            self, wxid, start_time, end_time, 
+            on_success: Callable=None, on_error: Callable=None, on_start: Callable=None, on_finally: Callable=None, 
+            duration=1, only_failed = False, max_concurrency: int = None
+    ):
+        """
+        批量识别图片消息。请求速率由模型APIKEY的全局共享限流器控制，`duration` 仅作为每张图片之间额外的固定间隔。
+        识别在线程池中并发执行，进度事件按完成顺序产出，回调都在调用方的线程中执行。
+        :param max_concurrency: 同时识别的图片数。默认使用端点池时为 max(4, 端点数)，单个模型时为 1
+        """
+        all_image_messages = self._get_image_messages(start_time=start_time, end_time=end_time, wxid=wxid)
+        total = len(all_image_messages)
+        print(f"一共获取到 {total} 张图片消息")
+        if max_concurrency is None:
+            max_concurrency = max(4, len(self._model_ids)) if self._model_ids else 1
+        # 识别模型在所有图片之间共用
+        agent = self._image_recognition_agent
+        queue = iter(enumerate(all_image_messages))
 
-                # 删除图片会有副作用，导致微信中的图片缓存也丢失
-                # try:
-                #     dat_path = image_path.replace(".jpg", ".dat")
-                #     if path.exists(dat_path):
-                #         remove(dat_path)
-                #     if path.exists(image_path):
-                #         remove(image_path)
-                # except Exception as e:
-                #     print(f"删除图片失败: {e}")
-                if on_finally is not None and isinstance(on_finally, Callable):
-                    on_finally(
-                        total_message=len(all_image_messages),
-                        current_message_index=index + 1,
-                        status=status,
-                    )
-            yield {"total_message": len(all_image_messages), "current_message_index": index + 1, "status": status, "message_id": image_message.MsgSvrID, "recognition_result": result}
-            sleep(duration)
\ No newline at end of file
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="image-recognition") as executor:
+            pending = {}
+
+            def submit_next() -> bool:
+                item = next(queue, None)
+                if item is None:
+                    return False
+                index, image_message_data = item
+                print(f"正在处理第 {index + 1} 张图片消息")
+                if on_start is not None and isinstance(on_start, Callable):
+                    on_start(image_message_data)
+                pending[executor.submit(self._recognize, agent, index, total, image_message_data, only_failed)] = index
+                return True
+
+            # 同时在途的识别不超过 max_concurrency 张，完成一张再提交下一张
+            for _ in range(max(1, max_concurrency)):
+                if not submit_next():
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    event, result, error = future.result()
+                    if error is not None:
+                        if on_error is not None and isinstance(on_error, Callable):
+                            on_error(error)
+                    elif result is not None and on_success is not None and isinstance(on_success, Callable):
+                        on_success(
+                            total_message=total,
+                            current_message_index=index + 1,
+                            result=result
+                        )
+                    # 删除图片会有副作用，导致微信中的图片缓存也丢失，因此识别后保留图片
+                    if on_finally is not None and isinstance(on_finally, Callable):
+                        on_finally(
+                            total_message=total,
+                            current_message_index=index + 1,
+                            status=event["status"],
+                        )
+                    yield event
+                    if duration:
+                        sleep(duration)
+                    submit_next()
+        # 识别结果是异步组提交的，结束前等待全部落库
+        self._image_recognition_db.flush()
@@ -0,0 +1,167 @@
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Tuple, Optional, List, Any
+
+from webot.bot.message import TextMessageFromDB
+
+# 解码器的键：(消息Type, 子类型)。子类型目前只有XML消息(Type=49)会用到，对应 appmsg 中的 type 字段，其余消息为 None。
+DecoderKey = Tuple[str, Optional[str]]
+
+
+@dataclass
+class DecodeContext:
+    """
+    单条消息解码时的上下文，解码器可以读取并修改其中的字段。
+    """
+
+    #: 数据库中的原始消息
+    message: TextMessageFromDB
+
+    #: `process_messages` 处理后的消息内容（图片消息可能是图片路径）
+    message_content: str
+
+    #: 发送人微信名，解码器可以覆写（例如通知消息的兜底发送人）
+    nick_name: str
+
+    #: 发送人备注
+    remark: str
+
+    #: 发送人wxid
+    sender_id: Optional[str]
+
+    #: 已经解码完成的消息列表，用于引用消息回溯原始消息
+    history: List[Dict[str, Any]] = field(default_factory=list)
+
+    #: 子类型解析器解析出的中间结果，例如XML消息的 appmsg 字典
+    payload: Any = None
+
+    #: 解码器产出的额外信息，例如 reply_msg_id
+    ext_info: Dict[str, Any] = field(default_factory=dict)
+
+    #: 导出过程中共享的资源，例如图片识别结果
+    resources: Dict[str, Any] = field(default_factory=dict)
+
+
+class _DecoderStats:
+    """
+    单个解码器键的耗时统计，p95 基于最近 `sample_size` 次调用计算。
+    """
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def record(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.samples.append(duration)
+
+    def p95(self) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class MessageDecoderRegistry:
+    """
+    消息解码器注册表。
+
+    解码器以 (Type, 子类型) 为键注册，`decode` 是唯一的分发入口，并且会统计每种消息的解码次数、总耗时与 p95 耗时。
+    新增消息类型只需要注册解码器，不需要修改导出的主循环。
+    """
+
+    def __init__(self, sample_size: int = 2048):
+        self._decoders: Dict[DecoderKey, Callable[[DecodeContext], Optional[str]]] = {}
+        self._sub_type_resolvers: Dict[str, Callable[[DecodeContext], Optional[str]]] = {}
+        self._stats: Dict[DecoderKey, _DecoderStats] = {}
+        self._sample_size = sample_size
+        self._lock = Lock()
+
+    def register(self, msg_type: str, sub_type: Optional[str] = None):
+        """
+        注册解码器的装饰器。
+        :param msg_type: 消息Type，参考 `MessageType`
+        :param sub_type: 子类型，为 None 时作为该消息Type的兜底解码器
+        :return: 装饰器，被装饰的函数接收 `DecodeContext`，返回消息内容字符串
+        """
+
+        def decorator(func: Callable[[DecodeContext], Optional[str]]):
+            self._decoders[(str(msg_type), None if sub_type is None else str(sub_type))] = func
+            return func
+
+        return decorator
+
+    def register_sub_type_resolver(self, msg_type: str):
+        """
+        注册子类型解析器的装饰器，解析器返回子类型字符串，并可以把解析的中间结果写入 `DecodeContext.payload`。
+        :param msg_type: 消息Type
+        :return: 装饰器
+        """
+
+        def decorator(func: Callable[[DecodeContext], Optional[str]]):
+            self._sub_type_resolvers[str(msg_type)] = func
+            return func
+
+        return decorator
+
+    def decode(self, context: DecodeContext) -> Optional[str]:
+        """
+        分发并执行解码器，同时记录耗时。
+        :param context: 解码上下文
+        :return: 解码后的消息内容，没有对应解码器时返回 None
+        """
+        start = perf_counter()
+        msg_type = context.message.Type
+        sub_type = None
+        try:
+            resolver = self._sub_type_resolvers.get(msg_type)
+            if resolver is not None:
+                sub_type = resolver(context)
+            decoder = self._decoders.get((msg_type, sub_type)) or self._decoders.get((msg_type, None))
+            return decoder(context) if decoder is not None else None
+        finally:
+            self._record((msg_type, sub_type), perf_counter() - start)
+
+    def _record(self, key: DecoderKey, duration: float):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _DecoderStats(self._sample_size)
+            stats.record(duration)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        获取各类消息的解码统计，按总耗时降序排列。
+        :return: 统计列表，每项包含 type、sub_type、count、total_seconds、avg_ms、p95_ms、share
+        """
+        with self._lock:
+            snapshot = [(key, stats.count, stats.total, stats.p95()) for key, stats in self._stats.items()]
+
+        total_all = sum(item[2] for item in snapshot) or 1e-12
+        result = [
+            {
+                "type": msg_type,
+                "sub_type": sub_type,
+                "count": count,
+                "total_seconds": round(total, 6),
+                "avg_ms": round(total / count * 1000, 4) if count else 0.0,
+                "p95_ms": round(p95 * 1000, 4),
+                "share": round(total / total_all, 4),
+            }
+            for (msg_type, sub_type), count, total, p95 in snapshot
+        ]
+        result.sort(key=lambda item: item["total_seconds"], reverse=True)
+        return result
+
+    def reset_stats(self):
+        """清空解码统计。"""
+        with self._lock:
+            self._stats.clear()
+
+
+# 全局的消息解码器注册表，具体的解码器在 `write_doc` 中注册。
+MESSAGE_DECODERS = MessageDecoderRegistry()
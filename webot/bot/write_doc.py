@@ -6,6 +6,8 @@ from typing import Callable
 import yaml
 
 from webot.bot.message import TextMessageFromDB, MessageType
+from webot.bot.message_decoder import MESSAGE_DECODERS, DecodeContext
+from webot.agent.noise_filter import NoiseFilter
 from webot.utils.msg_pb2 import MessageBytesExtra
 from webot.utils.project_path import DATA_PATH
 from webot.utils.compress_content_praser import parse_compressed_content
@@ -92,70 +94,6 @@ def get_all_message(db_handle: list, wxid, include_image=True, start_time=None,
     return result
 
 
-def xml_message_parse(compressed_content: str):
-    result = {
-        'content': '[未解析的XML消息]',
-        'type': None,
-        'ext_info': {}
-    }
-
-    # 处理引用回复消息
-    def refer_msg(app_msg: dict):
-        original_message = app_msg.get('refermsg')
-        result['type'] = 'reply'
-        # result['content'] = f'回复[{original_message.get("displayname")}]:\n「{original_content}」\n----------\n{app_msg.get("title")}'
-        result['content'] = app_msg.get("title")
-        result['ext_info']['reply_msg_id'] = original_message.get('svrid')
-
-    def music_share(app_msg: dict):
-        result['type'] = 'music_share'
-        result['content'] = f'[分享音乐: {app_msg.get("des") or "未知歌手"} - {app_msg.get("title")}]'
-
-    def mini_program(app_msg: dict):
-        result['type'] = 'mini_program'
-        result['content'] = f'[小程序: {app_msg.get("sourcedisplayname", "未知小程序")}]\n{app_msg.get("title")}'
-
-    def chat_history(app_msg: dict):
-        result['type'] = 'chat_history'
-        result['content'] = f'[聊天记录：{app_msg.get("title")}]\n{app_msg.get("des")}'
-
-    def video_message(app_msg: dict):
-        result['type'] = 'video_message'
-        result['content'] = f'[视频链接: {app_msg.get("title")}]\n{app_msg.get("des")}'
-
-    def web_view(app_msg: dict):
-        result['type'] = 'web_view'
-        result['content'] = f'[网页链接: {app_msg.get("title")}]\n{app_msg.get("des")}'
-        if app_msg.get('sourcedisplayname'):
-            result['content'] += f'\n来源: {app_msg.get("sourcedisplayname")}'
-
-    def default_message(app_msg: dict):
-        result['type'] = 'default'
-        result['content'] = f'[卡片消息: {app_msg.get("title")}]'
-
-    try:
-        parse_result = parse_compressed_content(compressed_content)
-        prase_result_dict = xml_to_dict(parse_result)
-        app_msg = prase_result_dict.get('msg', {'appmsg': {}})
-        app_msg = app_msg.get('appmsg')
-        original_msg_type = app_msg.get('type')
-        content_dict = {
-            "57": refer_msg,
-            "3": music_share,
-            "92": music_share,
-            "33": mini_program,
-            "19": chat_history,
-            "4": video_message,
-            "5": web_view
-        }
-
-        content_dict.get(original_msg_type, default_message)(app_msg)
-
-    except Exception as e:
-        pass
-    return result
-
-
 def notice_message_parse(content: str):
     if "<revokemsg>" in content:
         content = f'[通知消息: 撤回]\n{content.replace("<revokemsg>", "").replace("</revokemsg>", "")}'
@@ -232,8 +170,151 @@ def get_sender_form_room_msg(bytes_extra: str) -> str:
     return ""
 
 
-def get_memory(from_user, to_user):
+# ========== 消息解码器 ==========
+# 按 (Type, appmsg type) 注册到 `MESSAGE_DECODERS`，`write_txt` 通过 `MESSAGE_DECODERS.decode` 统一分发。
+
+@MESSAGE_DECODERS.register_sub_type_resolver(MessageType.XML_MESSAGE)
+def _resolve_app_msg_type(context: DecodeContext):
+    try:
+        parse_result = parse_compressed_content(context.message.CompressContent)
+        prase_result_dict = xml_to_dict(parse_result)
+        app_msg = prase_result_dict.get('msg', {'appmsg': {}})
+        app_msg = app_msg.get('appmsg')
+        context.payload = app_msg
+        return app_msg.get('type')
+    except Exception as e:
+        context.payload = None
+        return None
+
+
+# 处理引用回复消息
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE, "57")
+def _decode_refer_msg(context: DecodeContext):
+    app_msg = context.payload
+    original_message = app_msg.get('refermsg') or {}
+    content = app_msg.get("title")
+    reply_msg_id = original_message.get('svrid')
+    context.ext_info['reply_msg_id'] = reply_msg_id
+    if not reply_msg_id:
+        return content
+
+    for history in context.history[::-1]:
+        if history['msg_id'] == reply_msg_id:
+            original_content = history.get("content") or ""
+            original_content = original_content if len(original_content) < 10 else f'{original_content[0:5]} ...'
+            return f"[引用消息：{context.nick_name} 回复 {history.get('sender')}]\n原始消息(部分): 「{original_content}」\n回复内容(完整): {content}"
+    return content
+
+
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE, "3")
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE, "92")
+def _decode_music_share(context: DecodeContext):
+    app_msg = context.payload
+    return f'[分享音乐: {app_msg.get("des") or "未知歌手"} - {app_msg.get("title")}]'
+
+
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE, "33")
+def _decode_mini_program(context: DecodeContext):
+    app_msg = context.payload
+    return f'[小程序: {app_msg.get("sourcedisplayname", "未知小程序")}]\n{app_msg.get("title")}'
+
+
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE, "19")
+def _decode_chat_history(context: DecodeContext):
+    app_msg = context.payload
+    return f'[聊天记录：{app_msg.get("title")}]\n{app_msg.get("des")}'
+
+
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE, "4")
+def _decode_video_link(context: DecodeContext):
+    app_msg = context.payload
+    return f'[视频链接: {app_msg.get("title")}]\n{app_msg.get("des")}'
+
+
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE, "5")
+def _decode_web_view(context: DecodeContext):
+    app_msg = context.payload
+    content = f'[网页链接: {app_msg.get("title")}]\n{app_msg.get("des")}'
+    if app_msg.get('sourcedisplayname'):
+        content += f'\n来源: {app_msg.get("sourcedisplayname")}'
+    return content
+
+
+@MESSAGE_DECODERS.register(MessageType.XML_MESSAGE)
+def _decode_default_xml(context: DecodeContext):
+    if not isinstance(context.payload, dict):
+        return '[未解析的XML消息]'
+    return f'[卡片消息: {context.payload.get("title")}]'
+
+
+@MESSAGE_DECODERS.register(MessageType.TEXT_MESSAGE)
+def _decode_text(context: DecodeContext):
+    return context.message_content
+
+
+@MESSAGE_DECODERS.register(MessageType.IMAGE_MESSAGE)
+def _decode_image(context: DecodeContext):
+    # 可以通过GML 4V Flash描述图片，然后单独开一个本地db，把描述和msg_id关联。
+    recognitions = context.resources.get('image_recognitions')
+    if recognitions is not None:
+        # 导出前已批量预取，没有识别结果的图片不在字典中
+        recognition_result = recognitions.get(str(context.message.MsgSvrID))
+    else:
+        image_rec_db = context.resources.get('image_rec_db')
+        if image_rec_db is None:
+            return "[图片]\n图片描述: 无具体描述"
+        _, recognition_result, _ = image_rec_db.get_recognition_result(context.message.MsgSvrID)
+    if recognition_result is None:
+        return "[图片]\n图片描述: 无具体描述"
+    return f"[图片]\n图片描述: {recognition_result}"
+
+
+@MESSAGE_DECODERS.register(MessageType.VIDEO_MESSAGE)
+def _decode_video(context: DecodeContext):
+    return "[视频]"
+
+
+@MESSAGE_DECODERS.register(MessageType.VOICE_MESSAGE)
+def _decode_voice(context: DecodeContext):
+    return "[语音]"
+
+
+@MESSAGE_DECODERS.register(MessageType.EMOJI_MESSAGE)
+def _decode_emoji(context: DecodeContext):
+    # 同样可以通过content字段的cndurl下载表情图片，GML 4V Flash描述图片用本地db存起来用标签的md5作为id，同样考虑成本问题暂时不做。
+    return "[动画表情]"
+
+
+@MESSAGE_DECODERS.register(MessageType.LOCATION_MESSAGE)
+def _decode_location(context: DecodeContext):
+    return parse_location(context.message_content)
+
+
+@MESSAGE_DECODERS.register(MessageType.CARD_MESSAGE)
+def _decode_card(context: DecodeContext):
+    return card_message_parse(context.message.content)
+
+
+@MESSAGE_DECODERS.register(MessageType.NOTICE_MESSAGE)
+def _decode_notice(context: DecodeContext):
+    # 通知消息会有一部分消息获取不到wxid和名称，用微信团队兜底
+    if context.nick_name == "未知用户" and not context.sender_id:
+        context.nick_name, context.remark = "微信团队", ""
+        context.sender_id = "weixin"
+    return notice_message_parse(context.message.content)
+
+
+def get_memory(from_user, to_user, query: str = None, max_bytes: int = None):
+    """
+    获取联系人的记忆。
+    :param query: 当前的查询，传入 query 或 max_bytes 时按相关度与时间排序
+    :param max_bytes: 记忆的总字节预算，为 None 时返回全部记忆
+    """
     db = MemoryDatabase()
+    if query or max_bytes:
+        memories = db.retrieve_memories(from_user=from_user, to_user=to_user, query=query, max_bytes=max_bytes)
+        return [{"memory_id": item["memory_id"], "type": item["type"], "content": item["content"],
+                 "event_time": item["event_time"], "wxid": to_user} for item in memories]
     memories = db.get_memory(
         from_user=from_user,
         to_user=to_user
@@ -357,7 +438,7 @@ def get_talker_name(db_handle: str | int, wxid, port=19001) -> tuple[str, str, s
 
 def process_messages(msg_db_handle: list, micro_msg_db_handle: str | int, wxid, write_function: Callable,
                      include_image=False, start_time=None, end_time=None,
-                     port=19001):
+                     port=19001, prefetch: Callable = None):
     """
     处理消息
     :param msg_db_handle: msg.db数据库句柄
@@ -368,9 +449,12 @@ def process_messages(msg_db_handle: list, micro_msg_db_handle: str | int, wxid,
     :param start_time:
     :param end_time:
     :param port:
+    :param prefetch: 在逐条处理之前，以本次导出的全部原始消息行为参数调用一次，用于批量预取数据
     :return:
     """
     data = get_all_message(msg_db_handle, wxid, include_image, port=port, start_time=start_time, end_time=end_time)
+    if prefetch is not None:
+        prefetch(data)
 
     user_info = post(f'http://127.0.0.1:{port}/api/userInfo').json().get('data')
 
@@ -499,11 +583,17 @@ def write_doc(msg_db_handle: list, micro_msg_db_handle: str | int, wxid, doc_fil
 
 
 def write_txt(msg_db_handle: list, micro_msg_db_handle: str | int, wxid, filename=None,
-              port=19001, file_type='json', endswith_txt=True, start_time=None, end_time=None, include_image=False):
+              port=19001, file_type='json', endswith_txt=True, start_time=None, end_time=None, include_image=False,
+              noise_filter: NoiseFilter = None, memory_query: str = None, memory_max_bytes: int = None):
+    """
+    导出聊天记录。
+    :param memory_query: 本次导出要回答的问题，传入时 meta.context.memories 按与问题的相关度排序
+    :param memory_max_bytes: meta.context.memories 的字节预算，为 None 时包含全部记忆
+    """
     user_info: dict = post(f'http://127.0.0.1:{port}/api/userInfo').json().get('data')
     main_remark, main_username, _ = get_talker_name(micro_msg_db_handle, wxid, port=port)
     is_room = '@chatroom' in wxid
-    memories = get_memory(from_user=user_info.get('wxid'), to_user=wxid)
+    memories = get_memory(from_user=user_info.get('wxid'), to_user=wxid, query=memory_query, max_bytes=memory_max_bytes)
     result = {
         "meta": {
             "description": f'聊天记录的数据结构定义',
@@ -575,60 +665,35 @@ def write_txt(msg_db_handle: list, micro_msg_db_handle: str | int, wxid, filenam
 
     image_rec_db = ImageRecognitionDatabase()
 
+    decode_resources = {"image_rec_db": image_rec_db}
+
+    def prefetch_image_recognitions(rows):
+        # 一次查询取出导出范围内所有图片的识别结果，避免每张图片单独查询
+        messages = [TextMessageFromDB(*row) for row in rows]
+        image_ids = [message.MsgSvrID for message in messages if message.Type == MessageType.IMAGE_MESSAGE]
+        decode_resources["image_recognitions"] = image_rec_db.get_recognition_results(image_ids)
+
     def callback(_nick_name, _remark, _format_time, _message_content, _mention_list, _room,
                  _original_message: TextMessageFromDB, sender_id=None):
 
-        # 根据消息类型，获取对应的内容。表情包和图片描述解析违禁风险过大，暂时不做。
-        content_types = {
-            MessageType.IMAGE_MESSAGE: "[图片]\n图片描述: 无具体描述",
-            # 可以通过GML 4V Flash描述图片，然后单独开一个本地db，把描述和msg_id关联。考虑到成本问题，暂时不做。
-            MessageType.VIDEO_MESSAGE: "[视频]",
-            MessageType.TEXT_MESSAGE: _message_content,
-            MessageType.VOICE_MESSAGE: "[语音]",
-            MessageType.LOCATION_MESSAGE: "[位置消息]",
-            MessageType.EMOJI_MESSAGE: "[动画表情]",
-            # 同样可以通过content字段的cndurl下载表情图片，GML 4V Flash描述图片用本地db存起来用标签的md5作为id，同样考虑成本问题暂时不做。
-            MessageType.XML_MESSAGE: "[未解析的XML消息]",
-            MessageType.NOTICE_MESSAGE: "[通知消息]",
-        }
-
-        reply_msg_id = None
-
-        if _original_message.Type == MessageType.XML_MESSAGE:
-            xml_prese_result = xml_message_parse(_original_message.CompressContent)
-            content_types[MessageType.XML_MESSAGE] = xml_prese_result.get('content', '[未解析的XML消息]')
-            reply_msg_id = xml_prese_result.get('ext_info', {'reply_msg_id', None}).get('reply_msg_id')
-            if reply_msg_id:
-                for history in result['data'][::-1]:
-                    if history['msg_id'] == reply_msg_id:
-                        original_content = history.get("content") if len(
-                            history.get("content")) < 10 else f'{history.get("content")[0:5]} ...'
-                        content_types[
-                            MessageType.XML_MESSAGE] = f"[引用消息：{_nick_name} 回复 {history.get('sender')}]\n原始消息(部分): 「{original_content}」\n回复内容(完整): {content_types[MessageType.XML_MESSAGE]}"
-                        break
-
-        elif _original_message.Type == MessageType.NOTICE_MESSAGE:
-            content_types[MessageType.NOTICE_MESSAGE] = notice_message_parse(_original_message.content)
-            # 通知消息会有一部分消息获取不到wxid和名称，用微信团队兜底
-            if _nick_name == "未知用户" and not sender_id:
-                _nick_name, _remark = "微信团队", ""
-                sender_id = "weixin"
-
-        elif _original_message.Type == MessageType.CARD_MESSAGE:
-            content_types[MessageType.CARD_MESSAGE] = card_message_parse(_original_message.content)
-
-        elif _original_message.Type == MessageType.LOCATION_MESSAGE:
-            content_types[MessageType.LOCATION_MESSAGE] = parse_location(_message_content)
-
-        elif _original_message.Type == MessageType.IMAGE_MESSAGE:
-            _, recognition_result, _ = image_rec_db.get_recognition_result(_original_message.MsgSvrID)
-            if recognition_result is not None:
-                content_types[MessageType.IMAGE_MESSAGE] = f"[图片]\n图片描述: {recognition_result}"
+        # 根据消息类型，通过解码器注册表获取对应的内容。表情包和图片描述解析违禁风险过大，暂时不做。
+        context = DecodeContext(
+            message=_original_message,
+            message_content=_message_content,
+            nick_name=_nick_name,
+            remark=_remark,
+            sender_id=sender_id,
+            history=result['data'],
+            resources=decode_resources,
+        )
+        content = MESSAGE_DECODERS.decode(context)
+        _nick_name, _remark, sender_id = context.nick_name, context.remark, context.sender_id
+        reply_msg_id = context.ext_info.get('reply_msg_id')
 
         item = {
             "sender": _nick_name,
             "remark": _remark,
-            "content": content_types.get(_original_message.Type),
+            "content": content,
             "time": _format_time,
             "wxid": sender_id,
             "msg_id": _original_message.MsgSvrID,
@@ -645,9 +710,16 @@ def write_txt(msg_db_handle: list, micro_msg_db_handle: str | int, wxid, filenam
         wxid=wxid,
         write_function=callback,
         port=port,
-        include_image=include_image, start_time=start_time, end_time=end_time
+        include_image=include_image, start_time=start_time, end_time=end_time,
+        prefetch=prefetch_image_recognitions
     )
 
+    if noise_filter is not None:
+        # 被过滤的消息不写入导出结果，只在 meta 中记录统计与 msg_id，需要时可以按 msg_id 回查原始消息
+        filter_result = noise_filter.apply(result['data'])
+        result['data'] = filter_result.messages
+        result['meta']['noise_filter'] = {**filter_result.stats, "removed_msg_ids": list(filter_result.removed)}
+
     if file_type is None: return result
 
     if file_type.lower() not in ['json', 'yaml', 'yml']: file_type = 'json'
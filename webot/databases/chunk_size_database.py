@@ -0,0 +1,67 @@
+from typing import Dict, Optional
+
+from webot.databases.local_database import LocalDatabase
+
+
+class ChunkSizeDatabase(LocalDatabase):
+    """
+    各模型自适应学习到的分块大小上限，按 (模型名, 单位) 存储，单位为 bytes 或 tokens。
+    """
+
+    def __init__(self, db_name: str = "chunk_size", *args, **kwargs):
+        super().__init__(db_name=db_name, *args, **kwargs)
+        self._create_tables()
+
+    def _create_tables(self):
+        self.execute_query("""
+        CREATE TABLE IF NOT EXISTS model_chunk_size (
+            model_name TEXT NOT NULL,
+            unit TEXT NOT NULL CHECK(unit IN ('bytes', 'tokens')),
+            max_chunk_size INTEGER NOT NULL,
+            context_errors INTEGER DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (model_name, unit)
+        )
+        """, commit=True)
+
+    def get_limits(self, model_name: str) -> Dict[str, int]:
+        """
+        获取模型已学习到的分块大小上限
+        :param model_name: 模型名称
+        :return: {unit: max_chunk_size}
+        """
+        result = self.execute_query("""
+        SELECT unit, max_chunk_size FROM model_chunk_size WHERE model_name = ?
+        """, (model_name,))
+        return dict(result.fetchall())
+
+    def set_limit(self, model_name: str, unit: str, max_chunk_size: Optional[int], context_error: bool = False) -> None:
+        """
+        保存模型的分块大小上限，max_chunk_size 为 None 时删除记录，恢复为使用配置值
+        :param model_name: 模型名称
+        :param unit: bytes 或 tokens
+        :param max_chunk_size: 分块大小上限
+        :param context_error: 本次更新是否由上下文超长错误触发，用于统计
+        """
+        if max_chunk_size is None:
+            self.execute_query("DELETE FROM model_chunk_size WHERE model_name = ? AND unit = ?", (model_name, unit),
+                               commit=True)
+            return
+        self.execute_query("""
+        INSERT INTO model_chunk_size (model_name, unit, max_chunk_size, context_errors) VALUES (?, ?, ?, ?)
+        ON CONFLICT (model_name, unit) DO UPDATE SET
+            max_chunk_size = excluded.max_chunk_size,
+            context_errors = context_errors + excluded.context_errors,
+            updated_at = CURRENT_TIMESTAMP
+        """, (model_name, unit, int(max_chunk_size), int(context_error)), commit=True)
+
+    def list_limits(self) -> list:
+        """
+        所有模型的分块大小上限
+        :return: [{"model_name", "unit", "max_chunk_size", "context_errors", "updated_at"}, ...]
+        """
+        result = self.execute_query("""
+        SELECT model_name, unit, max_chunk_size, context_errors, updated_at FROM model_chunk_size ORDER BY model_name
+        """)
+        return [dict(zip(("model_name", "unit", "max_chunk_size", "context_errors", "updated_at"), row))
+                for row in result.fetchall()]
@@ -1,10 +1,40 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from uuid import uuid4
-from json import dumps
+from json import dumps, loads
 
 from webot.databases.local_database import LocalDatabase
 
 
+def encode_cursor(*values) -> str:
+    """把排序键编码为分页游标，前端原样传回即可。"""
+    return urlsafe_b64encode(dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    解码分页游标。
+    :raises ValueError: 游标格式不正确
+    """
+    try:
+        return loads(urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError(f"无效的分页游标：{cursor}") from e
+
+
 class ConversationsDatabase(LocalDatabase):
+    MIGRATIONS = (
+        # 1: 按会话读取消息、按用户列出会话的索引
+        (
+            "CREATE INDEX IF NOT EXISTS idx_messages_conversation_time ON ConversationMessages (conversation_id, timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_conversations_user_start ON Conversations (user_id, start_time)",
+        ),
+        # 2: AI 对话的滚动摘要，context_summary_count 为已并入摘要的对话状态消息数
+        (
+            "ALTER TABLE Conversations ADD COLUMN context_summary TEXT",
+            "ALTER TABLE Conversations ADD COLUMN context_summary_count INTEGER DEFAULT 0",
+        ),
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(db_name="conversation", *args, **kwargs)
         self.create_tables()
@@ -49,9 +79,10 @@ class ConversationsDatabase(LocalDatabase):
         return cursor.lastrowid
 
     def add_message(self, conversation_id: int, role: str, content: str, timestamp: str, visible: int = 1,
-                    wechat_message_config: str | dict = None, message_id: str = None) -> str:
+                    wechat_message_config: str | dict = None, message_id: str = None, wait: bool = True) -> str:
         """
         添加消息
+        :param wait: 是否等待写入提交。流式保存时可以为 False，读取会话消息前调用 flush
         :param message_id:
         :param wechat_message_config:
         :param conversation_id: 会话的id
@@ -68,7 +99,7 @@ class ConversationsDatabase(LocalDatabase):
         """
         self.execute_query(query,
                            (conversation_id, role, content, timestamp, visible, wechat_message_config, message_id),
-                           commit=True)
+                           commit=True, wait=wait)
         return message_id
 
     def get_conversation_by_user(self, user_id: str) -> list:
@@ -78,7 +109,8 @@ class ConversationsDatabase(LocalDatabase):
         :return: 用户的所有会话列表
         """
         query = """
-            SELECT * FROM Conversations WHERE user_id = ? ORDER BY start_time DESC
+            SELECT conversation_id, user_id, start_time, end_time, summary FROM Conversations
+            WHERE user_id = ? ORDER BY start_time DESC
         """
         cursor = self.execute_query(query, (user_id,))
         return [
@@ -121,6 +153,128 @@ class ConversationsDatabase(LocalDatabase):
             cursor.fetchall()
         ]
 
+    def get_conversations_page(self, user_id: str, limit: int = 20, cursor: str = None) -> dict:
+        """
+        按开始时间倒序分页获取用户的会话（键集分页，翻页开销与页码无关）
+        :param user_id: wxid
+        :param limit: 每页条数
+        :param cursor: 上一页返回的 next_cursor，为 None 时从最新的会话开始
+        :return: {"items": 会话列表, "next_cursor": 下一页游标, "has_more": 是否还有更早的会话}
+        """
+        params = [user_id]
+        keyset = ""
+        if cursor:
+            start_time, conversation_id = decode_cursor(cursor)
+            keyset = "AND (start_time, conversation_id) < (?, ?)"
+            params += [start_time, conversation_id]
+        query = f"""
+            SELECT conversation_id, user_id, start_time, end_time, summary FROM Conversations
+            WHERE user_id = ? {keyset}
+            ORDER BY start_time DESC, conversation_id DESC LIMIT ?
+        """
+        rows = self.execute_query(query, (*params, limit + 1)).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "items": [
+                {
+                    "conversation_id": conversation_id,
+                    "user_id": user_id,
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "summary": summary
+                }
+                for conversation_id, user_id, start_time, end_time, summary in rows
+            ],
+            "next_cursor": encode_cursor(rows[-1][2], rows[-1][0]) if has_more else None,
+            "has_more": has_more,
+        }
+
+    def get_messages_page(self, conversation_id: int, limit: int = 50, cursor: str = None,
+                          visible: list[int] | None = None, preview_chars: int = None) -> dict:
+        """
+        从最新的消息开始向前分页获取会话消息，每页内按时间正序排列，可以直接插入到已加载消息的前面
+        :param conversation_id: 会话的id
+        :param limit: 每页条数
+        :param cursor: 上一页返回的 next_cursor，为 None 时从最新的消息开始
+        :param visible: 可见性过滤，默认只返回可见消息
+        :param preview_chars: 大字段延迟加载。content 只返回前 preview_chars 个字符，
+            长度超过 preview_chars 的 wechat_message_config 返回 None，完整内容通过 get_message 获取。为 None 时返回完整内容
+        :return: {"items": 消息列表, "next_cursor": 更早一页的游标, "has_more": 是否还有更早的消息}
+        """
+        if visible is None:
+            visible = [1]
+
+        placeholders = ",".join("?" * len(visible))
+        params = [conversation_id, *visible]
+        keyset = ""
+        if cursor:
+            timestamp, row_id = decode_cursor(cursor)
+            keyset = "AND (timestamp, rowid) < (?, ?)"
+            params += [timestamp, row_id]
+        if preview_chars is None:
+            columns = "content, wechat_message_config"
+        else:
+            columns = ("substr(content, 1, ?), "
+                       "CASE WHEN length(wechat_message_config) <= ? THEN wechat_message_config END")
+            params = [preview_chars, preview_chars, *params]
+        query = f"""
+            SELECT rowid, message_id, conversation_id, role, {columns}, visible, timestamp,
+                length(content), length(wechat_message_config)
+            FROM ConversationMessages
+            WHERE conversation_id = ? AND visible in ({placeholders}) {keyset}
+            ORDER BY timestamp DESC, rowid DESC LIMIT ?
+        """
+        rows = self.execute_query(query, (*params, limit + 1)).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = []
+        for (row_id, message_id, conversation_id, role, content, wechat_message_config, visible, timestamp,
+             content_length, config_length) in reversed(rows):
+            item = {
+                "message_id": message_id,
+                "conversation_id": conversation_id,
+                "role": role,
+                "content": content,
+                "visible": visible,
+                "wechat_message_config": wechat_message_config,
+                "timestamp": timestamp
+            }
+            if preview_chars is not None:
+                item["content_length"] = content_length
+                item["content_truncated"] = (content_length or 0) > preview_chars
+                item["wechat_message_config_omitted"] = wechat_message_config is None and config_length is not None
+            items.append(item)
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(rows[-1][7], rows[-1][0]) if has_more else None,
+            "has_more": has_more,
+        }
+
+    def get_message(self, message_id: str) -> dict | None:
+        """
+        获取单条消息的完整内容，用于分页预览后按需加载大字段
+        :param message_id: 消息的id
+        :return: 消息，不存在时返回 None
+        """
+        query = """
+            SELECT message_id, conversation_id, role, content, visible, wechat_message_config, timestamp
+            FROM ConversationMessages WHERE message_id = ?
+        """
+        row = self.execute_query(query, (message_id,)).fetchone()
+        if not row:
+            return None
+        message_id, conversation_id, role, content, visible, wechat_message_config, timestamp = row
+        return {
+            "message_id": message_id,
+            "conversation_id": conversation_id,
+            "role": role,
+            "content": content,
+            "visible": visible,
+            "wechat_message_config": wechat_message_config,
+            "timestamp": timestamp
+        }
+
     def delete_message(self, message_id: str):
         query = """
             DELETE FROM ConversationMessages WHERE message_id = ?
@@ -152,6 +306,32 @@ class ConversationsDatabase(LocalDatabase):
         """
         self.execute_query(query, (summary, conversation_id), commit=True)
 
+    def get_context_summary(self, conversation_id: int | str) -> tuple[str | None, int | None]:
+        """
+        获取 AI 对话的滚动摘要
+        :param conversation_id: 会话的id
+        :return: (摘要, 已并入摘要的消息数)，会话不存在时返回 (None, None)
+        """
+        query = """
+            SELECT context_summary, context_summary_count FROM Conversations WHERE conversation_id = ?
+        """
+        row = self.execute_query(query, (conversation_id,)).fetchone()
+        if not row:
+            return None, None
+        return row[0], row[1] or 0
+
+    def update_context_summary(self, conversation_id: int | str, context_summary: str | None, count: int):
+        """
+        更新 AI 对话的滚动摘要
+        :param conversation_id: 会话的id
+        :param context_summary: 摘要
+        :param count: 已并入摘要的对话状态消息数
+        """
+        query = """
+            UPDATE Conversations SET context_summary = ?, context_summary_count = ? WHERE conversation_id = ?
+        """
+        self.execute_query(query, (context_summary, count, conversation_id), commit=True)
+
     def update_conversation_end_time(self, conversation_id: int, end_time: str):
         """
         更新会话的结束时间
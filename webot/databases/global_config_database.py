@@ -1,4 +1,5 @@
 from webot.databases.local_database import LocalDatabase
+from webot.utils.memory_ranker import rank_memories
 
 
 class LLMConfigDatabase(LocalDatabase):
@@ -261,6 +262,14 @@ class LLMConfigDatabase(LocalDatabase):
 
 
 class MemoryDatabase(LocalDatabase):
+    # memory_database.db 的迁移统一在这里声明，HistorySummaryDatabase 不声明迁移
+    MIGRATIONS = (
+        # 1: 按归属者、对象与类型读取记忆的索引
+        (
+            "CREATE INDEX IF NOT EXISTS idx_memory_user_type ON memory (from_user, to_user, type)",
+        ),
+    )
+
     def __init__(self, db_name: str = "memory_database", *args, **kwargs):
         super().__init__(db_name)
         self._create_table()
@@ -343,6 +352,29 @@ SELECT memory_id, type, content, event_time, created_at FROM memory WHERE from_u
         result = self.execute_query(sql, params)
         return result.fetchall()
 
+    def retrieve_memories(self, from_user: str, to_user: str, query: str = None, max_bytes: int = 4000,
+                          max_tokens: int = None, count_tokens=None, type: str = None,
+                          recency_weight: float = 0.3, half_life_days: float = 180) -> list:
+        """
+        按与查询的相关度（BM25）和时间远近（event_time，没有时取 created_at）排序，返回预算内得分最高的记忆。
+        :param from_user: 记忆归属者主账号，传wxid。
+        :param to_user: 记忆的对象，传wxid。
+        :param query: 当前的查询，为空时只按时间排序。
+        :param max_bytes: 按 "- 类型: 内容" 格式计算的总字节数上限，为 None 时不限制。
+        :param max_tokens: 总 Token 数上限，需要同时传入 count_tokens。
+        :param count_tokens: Token 计数函数，例如 `get_token_counter(model_name).count`。
+        :param type: 只检索指定类型的记忆。
+        :param recency_weight: 时间得分的权重，0 到 1。
+        :param half_life_days: 时间得分的半衰期（天）。
+        :return: 按得分从高到低排列的记忆列表，字段为 memory_id、type、content、event_time、created_at、score。
+        """
+        memories = [
+            dict(zip(("memory_id", "type", "content", "event_time", "created_at"), row))
+            for row in self.get_memory(from_user, to_user, type=type)
+        ]
+        return rank_memories(memories, query, max_bytes=max_bytes, max_tokens=max_tokens, count_tokens=count_tokens,
+                             recency_weight=recency_weight, half_life_days=half_life_days)
+
     def get_memory_by_id(self, memory_id: int) -> dict | None:
         sql = """
 SELECT memory_id, from_user, to_user, type, content, event_time, created_at FROM memory WHERE memory_id = ?
@@ -380,3 +412,126 @@ UPDATE memory SET content = ?, updated_at = CURRENT_TIMESTAMP WHERE memory_id =
 
         return
 
+
+
+class HistorySummaryDatabase(LocalDatabase):
+    """
+    聊天记录的预计算摘要，与 MemoryDatabase 存放在同一个数据库文件中，数据库迁移由 MemoryDatabase 管理。
+    按天与按周两级存储，fingerprint 记录生成摘要时的消息指纹，消息有变化的天才需要重新生成。
+    """
+
+    def __init__(self, db_name: str = "memory_database", *args, **kwargs):
+        super().__init__(db_name)
+        self._create_table()
+
+    def _create_table(self):
+        """
+        from_user: 摘要归属者主账号，传wxid。
+        to_user: 摘要的对象，私聊为对方wxid，群聊为群wxid。
+        day: 日期，格式为 YYYY-MM-DD。
+        week_start: 周一的日期，格式为 YYYY-MM-DD。
+        fingerprint: 按天为当天消息的指纹，按周为组成该周的各天指纹的指纹。
+        """
+        self.execute_query("""
+CREATE TABLE IF NOT EXISTS day_summary (
+    from_user TEXT NOT NULL,
+    to_user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    content TEXT,
+    message_count INTEGER DEFAULT 0,
+    fingerprint TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (from_user, to_user, day)
+)
+""", commit=True)
+        self.execute_query("""
+CREATE TABLE IF NOT EXISTS week_summary (
+    from_user TEXT NOT NULL,
+    to_user TEXT NOT NULL,
+    week_start TEXT NOT NULL,
+    content TEXT,
+    message_count INTEGER DEFAULT 0,
+    fingerprint TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (from_user, to_user, week_start)
+)
+""", commit=True)
+
+    def get_day_fingerprints(self, from_user: str, to_user: str, start_day: str, end_day: str) -> dict:
+        """
+        获取日期范围内已生成摘要的各天指纹。
+        :return: {day: fingerprint}
+        """
+        result = self.execute_query("""
+SELECT day, fingerprint FROM day_summary WHERE from_user = ? AND to_user = ? AND day BETWEEN ? AND ?
+""", (from_user, to_user, start_day, end_day))
+        return dict(result.fetchall())
+
+    def get_week_fingerprints(self, from_user: str, to_user: str, start_day: str, end_day: str) -> dict:
+        """
+        获取日期范围内已生成摘要的各周指纹。
+        :return: {week_start: fingerprint}
+        """
+        result = self.execute_query("""
+SELECT week_start, fingerprint FROM week_summary WHERE from_user = ? AND to_user = ? AND week_start BETWEEN ? AND ?
+""", (from_user, to_user, start_day, end_day))
+        return dict(result.fetchall())
+
+    def get_day_summaries(self, from_user: str, to_user: str, start_day: str, end_day: str) -> list:
+        """
+        获取日期范围内的按天摘要，按日期升序。
+        :return: [{"day", "content", "message_count", "fingerprint", "updated_at"}, ...]
+        """
+        result = self.execute_query("""
+SELECT day, content, message_count, fingerprint, updated_at FROM day_summary
+WHERE from_user = ? AND to_user = ? AND day BETWEEN ? AND ? ORDER BY day
+""", (from_user, to_user, start_day, end_day))
+        return [dict(zip(("day", "content", "message_count", "fingerprint", "updated_at"), row))
+                for row in result.fetchall()]
+
+    def get_week_summaries(self, from_user: str, to_user: str, start_day: str, end_day: str) -> list:
+        """
+        获取日期范围内的按周摘要，按周升序。
+        :return: [{"week_start", "content", "message_count", "fingerprint", "updated_at"}, ...]
+        """
+        result = self.execute_query("""
+SELECT week_start, content, message_count, fingerprint, updated_at FROM week_summary
+WHERE from_user = ? AND to_user = ? AND week_start BETWEEN ? AND ? ORDER BY week_start
+""", (from_user, to_user, start_day, end_day))
+        return [dict(zip(("week_start", "content", "message_count", "fingerprint", "updated_at"), row))
+                for row in result.fetchall()]
+
+    def upsert_day_summary(self, from_user: str, to_user: str, day: str, content: str, message_count: int,
+                           fingerprint: str) -> None:
+        """
+        写入或覆盖一天的摘要。
+        """
+        self.execute_query("""
+INSERT INTO day_summary (from_user, to_user, day, content, message_count, fingerprint) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (from_user, to_user, day) DO UPDATE SET
+    content = excluded.content, message_count = excluded.message_count, fingerprint = excluded.fingerprint,
+    updated_at = CURRENT_TIMESTAMP
+""", (from_user, to_user, day, content, message_count, fingerprint), commit=True)
+
+    def upsert_week_summary(self, from_user: str, to_user: str, week_start: str, content: str, message_count: int,
+                            fingerprint: str) -> None:
+        """
+        写入或覆盖一周的摘要。
+        """
+        self.execute_query("""
+INSERT INTO week_summary (from_user, to_user, week_start, content, message_count, fingerprint) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (from_user, to_user, week_start) DO UPDATE SET
+    content = excluded.content, message_count = excluded.message_count, fingerprint = excluded.fingerprint,
+    updated_at = CURRENT_TIMESTAMP
+""", (from_user, to_user, week_start, content, message_count, fingerprint), commit=True)
+
+    def delete_summaries(self, from_user: str, to_user: str) -> None:
+        """
+        删除某个聊天对象的全部摘要。
+        """
+        self.execute_query("DELETE FROM day_summary WHERE from_user = ? AND to_user = ?", (from_user, to_user),
+                           commit=True)
+        self.execute_query("DELETE FROM week_summary WHERE from_user = ? AND to_user = ?", (from_user, to_user),
+                           commit=True)
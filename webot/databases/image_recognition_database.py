@@ -1,7 +1,27 @@
+from json import dumps
+
 from webot.databases.local_database import LocalDatabase
 
 
 class ImageRecognitionDatabase(LocalDatabase):
+    MIGRATIONS = (
+        # 1: 清理同一条消息的重复识别结果，优先保留有效描述中最新的一条，然后建立唯一索引
+        (
+            """
+            DELETE FROM image_recognition WHERE id NOT IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY message_id
+                        ORDER BY (recognition_result IS NULL OR recognition_result = '无具体描述'), id DESC
+                    ) AS row_number
+                    FROM image_recognition
+                ) WHERE row_number = 1
+            )
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_image_recognition_message_id ON image_recognition (message_id)",
+        ),
+    )
+
     def __init__(self, db_name="image_recognition"):
         super().__init__(db_name)
         self.create_table()
@@ -19,43 +39,69 @@ class ImageRecognitionDatabase(LocalDatabase):
             """, commit=True
         )
 
-    def add_recognition_result(self, message_id, recognition_result, message_time):
+    def add_recognition_result(self, message_id, recognition_result, message_time, wait=True):
+        """
+        保存识别结果，同一条消息已有结果时覆盖。
+        :param wait: 为 False 时不等待提交完成，返回 None，读取前需要调用 flush
+        """
         cursor = self.execute_query(
             """
             INSERT INTO image_recognition (message_id, recognition_result, message_time)
-            VALUES (?, ?, ?);
+            VALUES (?, ?, ?)
+            ON CONFLICT (message_id) DO UPDATE SET
+                recognition_result = excluded.recognition_result,
+                message_time = COALESCE(excluded.message_time, image_recognition.message_time),
+                timestamp = CURRENT_TIMESTAMP;
             """,
-            (message_id, recognition_result, message_time), commit=True
+            (message_id, recognition_result, message_time), commit=True, wait=wait
         )
-        return cursor.lastrowid
+        return cursor.lastrowid if cursor else None
 
     def get_recognition_result(self, message_id):
         cursor = self.execute_query(
             """
             SELECT message_id, recognition_result, message_time FROM image_recognition WHERE message_id = ?;
             """,
-            (message_id,), commit=True
+            (message_id,)
         )
         result = cursor.fetchone()
         if not result: return None, None, None
         return result
 
+    def get_recognition_results(self, message_ids) -> dict:
+        """
+        批量获取识别结果。所有ID作为一个 JSON 数组参数传入，通过 json_each 与 message_id 唯一索引连接，只查询一次。
+        :param message_ids: 消息ID列表
+        :return: {message_id(str): recognition_result}，没有识别结果的消息不在字典中
+        """
+        message_ids = list({str(message_id) for message_id in message_ids if message_id})
+        if not message_ids:
+            return {}
+        cursor = self.execute_query(
+            """
+            SELECT message_id, recognition_result FROM image_recognition
+            WHERE message_id IN (SELECT value FROM json_each(?));
+            """,
+            (dumps(message_ids),)
+        )
+        return {str(message_id): recognition_result for message_id, recognition_result in cursor.fetchall()}
+
     def get_all_recognition_results(self):
         cursor = self.execute_query(
             """
             SELECT message_id, recognition_result, message_time FROM image_recognition;
-            """, commit=True
+            """
         )
         return cursor.fetchall()
 
-    def update_recognition_result(self, message_id, recognition_result):
+    def update_recognition_result(self, message_id, recognition_result, wait=True):
         cursor = self.execute_query(
             """
             UPDATE image_recognition SET recognition_result = ? WHERE message_id = ?;
             """,
-            (recognition_result, message_id), commit=True
+            (recognition_result, message_id), commit=True, wait=wait
         )
-        return cursor.rowcount
+        return cursor.rowcount if cursor else None
 
     def delete_recognition_result(self, message_id):
         cursor = self.execute_query(
@@ -0,0 +1,105 @@
+import time
+from typing import Optional
+
+from webot.databases.local_database import LocalDatabase
+
+
+class LLMCacheDatabase(LocalDatabase):
+    """
+    LLM 响应缓存，以 (命名空间, 模型参数, 消息) 的哈希作为键。
+    按过期时间与总大小淘汰，淘汰时优先删除最久未访问的记录。
+    """
+
+    def __init__(self, db_name: str = "llm_cache", *args, **kwargs):
+        super().__init__(db_name=db_name, *args, **kwargs)
+        self._create_tables()
+
+    def _create_tables(self):
+        self.execute_query("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            namespace TEXT NOT NULL,
+            return_val TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            hit_count INTEGER DEFAULT 0
+        )
+        """, commit=True)
+        self.execute_query("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed_at ON llm_cache (accessed_at);",
+                           commit=True)
+
+    def get(self, cache_key: str, ttl_seconds: float = None) -> Optional[str]:
+        """
+        读取缓存并刷新访问时间
+        :param cache_key: 缓存键
+        :param ttl_seconds: 过期秒数，超过则视为未命中，为 None 时不过期
+        :return: 序列化后的响应，未命中时返回 None
+        """
+        row = self.execute_query("SELECT return_val, created_at FROM llm_cache WHERE cache_key = ?",
+                                 (cache_key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if ttl_seconds and row[1] + ttl_seconds < now:
+            self.execute_query("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,), commit=True)
+            return None
+        # 访问时间只用于淘汰，不需要等待写入完成
+        self.execute_query("UPDATE llm_cache SET accessed_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                           (now, cache_key), commit=True, wait=False)
+        return row[0]
+
+    def put(self, cache_key: str, namespace: str, return_val: str) -> None:
+        """
+        写入缓存，已存在时覆盖
+        :param cache_key: 缓存键
+        :param namespace: 命名空间，通常是 模型名@base_url
+        :param return_val: 序列化后的响应
+        """
+        now = time.time()
+        self.execute_query("""
+        INSERT INTO llm_cache (cache_key, namespace, return_val, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET return_val = excluded.return_val, size = excluded.size,
+            created_at = excluded.created_at, accessed_at = excluded.accessed_at
+        """, (cache_key, namespace, return_val, len(return_val.encode('utf-8')), now, now), commit=True)
+
+    def evict(self, ttl_seconds: float = None, max_size_bytes: int = None) -> int:
+        """
+        淘汰过期记录，并在总大小超出上限时删除最久未访问的记录
+        :param ttl_seconds: 过期秒数
+        :param max_size_bytes: 缓存总大小上限
+        :return: 删除的记录数
+        """
+        deleted = 0
+        if ttl_seconds:
+            deleted += self.execute_query("DELETE FROM llm_cache WHERE created_at < ?",
+                                          (time.time() - ttl_seconds,), commit=True).rowcount
+        if max_size_bytes:
+            deleted += self.execute_query("""
+            DELETE FROM llm_cache WHERE cache_key IN (
+                SELECT cache_key FROM (
+                    SELECT cache_key, SUM(size) OVER (ORDER BY accessed_at DESC, cache_key) AS running_size
+                    FROM llm_cache
+                ) WHERE running_size > ?
+            )
+            """, (max_size_bytes,), commit=True).rowcount
+        return deleted
+
+    def clear(self, namespace: str = None) -> None:
+        """
+        清空缓存
+        :param namespace: 只清空指定命名空间，为 None 时清空全部
+        """
+        if namespace is None:
+            self.execute_query("DELETE FROM llm_cache", commit=True)
+        else:
+            self.execute_query("DELETE FROM llm_cache WHERE namespace = ?", (namespace,), commit=True)
+
+    def summary(self) -> dict:
+        """
+        缓存占用概况
+        :return: {"entries": 记录数, "size_bytes": 总大小, "hits": 累计命中次数}
+        """
+        entries, size_bytes, hits = self.execute_query(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hit_count), 0) FROM llm_cache").fetchone()
+        return {"entries": entries, "size_bytes": size_bytes, "hits": hits}
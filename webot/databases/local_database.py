@@ -1,44 +1,345 @@
-from threading import Lock
-from queue import Queue
-from os import path, mkdir
+from concurrent.futures import Future, TimeoutError
+from threading import Lock, RLock, Thread
+from queue import Queue, Empty
+from os import path, makedirs
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+import atexit
 import sqlite3
 
 from webot.utils.project_path import DATA_PATH
 
+# 每个数据库文件的最大连接数
+MAX_CONNECTIONS = 8
+
+# 每个连接打开时设置的参数。WAL 模式下读写互不阻塞，synchronous=NORMAL 时只在检查点同步磁盘，
+# 进程崩溃不会丢失已提交的数据，只有断电时可能丢失最后几次提交。
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+
+def connect(db_file: str, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_file, check_same_thread=False, **kwargs)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    单个数据库文件的连接池。连接在第一次使用时才创建，总数不超过 max_connections，
+    用尽时等待其他线程归还。
+    """
+
+    def __init__(self, db_file: str, max_connections: int = MAX_CONNECTIONS):
+        self.db_file = db_file
+        self.max_connections = max_connections
+        self._idle: Queue = Queue()
+        self._created = 0
+        self._lock = Lock()
+
+    def _create_connection(self) -> sqlite3.Connection:
+        return connect(self.db_file)
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_connections:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._create_connection()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        self._idle.put(conn)
+
+    @property
+    def created(self) -> int:
+        return self._created
+
+
+class DatabaseWriter:
+    """
+    单个数据库文件的写线程。所有 commit=True 的语句都排队交给这个线程执行，
+    线程每次取出队列中积压的全部语句，在一个事务中执行后只提交一次（组提交）。
+    每条语句使用独立的 SAVEPOINT，某条语句失败只回滚它自己，不影响同一批的其他语句。
+    """
+
+    def __init__(self, db_file: str, max_batch: int = 256):
+        self.db_file = db_file
+        self.max_batch = max_batch
+        self._queue: Queue = Queue()
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self.batches = 0
+        self.statements = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=f"db-writer-{path.basename(self.db_file)}", daemon=True)
+                self._thread.start()
+
+    def submit(self, query: Union[str, Callable[[sqlite3.Connection], object]], params: tuple = None) -> Future:
+        """
+        提交一条写语句。
+        :param query: SQL，或者接收写连接的函数（例如数据库迁移），函数在组提交的事务中执行，不能自行提交或回滚
+        :return: Future，提交成功后结果为执行该语句的游标（可读取 lastrowid、rowcount）或函数的返回值
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((query, params or (), future))
+        return future
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        写屏障：等待在此之前提交的所有写语句落库。
+        :param timeout: 最长等待秒数，为 None 时一直等待
+        :return: 是否在超时前完成
+        """
+        if self._thread is None:
+            return True
+        barrier = Future()
+        self._queue.put((None, None, barrier))
+        try:
+            barrier.result(timeout=timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def _take_batch(self) -> List[Tuple]:
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        # 写连接自己管理事务
+        conn = connect(self.db_file, isolation_level=None)
+        while True:
+            batch = self._take_batch()
+            statements = [item for item in batch if item[0] is not None]
+            results = []
+            try:
+                if statements:
+                    conn.execute("BEGIN IMMEDIATE")
+                    for query, params, future in statements:
+                        cursor = conn.cursor()
+                        try:
+                            cursor.execute("SAVEPOINT write_item")
+                            result = query(conn) if callable(query) else cursor.execute(query, params)
+                            cursor.execute("RELEASE write_item")
+                            results.append((future, result, None))
+                        except Exception as e:
+                            conn.execute("ROLLBACK TO write_item")
+                            conn.execute("RELEASE write_item")
+                            results.append((future, None, e))
+                    conn.execute("COMMIT")
+                    self.batches += 1
+                    self.statements += len(statements)
+            except Exception as e:
+                print(f"数据库 {self.db_file} 组提交失败：{e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                results = [(future, None, e) for _, _, future in statements]
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            for query, _, future in batch:
+                if query is None:
+                    future.set_result(None)
+
+
+class QueryResult:
+    """
+    只读查询的结果。行在连接归还连接池之前全部取出，之后其他线程复用该连接也不会影响这里的结果。
+    提供与 sqlite3.Cursor 相同的 fetchone、fetchmany、fetchall 与迭代接口。
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.description = cursor.description
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+        self._rows = cursor.fetchall()
+        self._position = 0
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        row = self._rows[self._position]
+        self._position += 1
+        return row
+
+    def fetchmany(self, size: int = 1) -> list:
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self) -> list:
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+# 进程内的连接池、写线程（按数据库文件）与数据库实例（按类和构造参数）注册表
+_POOLS: Dict[str, ConnectionPool] = {}
+_WRITERS: Dict[str, DatabaseWriter] = {}
+_INSTANCES: Dict[Tuple, "LocalDatabase"] = {}
+_REGISTRY_LOCK = RLock()
+
+
+def get_connection_pool(db_file: str) -> ConnectionPool:
+    """获取数据库文件对应的进程内唯一的连接池。"""
+    db_file = path.abspath(db_file)
+    with _REGISTRY_LOCK:
+        pool = _POOLS.get(db_file)
+        if pool is None:
+            pool = _POOLS[db_file] = ConnectionPool(db_file)
+        return pool
+
+
+def get_writer(db_file: str) -> DatabaseWriter:
+    """获取数据库文件对应的进程内唯一的写线程。"""
+    db_file = path.abspath(db_file)
+    with _REGISTRY_LOCK:
+        writer = _WRITERS.get(db_file)
+        if writer is None:
+            writer = _WRITERS[db_file] = DatabaseWriter(db_file)
+        return writer
+
+
+@atexit.register
+def flush_all(timeout: float = 10) -> None:
+    """等待所有数据库中排队的写语句落库，进程退出时自动调用。"""
+    for writer in list(_WRITERS.values()):
+        writer.flush(timeout=timeout)
+
+
+class _DatabaseRegistry(type):
+    """
+    LocalDatabase 的元类：相同的类与构造参数只创建一个实例，子类 __init__ 中的建表语句在进程内只执行一次。
+    """
+
+    def __call__(cls, *args, **kwargs):
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        instance = _INSTANCES.get(key)
+        if instance is not None:
+            return instance
+        with _REGISTRY_LOCK:
+            instance = _INSTANCES.get(key)
+            if instance is None:
+                instance = super().__call__(*args, **kwargs)
+                # 子类 __init__ 建表之后再执行迁移
+                instance.migrate()
+                _INSTANCES[key] = instance
+            return instance
+
+
+# 一个迁移步骤：按顺序执行的 SQL 语句，或者接收连接的函数（在同一个事务中执行）
+Migration = Union[Sequence[str], Callable[[sqlite3.Connection], None]]
+
+
+class LocalDatabase(metaclass=_DatabaseRegistry):
+    #: 数据库文件的迁移步骤，第 i 个步骤把 PRAGMA user_version 从 i 升级到 i + 1。
+    #: 只能追加新步骤，不能修改或删除已发布的步骤。多个类共用一个数据库文件时，只能由其中一个类声明迁移。
+    MIGRATIONS: Tuple[Migration, ...] = ()
 
-class LocalDatabase:
     def __init__(self, db_name: str, db_path: str = path.join(DATA_PATH, 'databases')):
         self._db_path = db_path
         if not path.exists(db_path):
-            mkdir(db_path)
+            makedirs(db_path, exist_ok=True)
         self._db_name = db_name if db_name.endswith(".db") else f"{db_name}.db"
-        self._pool = Queue(maxsize=50)  # 设置连接池大小
-        self._lock = Lock()
-        for _ in range(self._pool.maxsize):
-            self._pool.put(self._create_connection())
-
-    def _create_connection(self) -> sqlite3.Connection:
-        return sqlite3.connect(path.join(self._db_path, self._db_name), check_same_thread=False)
+        # 同一个数据库文件的所有实例共享一个连接池和一个写线程
+        self._pool = get_connection_pool(path.join(self._db_path, self._db_name))
+        self._writer = get_writer(path.join(self._db_path, self._db_name))
 
     @property
     def connection(self) -> sqlite3.Connection:
-        with self._lock:
-            return self._pool.get()
+        return self._pool.acquire()
+
+    def migrate(self) -> int:
+        """
+        执行尚未应用的迁移。迁移在写线程的 IMMEDIATE 事务中执行，版本号在事务内读取，
+        多个进程同时启动时只会有一个进程执行迁移，任一步骤失败时全部回滚。
+        :return: 迁移后的版本号
+        """
+        if not self.MIGRATIONS:
+            return 0
+
+        def apply(conn: sqlite3.Connection) -> int:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, migration in enumerate(self.MIGRATIONS[version:], start=version + 1):
+                print(f"数据库 {self._db_name} 迁移到版本 {target}")
+                if callable(migration):
+                    migration(conn)
+                else:
+                    for statement in migration:
+                        conn.execute(statement)
+                version = target
+            # PRAGMA 不支持参数绑定
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            return version
+
+        return self._writer.submit(apply).result()
 
     def release_connection(self, conn: sqlite3.Connection):
-        with self._lock:
-            self._pool.put(conn)
+        self._pool.release(conn)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        等待此前提交的所有写语句（包括 wait=False 的语句）落库，之后的读取一定能看到这些写入。
+        :param timeout: 最长等待秒数，为 None 时一直等待
+        :return: 是否在超时前完成
+        """
+        return self._writer.flush(timeout=timeout)
 
-    def execute_query(self, query: str, params: tuple = None, commit: bool = False) -> sqlite3.Cursor:
+    def execute_query(self, query: str, params: tuple = None, commit: bool = False,
+                      wait: bool = True) -> Optional[Union[sqlite3.Cursor, QueryResult]]:
+        """
+        执行一条语句。
+        :param query: SQL
+        :param params: 参数
+        :param commit: 是否为写语句。写语句交给写线程组提交，只读查询应为 False
+        :param wait: 写语句是否等待提交完成。为 False 时立即返回 None，需要读取写入结果前调用 flush
+        :return: 写语句返回写线程的游标（可读取 lastrowid、rowcount）；只读查询返回已取出全部行的 QueryResult
+        """
+        if commit:
+            future = self._writer.submit(query, params)
+            return future.result() if wait else None
         conn = self.connection
         cursor = conn.cursor()
         try:
             cursor.execute(query, params or ())
-            if commit:
-                conn.commit()
+            # 连接归还后可能立即被其他线程使用，必须在归还之前取出全部行
+            return QueryResult(cursor)
         except Exception as e:
             conn.rollback()
             raise
         finally:
+            cursor.close()
             self.release_connection(conn)
-        return cursor
\ No newline at end of file
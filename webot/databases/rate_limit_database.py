@@ -0,0 +1,147 @@
+import time
+from typing import Optional, Tuple
+
+from webot.databases.local_database import LocalDatabase
+
+
+class RateLimitDatabase(LocalDatabase):
+    """
+    LLM 调用的限流状态，按 apikey_id 记录最近一分钟的请求与 Token 消耗。
+    状态存放在 SQLite 中，因此同一台机器上的多个进程也能共享同一份限流预算。
+    """
+
+    def __init__(self, db_name: str = "rate_limit", *args, **kwargs):
+        super().__init__(db_name=db_name, *args, **kwargs)
+        self._create_tables()
+
+    def _create_tables(self):
+        self.execute_query("""
+        CREATE TABLE IF NOT EXISTS rate_limit_budget (
+            apikey_id INTEGER PRIMARY KEY,
+            rpm_limit INTEGER DEFAULT 0,
+            tpm_limit INTEGER DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """, commit=True)
+        self.execute_query("""
+        CREATE TABLE IF NOT EXISTS rate_limit_event (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            apikey_id INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            tokens INTEGER DEFAULT 0
+        )
+        """, commit=True)
+        self.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_rate_limit_event_key_time ON rate_limit_event (apikey_id, created_at);",
+            commit=True)
+        self.execute_query("""
+        CREATE TABLE IF NOT EXISTS rate_limit_block (
+            apikey_id INTEGER PRIMARY KEY,
+            blocked_until REAL NOT NULL
+        )
+        """, commit=True)
+
+    def get_budget(self, apikey_id: int) -> Optional[Tuple[int, int]]:
+        """
+        获取APIKEY的限流预算
+        :param apikey_id: APIKEY ID
+        :return: (rpm_limit, tpm_limit)，未配置时返回 None
+        """
+        result = self.execute_query("""
+        SELECT rpm_limit, tpm_limit FROM rate_limit_budget WHERE apikey_id = ?
+        """, (apikey_id,))
+        return result.fetchone()
+
+    def set_budget(self, apikey_id: int, rpm_limit: int = 0, tpm_limit: int = 0) -> None:
+        """
+        设置APIKEY的限流预算，0 表示不限制该维度
+        :param apikey_id: APIKEY ID
+        :param rpm_limit: 每分钟最大请求数
+        :param tpm_limit: 每分钟最大Token数
+        """
+        self.execute_query("""
+        INSERT INTO rate_limit_budget (apikey_id, rpm_limit, tpm_limit) VALUES (?, ?, ?)
+        ON CONFLICT(apikey_id) DO UPDATE SET rpm_limit = excluded.rpm_limit, tpm_limit = excluded.tpm_limit,
+            updated_at = CURRENT_TIMESTAMP
+        """, (apikey_id, rpm_limit, tpm_limit), commit=True)
+
+    def try_acquire(self, apikey_id: int, tokens: int, rpm_limit: int, tpm_limit: int,
+                    window: float = 60.0) -> Tuple[float, Optional[int]]:
+        """
+        尝试在滑动窗口内占用一次请求额度。整个判断在一个 IMMEDIATE 事务中完成，多进程并发时也是原子的。
+        :param apikey_id: APIKEY ID
+        :param tokens: 本次请求预计消耗的Token数
+        :param rpm_limit: 每分钟最大请求数，0 表示不限制
+        :param tpm_limit: 每分钟最大Token数，0 表示不限制
+        :param window: 滑动窗口的秒数
+        :return: (需要等待的秒数, 占用成功时的事件ID)。等待秒数为 0 时表示已占用成功。
+        """
+        conn = self.connection
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            conn.execute("DELETE FROM rate_limit_event WHERE apikey_id = ? AND created_at <= ?",
+                         (apikey_id, now - window))
+
+            blocked = conn.execute("SELECT blocked_until FROM rate_limit_block WHERE apikey_id = ?",
+                                   (apikey_id,)).fetchone()
+            if blocked and blocked[0] > now:
+                conn.rollback()
+                return blocked[0] - now, None
+
+            wait_time = 0.0
+            if rpm_limit or tpm_limit:
+                events = conn.execute(
+                    "SELECT created_at, tokens FROM rate_limit_event WHERE apikey_id = ? ORDER BY created_at ASC",
+                    (apikey_id,)).fetchall()
+                if rpm_limit and len(events) >= rpm_limit:
+                    wait_time = max(wait_time, events[len(events) - rpm_limit][0] + window - now)
+                if tpm_limit:
+                    tokens = min(tokens, tpm_limit)
+                    excess = sum(item[1] for item in events) + tokens - tpm_limit
+                    for created_at, event_tokens in events:
+                        if excess <= 0:
+                            break
+                        excess -= event_tokens
+                        wait_time = max(wait_time, created_at + window - now)
+
+            if wait_time > 0:
+                conn.rollback()
+                return wait_time, None
+
+            cursor = conn.execute("INSERT INTO rate_limit_event (apikey_id, created_at, tokens) VALUES (?, ?, ?)",
+                                  (apikey_id, now, tokens))
+            conn.commit()
+            return 0.0, cursor.lastrowid
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release_connection(conn)
+
+    def update_event_tokens(self, event_id: int, tokens: int) -> None:
+        """
+        请求结束后用实际消耗的Token数修正预估值
+        :param event_id: 事件ID
+        :param tokens: 实际消耗的Token数
+        """
+        self.execute_query("UPDATE rate_limit_event SET tokens = ? WHERE event_id = ?", (tokens, event_id),
+                           commit=True)
+
+    def delete_event(self, event_id: int) -> None:
+        """
+        删除一次请求记录，退还占用的额度
+        :param event_id: 事件ID
+        """
+        self.execute_query("DELETE FROM rate_limit_event WHERE event_id = ?", (event_id,), commit=True)
+
+    def block_until(self, apikey_id: int, blocked_until: float) -> None:
+        """
+        在指定时间前暂停该APIKEY的所有请求，通常来自服务端返回的 Retry-After
+        :param apikey_id: APIKEY ID
+        :param blocked_until: 解除暂停的 unix 时间戳
+        """
+        self.execute_query("""
+        INSERT INTO rate_limit_block (apikey_id, blocked_until) VALUES (?, ?)
+        ON CONFLICT(apikey_id) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)
+        """, (apikey_id, blocked_until), commit=True)
@@ -0,0 +1,137 @@
+import re
+from threading import Lock
+from typing import Dict, Optional
+
+from webot.databases.chunk_size_database import ChunkSizeDatabase
+
+# 各服务商上下文超长错误的特征文本
+_CONTEXT_LENGTH_ERROR_PATTERN = re.compile(
+    r"context[_ ]length|maximum context|context window|too many tokens|prompt is too long|input is too long|"
+    r"range of input length|exceeds the (?:maximum|limit)|reduce the length|"
+    r"超出.*(?:长度|上下文|限制)|(?:长度|上下文).*超", re.IGNORECASE)
+
+
+def is_context_length_error(error: BaseException) -> bool:
+    """判断模型调用的异常是否为输入超出上下文窗口。"""
+    code = getattr(error, 'code', None)
+    if code in ('context_length_exceeded', 'string_above_max_length'):
+        return True
+    return _CONTEXT_LENGTH_ERROR_PATTERN.search(str(error)) is not None
+
+
+class ChunkSizeController:
+    """
+    按模型自适应调整分块大小上限（AIMD）。
+
+    - 乘性减小：出现上下文超长错误时，上限降为失败块大小乘以 decrease_factor。
+    - 加性增大：连续 increase_after 次接近上限的块都在 fast_seconds 内成功返回时，上限增加配置值的 increase_ratio，
+      增大到不低于配置值时删除学习记录，恢复使用配置值。
+
+    学习到的上限保存在 `ChunkSizeDatabase` 中，同一模型的后续任务直接使用。
+    """
+
+    def __init__(self, model_name: str, database: ChunkSizeDatabase = None, decrease_factor: float = 0.5,
+                 increase_ratio: float = 0.1, increase_after: int = 5, fast_seconds: float = 30.0,
+                 min_chunk_size: Dict[str, int] = None):
+        """
+        :param model_name: 模型名称
+        :param database: 学习结果的存储，默认使用进程内共享的实例
+        :param decrease_factor: 上下文超长时的缩小倍数
+        :param increase_ratio: 每次增大的幅度，占配置上限的比例
+        :param increase_after: 连续多少次快速成功后增大一次
+        :param fast_seconds: 单次提取耗时低于该值视为快速成功
+        :param min_chunk_size: 各单位的最小上限，默认 bytes 为 2000，tokens 为 1000
+        """
+        self.model_name = model_name or "unknown"
+        self._db = database or _get_database()
+        self.decrease_factor = decrease_factor
+        self.increase_ratio = increase_ratio
+        self.increase_after = increase_after
+        self.fast_seconds = fast_seconds
+        self.min_chunk_size = {"bytes": 2000, "tokens": 1000, **(min_chunk_size or {})}
+        self._limits: Dict[str, int] = self._db.get_limits(self.model_name)
+        self._fast_streak: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def limit(self, unit: str, configured: int) -> int:
+        """
+        当前生效的分块大小上限，不超过配置值。
+        :param unit: bytes 或 tokens
+        :param configured: 配置的上限
+        """
+        with self._lock:
+            learned = self._limits.get(unit)
+        return min(configured, learned) if learned else configured
+
+    def on_context_error(self, unit: str, failed_size: int) -> int:
+        """
+        记录一次上下文超长错误，返回缩小后的上限。
+        :param unit: bytes 或 tokens
+        :param failed_size: 失败块的大小
+        """
+        with self._lock:
+            current = self._limits.get(unit) or failed_size
+            new_limit = max(self.min_chunk_size.get(unit, 1), int(min(current, failed_size) * self.decrease_factor))
+            self._limits[unit] = new_limit
+            self._fast_streak[unit] = 0
+        self._db.set_limit(self.model_name, unit, new_limit, context_error=True)
+        print(f"   模型 {self.model_name} 上下文超长，分块上限 ({unit}) 调整为 {new_limit}。")
+        return new_limit
+
+    def on_success(self, unit: str, size: int, seconds: float, configured: int) -> Optional[int]:
+        """
+        记录一次成功的提取，满足条件时增大上限。
+        :param unit: bytes 或 tokens
+        :param size: 块大小
+        :param seconds: 提取耗时
+        :param configured: 配置的上限
+        :return: 增大后的上限，未调整时返回 None
+        """
+        with self._lock:
+            learned = self._limits.get(unit)
+            # 只有接近上限的块才能说明上限偏保守
+            if not learned or size < learned * 0.8:
+                return None
+            if seconds > self.fast_seconds:
+                self._fast_streak[unit] = 0
+                return None
+            self._fast_streak[unit] = self._fast_streak.get(unit, 0) + 1
+            if self._fast_streak[unit] < self.increase_after:
+                return None
+            self._fast_streak[unit] = 0
+            new_limit = learned + max(1, int(configured * self.increase_ratio))
+            if new_limit >= configured:
+                self._limits.pop(unit, None)
+            else:
+                self._limits[unit] = new_limit
+        self._db.set_limit(self.model_name, unit, new_limit if new_limit < configured else None)
+        print(f"   模型 {self.model_name} 连续快速完成，分块上限 ({unit}) 调整为 {min(new_limit, configured)}。")
+        return min(new_limit, configured)
+
+
+_DATABASE: Optional[ChunkSizeDatabase] = None
+_CONTROLLERS: Dict[str, ChunkSizeController] = {}
+_CONTROLLERS_LOCK = Lock()
+
+
+def _get_database() -> ChunkSizeDatabase:
+    global _DATABASE
+    with _CONTROLLERS_LOCK:
+        if _DATABASE is None:
+            _DATABASE = ChunkSizeDatabase()
+        return _DATABASE
+
+
+def get_chunk_size_controller(model_name: str) -> ChunkSizeController:
+    """
+    获取进程内唯一的模型分块大小控制器。
+    :param model_name: 模型名称
+    :return: ChunkSizeController
+    """
+    key = model_name or "unknown"
+    database = _get_database()
+    with _CONTROLLERS_LOCK:
+        controller = _CONTROLLERS.get(key)
+        if controller is None:
+            controller = _CONTROLLERS[key] = ChunkSizeController(key, database=database)
+        return controller
@@ -0,0 +1,273 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from webot.databases.global_config_database import LLMConfigDatabase
+from webot.llm.chunk_size_controller import is_context_length_error
+from webot.llm.llm import LLMFactory
+
+# 只与某个端点的配置有关的 4xx（APIKEY 无效、无权限、模型不存在），换一个端点可能成功
+_ENDPOINT_SPECIFIC_STATUS = (401, 403, 404)
+
+
+class NoHealthyEndpointError(Exception):
+    """端点池中的所有端点都不可用。"""
+
+
+def is_non_retryable_error(error: BaseException) -> bool:
+    """
+    判断调用失败是否由请求本身导致：上下文超长，或者 429 与端点相关错误以外的 4xx（例如 400、413、422）。
+    这类错误换一个端点重试也会失败，应直接抛出，并且不计入端点的健康统计。
+    """
+    if is_context_length_error(error):
+        return True
+    response = getattr(error, 'response', None)
+    status_code = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+    return isinstance(status_code, int) and 400 <= status_code < 500 and status_code != 429 and \
+        status_code not in _ENDPOINT_SPECIFIC_STATUS
+
+
+@dataclass
+class Endpoint:
+    """端点池中的一个 (模型, APIKEY) 端点及其健康状态。"""
+
+    llm: BaseChatModel
+    name: str
+    weight: int = 1
+
+    #: 平滑加权轮询的当前权重
+    current_weight: int = 0
+    calls: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    #: 熔断截止时间 (time.monotonic)，在此之前不再分配请求
+    unhealthy_until: float = 0.0
+    #: 成功调用耗时的指数移动平均（秒）
+    latency_ewma: Optional[float] = None
+    in_flight: int = 0
+    last_error: Optional[str] = field(default=None, repr=False)
+
+    def healthy(self, now: float) -> bool:
+        return self.unhealthy_until <= now
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "weight": self.weight,
+            "healthy": self.healthy(now),
+            "calls": self.calls,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "in_flight": self.in_flight,
+            "last_error": self.last_error,
+        }
+
+
+class EndpointPoolChatModel(BaseChatModel):
+    """
+    把多个 (模型, APIKEY) 端点组合成一个聊天模型，可以直接替换 ChatSplitterAgent、ImageRecognitionAgent 中的模型。
+
+    - 加权轮询：按端点权重平滑分配请求（与 Nginx 的 smooth weighted round-robin 相同）。
+    - 健康检查：端点连续失败 failure_threshold 次后熔断 cooldown_seconds 秒，冷却结束后重新参与分配。
+    - 重试：调用失败时按带抖动的指数退避等待，并换一个端点重试，最多尝试 max_attempts 次。
+      上下文超长、400 等由请求本身导致的错误直接抛出，不重试，也不计入端点的健康统计。
+    - 对冲请求：设置 hedge_after_seconds 后，请求超过该时间未返回时向另一个端点发出相同请求，取先返回的结果。
+
+    池中的端点应为同一个模型或能力相近的模型，缓存与 Token 计数按 model_name（默认取第一个端点的模型名）计算。
+    """
+
+    model_name: str = ""
+    max_attempts: int = 3
+    failure_threshold: int = 3
+    cooldown_seconds: float = 30.0
+    backoff_base: float = 1.0
+    backoff_max: float = 20.0
+    hedge_after_seconds: Optional[float] = None
+    latency_alpha: float = 0.3
+
+    _endpoints: List[Endpoint] = PrivateAttr(default_factory=list)
+    _lock: Lock = PrivateAttr(default_factory=Lock)
+    _hedge_executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+
+    def __init__(self, endpoints: Sequence[Union[BaseChatModel, Endpoint]], weights: Sequence[int] = None, **kwargs):
+        """
+        :param endpoints: 端点模型列表，或已经构造好的 Endpoint 列表
+        :param weights: 各端点的权重，默认都为 1
+        :param kwargs: max_attempts、failure_threshold、cooldown_seconds、backoff_base、backoff_max、
+            hedge_after_seconds 等配置
+        """
+        if not endpoints:
+            raise ValueError("endpoints must not be empty.")
+        pool = []
+        for i, endpoint in enumerate(endpoints):
+            if not isinstance(endpoint, Endpoint):
+                model_name = getattr(endpoint, 'model_name', None) or getattr(endpoint, 'model', None)
+                endpoint = Endpoint(llm=endpoint, name=f"{i}:{model_name}",
+                                    weight=int(weights[i]) if weights else 1)
+            if endpoint.weight <= 0:
+                raise ValueError(f"端点 {endpoint.name} 的权重必须大于 0。")
+            pool.append(endpoint)
+        first_llm = pool[0].llm
+        kwargs.setdefault('model_name', getattr(first_llm, 'model_name', None) or getattr(first_llm, 'model', None) or "")
+        super().__init__(**kwargs)
+        self._endpoints = pool
+
+    @property
+    def _llm_type(self) -> str:
+        return "endpoint-pool"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        # 缓存键只与模型名相关，不同端点返回的结果可以互相复用
+        return {"model_name": self.model_name}
+
+    def _select(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        """按平滑加权轮询选择一个健康的端点，全部熔断时选择最早恢复的端点。"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self._endpoints
+                          if endpoint.healthy(now) and endpoint not in exclude]
+            if not candidates:
+                candidates = [endpoint for endpoint in self._endpoints if endpoint not in exclude] or self._endpoints
+                selected = min(candidates, key=lambda endpoint: endpoint.unhealthy_until)
+            else:
+                total = sum(endpoint.weight for endpoint in candidates)
+                for endpoint in candidates:
+                    endpoint.current_weight += endpoint.weight
+                selected = max(candidates, key=lambda endpoint: endpoint.current_weight)
+                selected.current_weight -= total
+            selected.in_flight += 1
+            return selected
+
+    def _record(self, endpoint: Endpoint, seconds: float, error: Optional[BaseException] = None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.calls += 1
+            if error is None:
+                endpoint.consecutive_failures = 0
+                endpoint.latency_ewma = seconds if endpoint.latency_ewma is None else \
+                    self.latency_alpha * seconds + (1 - self.latency_alpha) * endpoint.latency_ewma
+                return
+            endpoint.last_error = str(error)[:200]
+            if is_non_retryable_error(error):
+                # 请求本身的问题，与端点是否健康无关
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.unhealthy_until = time.monotonic() + self.cooldown_seconds
+                print(f"   端点 {endpoint.name} 连续失败 {endpoint.consecutive_failures} 次，熔断 {self.cooldown_seconds} 秒。")
+
+    def _call(self, endpoint: Endpoint, messages: List[BaseMessage], stop: Optional[List[str]],
+              run_manager: Optional[CallbackManagerForLLMRun], **kwargs: Any) -> ChatResult:
+        start = time.monotonic()
+        try:
+            # 通过 invoke 调用端点模型，端点自身的限流回调与缓存照常生效
+            message = endpoint.llm.invoke(messages, stop=stop, **kwargs)
+        except BaseException as e:
+            self._record(endpoint, time.monotonic() - start, e)
+            raise
+        self._record(endpoint, time.monotonic() - start)
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"endpoint": endpoint.name})
+
+    def _call_hedged(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                     run_manager: Optional[CallbackManagerForLLMRun], exclude: List[Endpoint], **kwargs: Any
+                     ) -> ChatResult:
+        """先向一个端点发出请求，超过 hedge_after_seconds 未返回时再向另一个端点发出相同请求，取先成功的结果。"""
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=max(16, 4 * len(self._endpoints)),
+                                                          thread_name_prefix="endpoint-hedge")
+            executor = self._hedge_executor
+        primary = self._select(exclude)
+        exclude.append(primary)
+        futures = {executor.submit(self._call, primary, messages, stop, run_manager, **kwargs): primary}
+        done, _ = wait(futures, timeout=self.hedge_after_seconds)
+        if not done and len(self._endpoints) > len(exclude):
+            hedge = self._select(exclude)
+            exclude.append(hedge)
+            print(f"   端点 {primary.name} 超过 {self.hedge_after_seconds} 秒未返回，向 {hedge.name} 发出对冲请求。")
+            futures[executor.submit(self._call, hedge, messages, stop, run_manager, **kwargs)] = hedge
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 较慢的请求继续在后台完成，结果只用于更新端点的健康统计
+                    return future.result()
+                error = future.exception()
+                if is_non_retryable_error(error):
+                    raise error
+        raise error
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tried: List[Endpoint] = []
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                # 带抖动的指数退避 (full jitter)
+                time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))))
+            # 所有端点都尝试过后，重新允许选择之前失败的端点
+            exclude = tried if len(tried) < len(self._endpoints) else []
+            try:
+                if self.hedge_after_seconds is not None and len(self._endpoints) > 1:
+                    hedge_exclude = list(exclude)
+                    result = self._call_hedged(messages, stop, run_manager, hedge_exclude, **kwargs)
+                    tried.extend(endpoint for endpoint in hedge_exclude if endpoint not in tried)
+                    return result
+                endpoint = self._select(exclude)
+                tried.append(endpoint)
+                return self._call(endpoint, messages, stop, run_manager, **kwargs)
+            except Exception as e:
+                if is_non_retryable_error(e):
+                    raise
+                last_error = e
+                print(f"   端点池第 {attempt + 1}/{self.max_attempts} 次调用失败：{e}")
+        raise last_error or NoHealthyEndpointError("端点池中没有可用的端点。")
+
+    def endpoint_stats(self) -> List[Dict[str, Any]]:
+        """各端点的调用次数、失败次数、平均耗时与健康状态。"""
+        with self._lock:
+            now = time.monotonic()
+            return [endpoint.stats(now) for endpoint in self._endpoints]
+
+
+def create_endpoint_pool(model_ids: Sequence[int], weights: Sequence[int] = None,
+                         llm_config_db: LLMConfigDatabase = None, **pool_kwargs) -> EndpointPoolChatModel:
+    """
+    根据 `LLMConfigDatabase` 中的模型配置创建端点池，每个端点都经过以其 apikey_id 为键的全局共享限流器。
+    重试与故障转移由端点池负责，端点模型自身不再重试，避免重试次数相乘。
+    :param model_ids: 模型ID列表，同一个模型名可以对应不同的APIKEY
+    :param weights: 各端点的权重
+    :param llm_config_db: 模型配置数据库
+    :param pool_kwargs: 传给 EndpointPoolChatModel 的配置
+    :return: EndpointPoolChatModel
+    """
+    llm_config_db = llm_config_db or LLMConfigDatabase()
+    endpoints = []
+    for i, model_id in enumerate(model_ids):
+        model_result = llm_config_db.get_model_by_id(model_id)
+        if not model_result:
+            raise ValueError(f"模型 {model_id} 不存在。")
+        _, _, model_name, base_url, apikey, _, apikey_id = model_result
+        if not apikey:
+            raise ValueError(f"模型 {model_id} 未配置apikey。")
+        endpoints.append(Endpoint(
+            llm=LLMFactory.llm(model_name, apikey=apikey, base_url=base_url, apikey_id=apikey_id, max_retries=0),
+            name=f"{model_id}:{model_name}",
+            weight=int(weights[i]) if weights else 1,
+        ))
+    return EndpointPoolChatModel(endpoints, **pool_kwargs)
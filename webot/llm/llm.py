@@ -1,11 +1,15 @@
 from os import getenv
+from typing import Union
 
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.caches import BaseCache
 from pydantic import SecretStr
 
+from webot.llm.llm_cache import get_llm_cache
 from webot.llm.llm_types import MissingApiKeyError
+from webot.llm.rate_limiter import RateLimitCallbackHandler, get_shared_rate_limiter
 
 load_dotenv()
 
@@ -13,7 +17,27 @@ load_dotenv()
 class LLMFactory:
 
     @staticmethod
-    def llm(model_name, apikey, base_url, *args, **kwargs):
+    def llm(model_name, apikey, base_url, *args, apikey_id: int = None, cache: Union[bool, BaseCache] = False,
+            **kwargs):
+        """
+        根据模型名称创建模型实例
+        :param model_name: 模型名称
+        :param apikey: APIKEY明文
+        :param base_url: 模型基础URL
+        :param apikey_id: APIKEY ID，传入后该模型的所有调用都会经过以 apikey_id 为键的全局共享限流器
+        :param cache: 为 True 时使用以 模型名@base_url 为命名空间的 SQLite 响应缓存，相同的消息与参数直接返回缓存结果；
+            也可以直接传入 BaseCache 实例。默认不缓存
+        :return: 模型实例
+        """
+        if cache is True:
+            kwargs['cache'] = get_llm_cache(model_name, base_url)
+        elif isinstance(cache, BaseCache):
+            kwargs['cache'] = cache
+
+        if apikey_id is not None:
+            kwargs['callbacks'] = [*(kwargs.get('callbacks') or []),
+                                   RateLimitCallbackHandler(get_shared_rate_limiter(apikey_id))]
+
         if "gemini" not in model_name:
             return ChatOpenAI(
                 model=model_name,
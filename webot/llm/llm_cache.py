@@ -0,0 +1,140 @@
+import json
+from hashlib import sha256
+from threading import Lock
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.messages import BaseMessage
+
+from webot.databases.llm_cache_database import LLMCacheDatabase
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    基于 `LLMCacheDatabase` 的 LLM 响应缓存，挂到模型的 `cache` 字段上即可生效。
+
+    LangChain 计算的 llm_string 只包含模型名与调用参数，不包含 base_url，
+    因此每个实例带一个命名空间（模型名@base_url），与 llm_string、消息一起哈希作为缓存键。
+    命中的结果会在 generation_info 中带上 from_cache=True，供限流回调退还额度。
+    """
+
+    # 每写入多少次执行一次淘汰
+    EVICT_EVERY = 100
+
+    def __init__(self, namespace: str, database: LLMCacheDatabase = None, ttl_seconds: float = 7 * 24 * 3600,
+                 max_size_bytes: int = 200 * 1024 * 1024):
+        """
+        :param namespace: 命名空间，通常是 模型名@base_url
+        :param database: 缓存数据库，默认使用进程内共享的实例
+        :param ttl_seconds: 过期秒数，为 None 时不过期
+        :param max_size_bytes: 缓存总大小上限
+        """
+        self.namespace = namespace
+        self._db = database or _get_cache_database()
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = Lock()
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return sha256("\x00".join([self.namespace, llm_string, prompt]).encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        return_val = self._db.get(self._key(prompt, llm_string), self.ttl_seconds)
+        with self._lock:
+            if return_val is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        generations = [loads(item) for item in json.loads(return_val)]
+        for generation in generations:
+            generation.generation_info = {**(generation.generation_info or {}), "from_cache": True}
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self._db.put(self._key(prompt, llm_string), self.namespace,
+                     json.dumps([dumps(generation) for generation in return_val], ensure_ascii=False))
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self.EVICT_EVERY == 0
+        if should_evict:
+            self._db.evict(self.ttl_seconds, self.max_size_bytes)
+
+    def clear(self, **kwargs: Any) -> None:
+        self._db.clear(self.namespace)
+
+    def contains(self, llm: BaseChatModel, messages: Sequence[BaseMessage]) -> bool:
+        """
+        判断以默认参数调用 `llm` 时，这组消息是否能命中缓存，不计入命中统计。
+        用于在调用前跳过限流等待，llm_string 的计算方式与 `BaseChatModel._generate_with_cache` 保持一致。
+        """
+        key = self._key(dumps(list(messages)), llm._get_llm_string())
+        return self._db.get(key, self.ttl_seconds) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """当前进程内的命中统计。"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_CACHE_DATABASE: Optional[LLMCacheDatabase] = None
+_LLM_CACHES: Dict[str, SQLiteLLMCache] = {}
+_LLM_CACHES_LOCK = Lock()
+
+
+def _get_cache_database() -> LLMCacheDatabase:
+    global _CACHE_DATABASE
+    with _LLM_CACHES_LOCK:
+        if _CACHE_DATABASE is None:
+            _CACHE_DATABASE = LLMCacheDatabase()
+        return _CACHE_DATABASE
+
+
+def get_llm_cache(model_name: str, base_url: str = None) -> SQLiteLLMCache:
+    """
+    获取进程内唯一的 `SQLiteLLMCache` 实例。
+    :param model_name: 模型名称
+    :param base_url: 模型基础URL
+    :return: SQLiteLLMCache
+    """
+    namespace = f"{model_name}@{base_url or ''}"
+    database = _get_cache_database()
+    with _LLM_CACHES_LOCK:
+        cache = _LLM_CACHES.get(namespace)
+        if cache is None:
+            cache = _LLM_CACHES[namespace] = SQLiteLLMCache(namespace, database=database)
+        return cache
+
+
+def get_llm_cache_for(llm: BaseChatModel) -> SQLiteLLMCache:
+    """
+    根据模型实例上的模型名与 base_url 获取缓存。
+    :param llm: 模型实例
+    :return: SQLiteLLMCache
+    """
+    model_name = getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or type(llm).__name__
+    base_url = getattr(llm, 'openai_api_base', None) or getattr(llm, 'base_url', None)
+    return get_llm_cache(model_name, base_url)
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    """
+    所有缓存命名空间的命中统计，以及缓存数据库的占用概况。
+    :return: {"caches": [{"namespace", "hits", "misses", "hit_rate"}, ...], "storage": {"entries", "size_bytes", "hits"}}
+    """
+    with _LLM_CACHES_LOCK:
+        caches = list(_LLM_CACHES.values())
+    result = [cache.stats() for cache in caches]
+    result.sort(key=lambda item: item["hits"] + item["misses"], reverse=True)
+    return {"caches": result, "storage": _get_cache_database().summary()}
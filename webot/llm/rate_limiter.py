@@ -0,0 +1,305 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from webot.databases.rate_limit_database import RateLimitDatabase
+
+# 中日韩字符大多数模型的分词器中约为 1 个 Token，其余字符按约 4 个字符 1 个 Token 估算。
+_CJK_PATTERN = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 Token 数，仅用于限流预算，不追求精确。
+    :param text: 需要估算的文本
+    :return: 估算的 Token 数
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+class TokenBucket:
+    """
+    进程内的令牌桶限流器，同时限制每分钟请求数 (RPM) 与每分钟 Token 数 (TPM)。
+    线程安全，可以被多个工作线程共享。limit 为 0 或 None 表示不限制该维度。
+    """
+
+    def __init__(self, rpm_limit: int = 0, tpm_limit: int = 0, burst: int = 1):
+        """
+        :param rpm_limit: 每分钟最大请求数
+        :param tpm_limit: 每分钟最大 Token 数
+        :param burst: 请求桶的容量，即允许同时放行的请求数，默认 1 表示严格按 60/rpm 秒的间隔放行
+        """
+        self.rpm_limit = rpm_limit or 0
+        self.tpm_limit = tpm_limit or 0
+        self._request_capacity = max(1, min(burst, self.rpm_limit)) if self.rpm_limit > 0 else 0
+        self._requests = float(self._request_capacity)
+        self._tokens = float(self.tpm_limit)
+        self._updated_at = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.rpm_limit > 0:
+            self._requests = min(self._request_capacity, self._requests + elapsed * self.rpm_limit / 60.0)
+        if self.tpm_limit > 0:
+            self._tokens = min(self.tpm_limit, self._tokens + elapsed * self.tpm_limit / 60.0)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        阻塞直到可以发起一次请求。
+        :param tokens: 本次请求预计消耗的 Token 数，超过 TPM 上限时按上限计算
+        :return: 本次等待的秒数
+        """
+        if self.tpm_limit > 0:
+            tokens = min(tokens, self.tpm_limit)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait_time = 0.0
+                if self.rpm_limit > 0 and self._requests < 1:
+                    wait_time = max(wait_time, (1 - self._requests) * 60.0 / self.rpm_limit)
+                if self.tpm_limit > 0 and self._tokens < tokens:
+                    wait_time = max(wait_time, (tokens - self._tokens) * 60.0 / self.tpm_limit)
+                if wait_time <= 0:
+                    if self.rpm_limit > 0:
+                        self._requests -= 1
+                    if self.tpm_limit > 0:
+                        self._tokens -= tokens
+                    return waited
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+class NullRateLimiter:
+    """
+    不限流，与 `TokenBucket` 提供相同的 `acquire` 接口。
+    模型本身已经通过 `RateLimitCallbackHandler` 经过共享限流器时使用，避免同一次调用被限流两次。
+    """
+
+    def acquire(self, tokens: int = 0) -> float:
+        return 0.0
+
+
+class SharedRateLimiter:
+    """
+    跨组件、跨进程共享的限流器，以 apikey_id 为键，状态保存在 `RateLimitDatabase` 中。
+    与 `TokenBucket` 提供相同的 `acquire` 接口，可以直接替换使用。
+    """
+
+    # 服务端返回 429 但没有给出 Retry-After 时的默认暂停秒数
+    DEFAULT_RETRY_AFTER = 10.0
+
+    def __init__(self, apikey_id: int, rpm_limit: int = None, tpm_limit: int = None,
+                 database: RateLimitDatabase = None):
+        """
+        :param apikey_id: APIKEY ID
+        :param rpm_limit: 每分钟最大请求数，为 None 时读取数据库中的预算配置
+        :param tpm_limit: 每分钟最大Token数，为 None 时读取数据库中的预算配置
+        :param database: 限流数据库，默认新建
+        """
+        self.apikey_id = apikey_id
+        self._db = database or RateLimitDatabase()
+        self._rpm_limit = rpm_limit
+        self._tpm_limit = tpm_limit
+
+    @property
+    def budget(self) -> tuple[int, int]:
+        """
+        当前生效的 (rpm_limit, tpm_limit)，每次读取数据库，修改预算后无需重启即可生效。
+        没有配置预算时不限制请求数与Token数，只遵守服务端返回的 Retry-After。
+        """
+        rpm_limit, tpm_limit = self._db.get_budget(self.apikey_id) or (0, 0)
+        if self._rpm_limit is not None:
+            rpm_limit = self._rpm_limit
+        if self._tpm_limit is not None:
+            tpm_limit = self._tpm_limit
+        return rpm_limit or 0, tpm_limit or 0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        阻塞直到可以发起一次请求。
+        :param tokens: 本次请求预计消耗的Token数
+        :return: 本次等待的秒数
+        """
+        waited, _ = self.acquire_event(tokens)
+        return waited
+
+    def acquire_event(self, tokens: int = 0) -> tuple[float, Optional[int]]:
+        """
+        与 `acquire` 相同，额外返回占用的事件ID，用于请求结束后修正实际Token数。
+        :param tokens: 本次请求预计消耗的Token数
+        :return: (等待的秒数, 事件ID)
+        """
+        rpm_limit, tpm_limit = self.budget
+        waited = 0.0
+        while True:
+            wait_time, event_id = self._db.try_acquire(self.apikey_id, tokens, rpm_limit, tpm_limit)
+            if wait_time <= 0:
+                return waited, event_id
+            # 其他进程可能先释放额度，因此最多睡眠 5 秒后重新检查
+            wait_time = min(wait_time, 5.0)
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def record_usage(self, event_id: Optional[int], tokens: int):
+        """用实际消耗的Token数修正预估值。"""
+        if event_id is not None and tokens:
+            self._db.update_event_tokens(event_id, tokens)
+
+    def release(self, event_id: Optional[int]):
+        """退还一次占用的额度，用于命中缓存、没有真正请求服务端的调用。"""
+        if event_id is not None:
+            self._db.delete_event(event_id)
+
+    def block_for(self, seconds: float):
+        """在接下来的 `seconds` 秒内暂停该APIKEY的所有请求。"""
+        self._db.block_until(self.apikey_id, time.time() + max(0.0, seconds))
+
+
+_SHARED_RATE_LIMITERS: Dict[int, SharedRateLimiter] = {}
+_SHARED_RATE_LIMITERS_LOCK = Lock()
+
+
+def get_shared_rate_limiter(apikey_id: int) -> SharedRateLimiter:
+    """
+    获取进程内唯一的 `SharedRateLimiter` 实例。
+    :param apikey_id: APIKEY ID
+    :return: SharedRateLimiter
+    """
+    with _SHARED_RATE_LIMITERS_LOCK:
+        limiter = _SHARED_RATE_LIMITERS.get(apikey_id)
+        if limiter is None:
+            limiter = _SHARED_RATE_LIMITERS[apikey_id] = SharedRateLimiter(apikey_id)
+        return limiter
+
+
+def attached_rate_limiters(llm: Any) -> List[SharedRateLimiter]:
+    """
+    模型回调中挂载的共享限流器，例如通过 `LLMFactory.llm(..., apikey_id=...)` 创建的模型。
+    :param llm: 模型实例
+    :return: 共享限流器列表，没有挂载时为空列表
+    """
+    callbacks = getattr(llm, 'callbacks', None)
+    handlers = getattr(callbacks, 'handlers', callbacks) or []
+    return [handler.limiter for handler in handlers if isinstance(handler, RateLimitCallbackHandler)]
+
+
+def parse_retry_after(error: BaseException) -> Optional[float]:
+    """
+    判断异常是否为限流错误 (HTTP 429)，并解析服务端返回的 Retry-After。
+    :param error: 调用模型时抛出的异常
+    :return: 需要暂停的秒数；不是限流错误时返回 None
+    """
+    response = getattr(error, 'response', None)
+    status_code = getattr(error, 'status_code', None) or getattr(response, 'status_code', None) or getattr(error, 'code', None)
+    if status_code != 429 and type(error).__name__ not in ('RateLimitError', 'ResourceExhausted'):
+        return None
+
+    headers = getattr(response, 'headers', None) or {}
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return SharedRateLimiter.DEFAULT_RETRY_AFTER
+
+
+# 为 True 时 RateLimitCallbackHandler 不占用额度，参考 `skip_rate_limit`
+_SKIP_RATE_LIMIT: ContextVar[bool] = ContextVar('webot_skip_rate_limit', default=False)
+
+
+@contextmanager
+def skip_rate_limit() -> Iterator[None]:
+    """
+    在此范围内（当前线程/上下文）发起的模型调用不经过 `RateLimitCallbackHandler`。
+    LangChain 在查询响应缓存之前触发 on_chat_model_start，回调自身无法预知是否命中缓存，
+    调用方已经确认会命中缓存时（例如 `SQLiteLLMCache.contains`）用它跳过限流等待。
+    """
+    token = _SKIP_RATE_LIMIT.set(True)
+    try:
+        yield
+    finally:
+        _SKIP_RATE_LIMIT.reset(token)
+
+
+def _messages_tokens(messages: List[List[BaseMessage]]) -> int:
+    tokens = 0
+    for message_list in messages:
+        for message in message_list:
+            content = message.content
+            if isinstance(content, list):
+                content = "".join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+            tokens += estimate_tokens(content)
+    return tokens
+
+
+class RateLimitCallbackHandler(BaseCallbackHandler):
+    """
+    将 `SharedRateLimiter` 挂到模型的回调上：调用前占用额度，结束后修正Token数，遇到 429 时按 Retry-After 暂停该APIKEY。
+    通过回调实现，因此 bind_tools、prompt | llm 等任意调用方式都会经过限流。命中响应缓存的调用会退还额度；
+    回调在查询缓存之前触发，已知会命中缓存的调用应放在 `skip_rate_limit` 中，避免等待。
+    """
+
+    def __init__(self, limiter: SharedRateLimiter):
+        self.limiter = limiter
+        self._events: Dict[UUID, Optional[int]] = {}
+        self._lock = Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID,
+                            **kwargs: Any) -> Any:
+        if _SKIP_RATE_LIMIT.get():
+            return
+        waited, event_id = self.limiter.acquire_event(_messages_tokens(messages))
+        if waited > 0:
+            print(f"APIKEY {self.limiter.apikey_id} 触发限流，等待 {waited:.2f} 秒。")
+        with self._lock:
+            self._events[run_id] = event_id
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self._lock:
+            event_id = self._events.pop(run_id, None)
+        if any((generation.generation_info or {}).get('from_cache')
+               for generations in response.generations for generation in generations):
+            self.limiter.release(event_id)
+            return
+        token_usage = (response.llm_output or {}).get('token_usage') or {}
+        tokens = token_usage.get('total_tokens') or 0
+        if not tokens:
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None) or {}
+                    tokens += usage.get('total_tokens', 0)
+        self.limiter.record_usage(event_id, tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self._lock:
+            self._events.pop(run_id, None)
+        retry_after = parse_retry_after(error)
+        if retry_after is not None:
+            print(f"APIKEY {self.limiter.apikey_id} 被服务端限流，{retry_after:.2f} 秒内暂停所有请求。")
+            self.limiter.block_for(retry_after)
@@ -0,0 +1,160 @@
+import re
+from typing import Dict, Optional, Tuple
+
+# 各模型的上下文窗口（Token），按模型名称的前缀匹配，越长的前缀越优先。
+MODEL_CONTEXT_LIMITS: Dict[str, int] = {
+    "deepseek-chat": 64000,
+    "deepseek-reasoner": 64000,
+    "deepseek-v3": 64000,
+    "deepseek-r1": 64000,
+    "glm-4-flash": 128000,
+    "glm-4-long": 1000000,
+    "glm-4": 128000,
+    "qwen2.5-14b-instruct-1m": 1000000,
+    "qwen-long": 1000000,
+    "qwen-plus": 131072,
+    "qwen-max": 32768,
+    "qwen-turbo": 1000000,
+    "doubao-1.5-pro-256k": 256000,
+    "doubao-1.5-pro-32k": 32000,
+    "doubao-pro-256k": 256000,
+    "doubao-pro-128k": 128000,
+    "doubao-pro-32k": 32000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "gemini-2.0-flash": 1048576,
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+}
+
+# 各模型分词器的估算参数：(每个中日韩字符的Token数, 每个Token对应的其他字符数)。
+# 数值来自对导出聊天记录抽样的实际计数，前缀匹配规则同 MODEL_CONTEXT_LIMITS。
+TOKEN_ESTIMATE_PROFILES: Dict[str, Tuple[float, float]] = {
+    "deepseek": (0.6, 3.6),
+    "glm": (0.7, 3.8),
+    "qwen": (0.7, 3.6),
+    "doubao": (0.65, 3.6),
+    "gpt-4o": (0.8, 4.0),
+    "gpt-4.1": (0.8, 4.0),
+    "gpt-4": (1.2, 4.0),
+    "gpt-3.5": (1.2, 4.0),
+    "gemini": (0.8, 4.0),
+}
+
+# 没有匹配的估算参数时使用的保守值，宁可高估也不要超出上下文窗口
+DEFAULT_ESTIMATE_PROFILE = (1.0, 3.5)
+
+_CJK_PATTERN = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+_CONTEXT_SUFFIX_PATTERN = re.compile(r'(\d+)([km])\b', re.IGNORECASE)
+
+
+def _match_prefix(model_name: str, table: Dict[str, object]):
+    model_name = (model_name or "").lower()
+    # 兼容 "deepseek-ai/DeepSeek-V3" 这类带组织前缀的模型名
+    model_name = model_name.rsplit('/', 1)[-1]
+    for prefix in sorted(table, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return table[prefix]
+    return None
+
+
+class TokenCounter:
+    """
+    Token 计数器的基类，`count` 返回文本在目标模型下的 Token 数。
+    """
+
+    #: 计数器名称，用于统计与日志
+    name = "base"
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class EstimateTokenCounter(TokenCounter):
+    """
+    按模型估算参数计数：中日韩字符按固定比例计算，其余字符按平均每 Token 的字符数计算。
+    """
+
+    def __init__(self, cjk_tokens_per_char: float, chars_per_token: float, name: str = "estimate"):
+        self.cjk_tokens_per_char = cjk_tokens_per_char
+        self.chars_per_token = chars_per_token
+        self.name = name
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cjk_count = len(_CJK_PATTERN.findall(text))
+        return int(cjk_count * self.cjk_tokens_per_char + (len(text) - cjk_count) / self.chars_per_token) + 1
+
+
+class TiktokenCounter(TokenCounter):
+    """
+    使用本地 BPE 分词器 tiktoken 精确计数，适用于 OpenAI 系列模型。
+    """
+
+    def __init__(self, encoding_name: str):
+        import tiktoken
+
+        self._encoding = tiktoken.get_encoding(encoding_name)
+        self.name = f"tiktoken:{encoding_name}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+_TIKTOKEN_ENCODINGS = {
+    "gpt-4o": "o200k_base",
+    "gpt-4.1": "o200k_base",
+    "gpt-4": "cl100k_base",
+    "gpt-3.5": "cl100k_base",
+}
+
+_COUNTERS: Dict[str, TokenCounter] = {}
+
+
+def get_token_counter(model_name: str) -> TokenCounter:
+    """
+    获取模型的 Token 计数器。优先使用本地可用的 BPE 分词器，未安装 tiktoken、分词器文件无法加载
+    （首次使用需要联网下载）或模型不适用时使用估算计数器。
+    :param model_name: 模型名称
+    :return: TokenCounter
+    """
+    key = (model_name or "").lower()
+    counter = _COUNTERS.get(key)
+    if counter is not None:
+        return counter
+
+    encoding_name = _match_prefix(key, _TIKTOKEN_ENCODINGS)
+    if encoding_name:
+        try:
+            counter = TiktokenCounter(encoding_name)
+        except Exception as e:
+            print(f"   加载 tiktoken 分词器 {encoding_name} 失败，改用估算计数：{e}")
+            counter = None
+    if counter is None:
+        profile = _match_prefix(key, TOKEN_ESTIMATE_PROFILES)
+        cjk_tokens_per_char, chars_per_token = profile or DEFAULT_ESTIMATE_PROFILE
+        counter = EstimateTokenCounter(cjk_tokens_per_char, chars_per_token,
+                                       name=f"estimate:{key or 'default'}" if profile else "estimate:default")
+    _COUNTERS[key] = counter
+    return counter
+
+
+def get_context_limit(model_name: str) -> Optional[int]:
+    """
+    获取模型的上下文窗口大小（Token）。
+    未登记的模型尝试从名称中的 32k、256k、1m 等后缀推断，仍无法确定时返回 None。
+    :param model_name: 模型名称
+    :return: 上下文窗口 Token 数
+    """
+    limit = _match_prefix(model_name, MODEL_CONTEXT_LIMITS)
+    if limit:
+        return limit
+    match = _CONTEXT_SUFFIX_PATTERN.search(model_name or "")
+    if match:
+        return int(match.group(1)) * (1000 if match.group(2).lower() == 'k' else 1000000)
+    return None
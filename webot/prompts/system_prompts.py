@@ -43,6 +43,22 @@ class SystemPrompts:
         """
         return SYSTEM_PROMPT_PATH.joinpath("chat_splitter_synthesis_prompt.md").read_text(encoding="utf-8")
 
+    @staticmethod
+    def chat_splitter_triage_prompt() -> str:
+        """
+        长聊天拆分的分块相关性初筛提示词
+        :return:
+        """
+        return SYSTEM_PROMPT_PATH.joinpath("chat_splitter_triage_prompt.md").read_text(encoding="utf-8")
+
+    @staticmethod
+    def conversation_summary_prompt() -> str:
+        """
+        AI 对话滚动摘要提示词
+        :return:
+        """
+        return SYSTEM_PROMPT_PATH.joinpath("conversation_summary_prompt.md").read_text(encoding="utf-8")
+
     @staticmethod
     def image_recognition_prompt() -> str:
         """
@@ -1,5 +1,6 @@
 from webot.services.service_type import Response, Request
 from webot.databases.conversation_database import ConversationsDatabase
+from webot.agent.checkpoint_store import CheckpointRetention
 from webot.bot.bot_storage import BotStorage
 
 from flask import Blueprint, request
@@ -20,6 +21,8 @@ class ServiceConversations(Blueprint):
              "view_func": self._conversations_list},
             {"rule": "/api/conversations/messages", "endpoint": "conversations_messages", "methods": ['POST'],
              "view_func": self._conversations_messages},
+            {"rule": "/api/conversations/message", "endpoint": "conversations_message", "methods": ['POST'],
+             "view_func": self._conversations_message},
             {"rule": "/api/conversations/messages/delete", "endpoint": "conversations_messages_delete",
              "methods": ['POST'],
              "view_func": self._conversations_messages_delete},
@@ -31,21 +34,60 @@ class ServiceConversations(Blueprint):
         ]
 
     def _conversations_list(self):
+        """
+        获取会话列表。传入 limit 时分页返回 {"items", "next_cursor", "has_more"}，
+        下一页传入上一页的 next_cursor；不传 limit 时返回全部会话的列表。
+        """
         body = Request(body=request.json, body_keys=['port'])
         response = Response(code=200, message='success', data=None)
         _bot = self._bot.get_bot(body.body.get('port'))
-        _conversations = ConversationsDatabase().get_conversation_by_user(_bot.get('info').get('wxid'))
+        wxid = _bot.get('info').get('wxid')
+        if body.body.get('limit'):
+            try:
+                response.data = ConversationsDatabase().get_conversations_page(
+                    wxid, limit=int(body.body.get('limit')), cursor=body.body.get('cursor'))
+            except ValueError as e:
+                return Response(code=400, message=str(e), data=None).json
+            return response.json
+        _conversations = ConversationsDatabase().get_conversation_by_user(wxid)
         response.data = _conversations
         return response.json
 
     def _conversations_messages(self):
+        """
+        获取会话消息。传入 limit 时从最新的消息开始分页，下一页传入上一页的 next_cursor；
+        同时传入 preview_chars 时大字段只返回预览，完整内容通过 /api/conversations/message 获取。
+        不传 limit 时返回全部消息的列表。
+        """
         body = Request(body=request.json, body_keys=['port', 'conversation_id'])
         response = Response(code=200, message='success', data=None)
         _bot = self._bot.get_bot(body.body.get('port'))
+        if body.body.get('limit'):
+            preview_chars = body.body.get('preview_chars')
+            try:
+                response.data = ConversationsDatabase().get_messages_page(
+                    body.body.get('conversation_id'),
+                    limit=int(body.body.get('limit')),
+                    cursor=body.body.get('cursor'),
+                    preview_chars=int(preview_chars) if preview_chars else None,
+                )
+            except ValueError as e:
+                return Response(code=400, message=str(e), data=None).json
+            return response.json
         _conversations = ConversationsDatabase().get_messages(body.body.get('conversation_id'))
         response.data = _conversations
         return response.json
 
+    def _conversations_message(self):
+        """获取单条消息的完整内容，配合分页的 preview_chars 按需加载。"""
+        body = Request(body=request.json, body_keys=['port', 'message_id'])
+        if not body.check_body:
+            return Response(code=400, message='body error', data=None).json
+        message = ConversationsDatabase().get_message(body.body.get('message_id'))
+        if message is None:
+            return Response(code=404, message='消息不存在', data=None).json
+        return Response(code=200, message='success', data=message).json
+
     def _conversations_messages_delete(self):
         body = Request(body=request.json, body_keys=['port', 'message_id'])
         response = Response(code=200, message='success', data=None)
@@ -56,6 +98,11 @@ class ServiceConversations(Blueprint):
         body = Request(body=request.json, body_keys=['port', 'conversation_id'])
         response = Response(code=200, message='success', data=None)
         ConversationsDatabase().delete_conversation(body.body.get('conversation_id'))
+        # 会话的 LangGraph 检查点以 conversation_id 为线程ID
+        try:
+            CheckpointRetention().delete_thread(body.body.get('conversation_id'))
+        except Exception as e:
+            print(f"删除会话 {body.body.get('conversation_id')} 的检查点失败：{e}")
         return response.json
 
     def _conversations_summary_update(self):
@@ -2,6 +2,8 @@ from typing import Union
 
 from webot.services.service_type import Response, Request
 from webot.databases.global_config_database import LLMConfigDatabase
+from webot.databases.rate_limit_database import RateLimitDatabase
+from webot.llm.llm_cache import llm_cache_stats
 
 from flask import Blueprint, request
 
@@ -11,6 +13,7 @@ class ServiceLLM(Blueprint):
     def __init__(self, name: str = 'llm', import_name=__name__, *args, **kwargs):
         super().__init__(name, import_name, *args, **kwargs)
         self._db: LLMConfigDatabase = LLMConfigDatabase()
+        self._rate_limit_db: RateLimitDatabase = RateLimitDatabase()
         for route in self._route_map:
             self.add_url_rule(**route)
 
@@ -33,6 +36,12 @@ class ServiceLLM(Blueprint):
              'endpoint': 'delete_apikey'},
             {'rule': '/api/apikey/update', 'view_func': self._update_apikey_desc, 'methods': ['POST'],
              'endpoint': 'update_apikey_desc'},
+            {'rule': '/api/apikey/<int:apikey_id>/rate_limit', 'view_func': self._get_apikey_rate_limit,
+             'methods': ['GET'], 'endpoint': 'get_apikey_rate_limit'},
+            {'rule': '/api/apikey/rate_limit/update', 'view_func': self._update_apikey_rate_limit,
+             'methods': ['POST'], 'endpoint': 'update_apikey_rate_limit'},
+            {'rule': '/api/llm/cache/stats', 'view_func': self._get_llm_cache_stats, 'methods': ['GET'],
+             'endpoint': 'get_llm_cache_stats'},
         ]
 
     def _add_model(self):
@@ -199,3 +208,42 @@ class ServiceLLM(Blueprint):
             _response.message = f'更新失败: {str(e)}'
 
         return _response.json
+
+    def _get_apikey_rate_limit(self, apikey_id: int):
+        """获取APIKEY的限流预算"""
+        _response = Response(code=200, message='success', data=None)
+        budget = self._rate_limit_db.get_budget(apikey_id)
+        _response.data = dict(zip(['rpm_limit', 'tpm_limit'], budget)) if budget else None
+        return _response.json
+
+    def _update_apikey_rate_limit(self):
+        """更新APIKEY的限流预算，所有使用该APIKEY的组件共享此预算"""
+        _request = Request(body=request.json, body_keys=['apikey_id'])
+        _response = Response(code=200, message='更新成功', data=None)
+
+        if not _request.check_body:
+            _response.code = 400
+            _response.message = '需要apikey_id参数'
+            return _response.json
+
+        try:
+            self._rate_limit_db.set_budget(
+                _request.body['apikey_id'],
+                rpm_limit=int(_request.body.get('rpm_limit') or 0),
+                tpm_limit=int(_request.body.get('tpm_limit') or 0)
+            )
+        except Exception as e:
+            _response.code = 500
+            _response.message = f'更新失败: {str(e)}'
+
+        return _response.json
+
+    def _get_llm_cache_stats(self):
+        """获取LLM响应缓存的命中统计与占用"""
+        _response = Response(code=200, message='success', data=None)
+        try:
+            _response.data = llm_cache_stats()
+        except Exception as e:
+            _response.code = 500
+            _response.message = f'查询失败: {str(e)}'
+        return _response.json
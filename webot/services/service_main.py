@@ -20,7 +20,13 @@ from webot.services.service_llm import ServiceLLM
 from webot.databases.conversation_database import ConversationsDatabase
 from webot.databases.global_config_database import LLMConfigDatabase
 from webot.agent.agent import WeBotAgent
+from webot.agent.chat_splitter_agent import ChatSplitterAgent
+from webot.agent.history_summarizer import HistorySummarizer, HistorySummaryScheduler
+from webot.agent.checkpoint_store import CheckpointCompactionScheduler
+from webot.llm.llm import LLMFactory
+from webot.llm.endpoint_pool import create_endpoint_pool
 from webot.bot.image_recognition import ImageRecognition
+from webot.bot.message_decoder import MESSAGE_DECODERS
 
 from flask import Flask, request, has_request_context, send_file, stream_with_context, Response as FlaskResponse, send_from_directory
 from flask_cors import CORS
@@ -42,6 +48,8 @@ class ServiceMain(Flask):
         self._event = Event()
         self._conversions_database = ConversationsDatabase()
         self._llm_config_database = LLMConfigDatabase()
+        self._history_summary_schedulers: Dict[int, HistorySummaryScheduler] = {}
+        self._checkpoint_compaction = CheckpointCompactionScheduler()
 
     def after_request(self, f):
         """
@@ -163,12 +171,8 @@ class ServiceMain(Flask):
             response.message = str(e)
             return response.json
 
-    # TODO: 需要增加聊天上下文 (优先级: 低)
-    #   - 目前聊天超出LLM API上下文会直接返回API错误信息，但是目前可通过前端开启新对话规避，所以优先级不高。
-    #   - 需要增加上下文摘要功能，达到阈值自动总结最前面的内容，缩短聊天。
-    #   - 摘要上下文和前端展示上下文隔离问题需要考虑，展示需要全量
-    #   - 需要考虑不同模型的上下文不同，并且用户自定义模型无法感知到上下文大小。
-    #   - 获取微信聊天记录场景也要考虑，获取一份长聊天之后插入在上下文超长了，但实际LLM上下文可能就三四条。单条消息极端长的场景
+    # 聊天上下文：完整消息保存在 ConversationMessages 中供前端展示，对话状态保存在检查点中，
+    # 发送给模型的消息由 ContextWindowManager 按模型的上下文窗口裁剪（滚动摘要、旧工具输出存根），见 webot/agent/context_window.py
     def _ai_stream(self):
         body = request.json
         port = body.get('port')
@@ -197,11 +201,7 @@ class ServiceMain(Flask):
             wechat_message_config=dumps({"model_id": model_id}),
             message_id=user_message_id
         )
-
-        all_messages = self._conversions_database.get_messages(conversation_id)
-        all_messages = [
-            {"role": "user" if _message.get('role') == 'user' else 'assistant', "content": _message.get('content')} for
-            _message in all_messages if _message.get('content')]
+        new_messages = [{"role": "user", "content": message}]
 
         def event_stream():
             # 初始化响应流
@@ -211,10 +211,20 @@ class ServiceMain(Flask):
                 agent = WeBotAgent(
                     model_name=model_name,
                     webot_port=port,
-                    llm_options={"apikey": apikey, "base_url": base_url},
+                    llm_options={"apikey": apikey, "base_url": base_url, "apikey_id": apikey_id},
                     username=_bot.info.get('name')
                 )
 
+                if agent.has_history(conversation_id):
+                    # 检查点中已有对话状态（包括工具调用与结果），只传入新的用户消息
+                    all_messages = new_messages
+                else:
+                    all_messages = self._conversions_database.get_messages(conversation_id)
+                    all_messages = [
+                        {"role": "user" if _message.get('role') == 'user' else 'assistant',
+                         "content": _message.get('content')}
+                        for _message in all_messages if _message.get('content')]
+
                 original_assistant_message = {
                     "role": "assistant",
                     "contant": "",
@@ -247,6 +257,74 @@ class ServiceMain(Flask):
                     wechat_message_config=dumps({"type": "error", "message": "后端出错"}),
                 )
                 yield f"""data: {dumps([{'role': 'assistant', 'content': format_err, 'wechat_message_config': '{"type": "error", "message": "后端出错"}'}])}\n\n"""
+            finally:
+                # 流式过程中的消息是异步写入的，结束前确保全部落库，前端随后拉取会话时能读到
+                self._conversions_database.flush()
+                yield "data: [DONE]\n\n"
+
+        return FlaskResponse(
+            stream_with_context(event_stream()),
+            mimetype="text/event-stream",
+            headers={'X-Accel-Buffering': 'no'}  # 禁用Nginx缓冲
+        )
+
+    def _chat_splitter_stream(self):
+        """
+        使用 ChatSplitterAgent 分析一段聊天记录，并以 SSE 实时推送进度事件与逐块提取结果。
+        传入 task_id 时恢复之前中断的任务；传入 conversation_id 时任务会持久化，断开连接后可以通过 task_id 恢复。
+        """
+        body = Request(body=request.json, body_keys=['port', 'model_id'])
+        if not body.check_body or not (body.body.get('task_id') or (body.body.get('wxid') and body.body.get('query'))):
+            return Response(code=400, message='参数缺失', data=None).json
+
+        model_result = self._llm_config_database.get_model_by_id(body.body.get('model_id'))
+        if not model_result:
+            return Response(code=400, message='模型不存在', data=None).json
+        model_id, model_format_name, model_name, base_url, apikey, description, apikey_id = model_result
+        if not apikey:
+            return Response(code=400, message='apikey不存在', data=None).json
+
+        _bot = self._bot.get_bot(body.body.get('port'))
+        if not _bot:
+            return Response(code=400, message='未找到对应端口的机器人', data=None).json
+        _bot = _bot.get('object')
+
+        def event_stream():
+            yield "data: [START]\n\n"
+            try:
+                llm = LLMFactory.llm(model_name, apikey=apikey, base_url=base_url, apikey_id=apikey_id)
+                # 传入 extraction_model_ids 时，分块提取使用由这些模型组成的端点池
+                extraction_model_ids = body.body.get('extraction_model_ids')
+                llm_extraction = create_endpoint_pool(
+                    extraction_model_ids, llm_config_db=self._llm_config_database,
+                    hedge_after_seconds=body.body.get('hedge_after_seconds'),
+                ) if extraction_model_ids else None
+                agent = ChatSplitterAgent(
+                    llm_query_understanding=llm,
+                    llm_extraction=llm_extraction,
+                    max_concurrency=max(4, len(extraction_model_ids or [])),
+                )
+                chat_data = None
+                if not body.body.get('task_id'):
+                    chat_data = _bot.export_message_file(
+                        wxid=body.body.get('wxid'),
+                        start_time=body.body.get('start_time'),
+                        end_time=body.body.get('end_time'),
+                        export_type=None,
+                        memory_query=body.body.get('query'),
+                        memory_max_bytes=body.body.get('memory_max_bytes', 4000),
+                    )
+                for event in agent.stream(
+                        chat_data,
+                        body.body.get('query'),
+                        conversation_id=body.body.get('conversation_id'),
+                        task_id=body.body.get('task_id'),
+                ):
+                    yield f"data: {dumps(event, ensure_ascii=False, default=str)}\n\n"
+            except GeneratorExit as ge:
+                raise ge
+            except Exception as e:
+                yield f"data: {dumps({'event': 'error', 'message': str(e)}, ensure_ascii=False)}\n\n"
             finally:
                 yield "data: [DONE]\n\n"
 
@@ -267,6 +345,7 @@ class ServiceMain(Flask):
         image_recognition = ImageRecognition(
             model_id=body.body.get('model_id'),
             port=body.body.get('port'),
+            model_ids=body.body.get('model_ids'),
         )
 
         def event_stream():
@@ -278,6 +357,7 @@ class ServiceMain(Flask):
                     end_time=body.body.get('end_time'),
                     duration=body.body.get('duration', 1),
                     only_failed=body.body.get('only_failed', False),
+                    max_concurrency=body.body.get('max_concurrency'),
                 )
 
                 for event in runner:
@@ -294,6 +374,67 @@ class ServiceMain(Flask):
             headers={'X-Accel-Buffering': 'no'}  # 禁用Nginx缓冲
         )
 
+    def _history_summary_start(self):
+        """
+        为指定端口的机器人启动后台历史摘要构建，定时为活跃的聊天对象增量生成按天、按周摘要。
+        """
+        body = Request(body=request.json, body_keys=['port', 'model_id'])
+        if not body.check_body:
+            return Response(code=400, message='参数缺失', data=None).json
+
+        model_result = self._llm_config_database.get_model_by_id(body.body.get('model_id'))
+        if not model_result:
+            return Response(code=400, message='模型不存在', data=None).json
+        model_id, model_format_name, model_name, base_url, apikey, description, apikey_id = model_result
+        if not apikey:
+            return Response(code=400, message='apikey不存在', data=None).json
+
+        port = body.body.get('port')
+        _bot = self._bot.get_bot(port)
+        if not _bot:
+            return Response(code=400, message='未找到对应端口的机器人', data=None).json
+
+        scheduler = self._history_summary_schedulers.get(port)
+        if scheduler is not None:
+            scheduler.stop()
+        llm = LLMFactory.llm(model_name, apikey=apikey, base_url=base_url, apikey_id=apikey_id)
+        scheduler = HistorySummaryScheduler(
+            HistorySummarizer(llm),
+            _bot.get('object'),
+            interval_seconds=body.body.get('interval_seconds', 3600),
+            active_days=body.body.get('active_days', 7),
+            lookback_days=body.body.get('lookback_days', 30),
+            min_messages=body.body.get('min_messages', 20),
+        )
+        self._history_summary_schedulers[port] = scheduler
+        scheduler.start()
+        return Response(code=200, message='success', data=scheduler.get_status()).json
+
+    def _history_summary_stop(self):
+        body = Request(body=request.json, body_keys=['port'])
+        if not body.check_body:
+            return Response(code=400, message='参数缺失', data=None).json
+        scheduler = self._history_summary_schedulers.pop(body.body.get('port'), None)
+        if scheduler is None:
+            return Response(code=400, message='该端口没有运行中的历史摘要任务', data=None).json
+        scheduler.stop()
+        return Response(code=200, message='success', data=None).json
+
+    def _history_summary_status(self):
+        data = {port: scheduler.get_status() for port, scheduler in self._history_summary_schedulers.items()}
+        return Response(code=200, message='success', data=data).json
+
+    def _checkpoint_compact(self):
+        """立即整理检查点数据库，返回删除的记录数与回收的字节数。"""
+        try:
+            report = self._checkpoint_compaction.run_once()
+        except Exception as e:
+            return Response(code=500, message=f'检查点数据库整理失败：{e}', data=None).json
+        return Response(code=200, message='success', data=report).json
+
+    def _checkpoint_status(self):
+        return Response(code=200, message='success', data=self._checkpoint_compaction.get_status()).json
+
     def _download_export_file(self, filename):
 
         if '..' in filename or filename.startswith('/'):
@@ -314,6 +455,13 @@ class ServiceMain(Flask):
         except Exception as e:
             return Response(code=400, message=str(e), data=None).json
 
+    def _decoder_stats(self):
+        """获取导出聊天记录时各类消息的解码统计，传入 reset=true 时在返回后清空统计。"""
+        response = Response(code=200, message='success', data=MESSAGE_DECODERS.stats())
+        if (request.args.get('reset') or '').lower() in ['1', 'true']:
+            MESSAGE_DECODERS.reset_stats()
+        return response.json
+
     def _create_conversation(self, body, _bot):
         """创建新对话记录"""
         if not body.get('conversation_id') or body.get('conversation_id') == '':
@@ -430,7 +578,8 @@ class ServiceMain(Flask):
             timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             visible=1,
             wechat_message_config=wechat_message_config,
-            message_id=message_id
+            message_id=message_id,
+            wait=False
         )
 
     @property
@@ -444,10 +593,24 @@ class ServiceMain(Flask):
             {"rule": "/api/bot/export_message_file", "endpoint": "export_message_file", "methods": ['POST'],
              "view_func": self._export_message_file},
             {"rule": "/api/ai/stream", "endpoint": "ai_stream", "methods": ['POST'], "view_func": self._ai_stream},
+            {"rule": "/api/ai/chat_splitter/stream", "endpoint": "chat_splitter_stream", "methods": ['POST'],
+             "view_func": self._chat_splitter_stream},
             {"rule": "/api/bot/image_recognition", "endpoint": "image_recognition", "methods": ['POST'],
              "view_func": self._image_recognition},
+            {"rule": "/api/ai/history_summary/start", "endpoint": "history_summary_start", "methods": ['POST'],
+             "view_func": self._history_summary_start},
+            {"rule": "/api/ai/history_summary/stop", "endpoint": "history_summary_stop", "methods": ['POST'],
+             "view_func": self._history_summary_stop},
+            {"rule": "/api/ai/history_summary/status", "endpoint": "history_summary_status", "methods": ['GET'],
+             "view_func": self._history_summary_status},
+            {"rule": "/api/ai/checkpoint/compact", "endpoint": "checkpoint_compact", "methods": ['POST'],
+             "view_func": self._checkpoint_compact},
+            {"rule": "/api/ai/checkpoint/status", "endpoint": "checkpoint_status", "methods": ['GET'],
+             "view_func": self._checkpoint_status},
             {"rule": "/api/bot/download_export_file/<filename>", "endpoint": "download_export_file", "methods": ['GET'],
-             "view_func": self._download_export_file}
+             "view_func": self._download_export_file},
+            {"rule": "/api/bot/decoder_stats", "endpoint": "decoder_stats", "methods": ['GET'],
+             "view_func": self._decoder_stats}
         ]
 
     @staticmethod
@@ -460,6 +623,7 @@ class ServiceMain(Flask):
             self.add_url_rule(**route)
         self.register_blueprint(ServiceConversations())
         self.register_blueprint(ServiceLLM())
+        self._checkpoint_compaction.start()
 
         threading.Thread(target=self.open_browser, args=(0.5, f"http://127.0.0.1:{port}")).start()
 
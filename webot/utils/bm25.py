@@ -0,0 +1,76 @@
+import math
+import re
+from collections import Counter
+from typing import Iterable, List, Union
+
+_CJK_RUN_PATTERN = re.compile(r'[㐀-䶿一-鿿]+')
+_WORD_PATTERN = re.compile(r'[a-z0-9_]+(?:[-.:@][a-z0-9_]+)*')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    面向中文聊天记录的轻量分词：连续的汉字切成二元组（单字保留为一元），英文、数字、wxid 与日期按整体切分。
+    不依赖分词词典，对人名、昵称等未登录词也能匹配。
+    :param text: 文本
+    :return: 词项列表
+    """
+    if not text:
+        return []
+    text = text.lower()
+    terms = _WORD_PATTERN.findall(text)
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _term_freqs(document: Union[str, Iterable[str]]) -> Counter:
+    if isinstance(document, str):
+        return Counter(tokenize(document))
+    term_freqs = Counter()
+    for part in document:
+        term_freqs.update(tokenize(part))
+    return term_freqs
+
+
+class BM25:
+    """
+    Okapi BM25 打分，文档在构造时一次性建立词频索引。
+    """
+
+    def __init__(self, documents: Iterable[Union[str, Iterable[str]]], k1: float = 1.5, b: float = 0.75):
+        """
+        :param documents: 文档列表，每个文档可以是字符串，也可以是按顺序组成该文档的多段文本（不需要先拼接）
+        :param k1: 词频饱和参数
+        :param b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self._term_freqs = [_term_freqs(document) for document in documents]
+        self._lengths = [sum(term_freqs.values()) for term_freqs in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_freqs = Counter()
+        for term_freqs in self._term_freqs:
+            document_freqs.update(term_freqs.keys())
+        total = len(self._term_freqs)
+        self._idf = {term: math.log(1 + (total - freq + 0.5) / (freq + 0.5)) for term, freq in document_freqs.items()}
+
+    def scores(self, query: str) -> List[float]:
+        """
+        计算查询对每个文档的得分。
+        :param query: 查询文本
+        :return: 与文档顺序一致的得分列表
+        """
+        query_terms = Counter(tokenize(query))
+        result = []
+        for term_freqs, length in zip(self._term_freqs, self._lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+            for term, query_count in query_terms.items():
+                freq = term_freqs.get(term)
+                if freq:
+                    score += query_count * self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            result.append(score)
+        return result
@@ -0,0 +1,99 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from webot.utils.bm25 import BM25
+
+_TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d')
+
+
+def format_memory_line(memory: Dict[str, Any]) -> str:
+    """记忆在 Prompt 中的单行格式。"""
+    return f"- {memory.get('type')}: {memory.get('content')}"
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    for time_format in _TIME_FORMATS:
+        try:
+            return datetime.strptime(str(value)[:19], time_format)
+        except ValueError:
+            continue
+    return None
+
+
+def rank_memories(memories: List[Dict[str, Any]], query: str = None, max_bytes: int = None, max_tokens: int = None,
+                  count_tokens: Callable[[str], int] = None, recency_weight: float = 0.3,
+                  half_life_days: float = 180, now: datetime = None,
+                  format_line: Callable[[Dict[str, Any]], str] = format_memory_line,
+                  encoding: str = 'utf-8') -> List[Dict[str, Any]]:
+    """
+    按与查询的相关度和时间远近给记忆排序，返回在预算内的前若干条。
+    得分 = (1 - recency_weight) * 归一化的 BM25 得分 + recency_weight * 0.5 ^ (距今天数 / half_life_days)，
+    时间优先取 event_time，没有时取 created_at。没有查询时只按时间排序。
+    按得分从高到低依次放入，放不下的跳过，继续尝试后面较短的记忆；一条都放不下时截断得分最高的一条。
+    :param memories: 记忆列表，包含 type、content，可选 event_time、created_at
+    :param query: 当前的查询
+    :param max_bytes: 格式化后的总字节数上限
+    :param max_tokens: 格式化后的总 Token 数上限，需要同时传入 count_tokens
+    :param count_tokens: Token 计数函数
+    :param recency_weight: 时间得分的权重，0 到 1
+    :param half_life_days: 时间得分的半衰期（天）
+    :param now: 当前时间，默认 datetime.now()
+    :param format_line: 单条记忆的格式化函数，预算按格式化后的文本计算
+    :param encoding: 计算字节数的编码
+    :return: 按得分从高到低排列的记忆，每条附带 score 字段
+    """
+    memories = [memory for memory in memories if memory.get('content')]
+    if not memories:
+        return []
+    now = now or datetime.now()
+
+    relevance = [0.0] * len(memories)
+    if query and query.strip():
+        scores = BM25([f"{memory.get('type') or ''} {memory.get('content')}" for memory in memories]).scores(query)
+        top = max(scores)
+        if top > 0:
+            relevance = [score / top for score in scores]
+    else:
+        recency_weight = 1.0
+
+    ranked = []
+    for memory, relevance_score in zip(memories, relevance):
+        memory_time = _parse_time(memory.get('event_time')) or _parse_time(memory.get('created_at'))
+        recency = 0.0
+        if memory_time is not None:
+            age_days = max(0.0, (now - memory_time).total_seconds() / 86400)
+            recency = 0.5 ** (age_days / half_life_days)
+        score = (1 - recency_weight) * relevance_score + recency_weight * recency
+        ranked.append({**memory, "score": round(score, 4)})
+    ranked.sort(key=lambda memory: memory["score"], reverse=True)
+
+    if max_bytes is None and (max_tokens is None or count_tokens is None):
+        return ranked
+
+    selected = []
+    used_bytes, used_tokens = 0, 0
+    for memory in ranked:
+        # 每行之后有一个换行符
+        line = format_line(memory) + "\n"
+        line_bytes = len(line.encode(encoding))
+        line_tokens = count_tokens(line) if max_tokens is not None and count_tokens else 0
+        if max_bytes is not None and used_bytes + line_bytes > max_bytes:
+            continue
+        if max_tokens is not None and count_tokens and used_tokens + line_tokens > max_tokens:
+            continue
+        selected.append(memory)
+        used_bytes += line_bytes
+        used_tokens += line_tokens
+
+    if not selected:
+        top = ranked[0]
+        limit = max_bytes if max_bytes is not None else max_tokens
+        content = str(top.get('content')).encode(encoding)[:max(0, limit - 64)].decode(encoding, errors='ignore')
+        selected.append({**top, "content": f"{content}[...已截断]"})
+    return selected